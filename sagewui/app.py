@@ -63,6 +63,11 @@ def create_app(notebook, startup_token=None, debug=False):
     def set_notebook_object():
         g.notebook = notebook
 
+    # Sample the resource usage of the worksheet processes
+    notebook.telemetry.start()
+    # Enforce the limits of the worksheet processes
+    notebook.watchdog.start()
+
     # Handles all uncaught exceptions if not debug activated
     @app.errorhandler(500)
     def log_exception(error):
@@ -99,6 +104,15 @@ def create_app(notebook, startup_token=None, debug=False):
     app.register_blueprint(worksheet)
     app.register_blueprint(worksheet_listing)
 
+    # Cell updates are pushed to the clients as server-sent events. Servers
+    # unable to stream responses must set this to False.
+    app.config['CELL_UPDATE_STREAM'] = True
+    # Each stream holds a request thread while the worksheet computes, so
+    # only a few of them are open at once. The other clients poll. Servers
+    # with a small pool of request threads must keep this a small fraction
+    # of it.
+    app.config['CELL_UPDATE_STREAM_MAX'] = 4
+
     # # Extensions
     # Open id
     oid.init_app(app)
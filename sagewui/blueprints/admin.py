@@ -18,6 +18,7 @@ from ..config import SAGE_VERSION
 from ..config import UN_ADMIN
 
 from ..util.auth import random_password
+from ..util.decorators import admin_or_token_required
 from ..util.decorators import admin_required
 from ..util.decorators import login_required
 from ..util.decorators import with_lock
@@ -293,6 +294,185 @@ def add_user_nui():
 # New UI end
 
 
+@admin.route('/kernels')
+@admin_required
+@with_lock
+def kernels():
+    template_dict = {}
+    template_dict['sage_version'] = SAGE_VERSION
+    template_dict['server_pool'] = g.notebook.server_pool_stats()
+    template_dict['capacity'] = g.notebook.conf['server_pool_capacity']
+    template_dict['budget'] = g.notebook.kernel_budget()
+    template_dict['watchdog'] = g.notebook.watchdog.stats()
+    template_dict['worksheet_usage'] = g.notebook.telemetry.by_worksheet()
+    template_dict['user_usage'] = g.notebook.telemetry.by_user()
+    template_dict['interact_usage'] = g.notebook.interact_state_stats()
+    template_dict['admin'] = g.notebook.user_manager[g.username].is_admin
+    template_dict['username'] = g.username
+    return render_template('html/settings/kernels.html', **template_dict)
+
+
+def prometheus_label(value):
+    return '"{}"'.format('{}'.format(value).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n'))
+
+
+def prometheus_metrics(metrics):
+    """
+    Return the Prometheus text exposition of ``metrics``, a list of
+    ``(name, type, help, samples)`` tuples where ``samples`` is a list of
+    ``(labels, value)`` pairs.
+    """
+    lines = []
+    for name, type, help, samples in metrics:
+        lines.append('# HELP sagewui_{} {}'.format(name, help))
+        lines.append('# TYPE sagewui_{} {}'.format(name, type))
+        for labels, value in samples:
+            if value is None:
+                continue
+            labels = ','.join('{}={}'.format(k, prometheus_label(v))
+                              for k, v in sorted(labels.items()))
+            lines.append('sagewui_{}{} {}'.format(
+                name, '{{{}}}'.format(labels) if labels else '', value))
+    return '\n'.join(lines) + '\n'
+
+
+KERNEL_METRICS = (
+    ('kernel_processes', 'processes', 'gauge',
+     'Processes in the worksheet process tree.'),
+    ('kernel_threads', 'threads', 'gauge',
+     'Threads in the worksheet process tree.'),
+    ('kernel_cpu_seconds_total', 'cpu_time', 'counter',
+     'CPU time used by the worksheet process tree.'),
+    ('kernel_rss_bytes', 'rss', 'gauge',
+     'Resident memory of the worksheet process tree.'),
+    ('kernel_pss_bytes', 'pss', 'gauge',
+     'Proportional set size of the worksheet process tree.'),
+    ('kernel_open_files', 'open_files', 'gauge',
+     'Open files of the worksheet process tree.'),
+    )
+
+
+def notebook_metrics():
+    """
+    Return the metrics of the notebook server (see
+    :func:`prometheus_metrics`).
+    """
+    usage = g.notebook.telemetry.by_worksheet()
+    metrics = [
+        (name, type, help,
+         [({'worksheet': u['worksheet'], 'user': u['owner']}, u[field])
+          for u in usage])
+        for name, field, type, help in KERNEL_METRICS]
+
+    budget = g.notebook.kernel_budget()
+    metrics.extend((
+        ('kernels_running', 'gauge',
+         'Running worksheet processes.',
+         [({}, budget['running'])]),
+        ('kernels_max', 'gauge',
+         'Maximum number of running worksheet processes (0 for no limit).',
+         [({}, budget['max_kernels'])]),
+        ('kernels_reclaimed_total', 'counter',
+         'Worksheet processes quit to keep the kernel budget.',
+         [({}, budget['reclaimed'])]),
+        ('host_memory_used_ratio', 'gauge',
+         'Fraction of the host memory in use.',
+         [({}, budget['memory_used'])]),
+        ))
+
+    watchdog = g.notebook.watchdog.stats()
+    metrics.extend((
+        ('kernels_killed_total', 'counter',
+         'Worksheet processes quit for exceeding a limit.',
+         [({'reason': reason}, n)
+          for reason, n in sorted(watchdog['killed'].items())]),
+        ('kernel_processes_reaped_total', 'counter',
+         'Processes killed after their worksheet process was quit or died.',
+         [({}, watchdog['reaped'])]),
+        ('kernels_orphaned_total', 'counter',
+         'Worksheet processes whose main process died.',
+         [({}, watchdog['orphaned'])]),
+        ))
+
+    interacts = g.notebook.interact_state_stats()
+    metrics.extend((
+        ('kernel_interact_cells', 'gauge',
+         'Interact cells whose state is kept by the worksheet process.',
+         [({'worksheet': i['worksheet'], 'user': i['owner']}, i['cells'])
+          for i in interacts]),
+        ('kernel_interact_bytes', 'gauge',
+         'Approximate size of the interact state of the worksheet process.',
+         [({'worksheet': i['worksheet'], 'user': i['owner']}, i['bytes'])
+          for i in interacts]),
+        ))
+
+    evaluations = g.notebook.evaluation_scheduler.stats()
+    metrics.extend((
+        ('worksheets_computing', 'gauge',
+         'Worksheets admitted to compute a cell.',
+         [({'user': user}, n)
+          for user, n in sorted(evaluations['running'].items())]),
+        ('worksheets_waiting', 'gauge',
+         'Worksheets waiting to be admitted to compute a cell.',
+         [({'user': user}, n)
+          for user, n in sorted(evaluations['waiting'].items())]),
+        ))
+
+    nodes = g.notebook.server_pool_stats()
+    metrics.extend((
+        ('server_pool_kernels', 'gauge',
+         'Worksheet processes running in a server pool node.',
+         [({'node': n['user_at_host']}, n['kernels']) for n in nodes]),
+        ('server_pool_failures_total', 'counter',
+         'Worksheet processes that failed to start in a server pool node.',
+         [({'node': n['user_at_host']}, n['failures']) for n in nodes]),
+        ('server_pool_up', 'gauge',
+         'Whether a server pool node is considered healthy.',
+         [({'node': n['user_at_host']}, int(n['healthy'])) for n in nodes]),
+        ))
+
+    pool = g.notebook.doc_pool.stats()
+    metrics.extend((
+        ('doc_worksheets', 'gauge',
+         'Live documentation worksheets, by state.',
+         [({'state': state}, pool[state])
+          for state in ('busy', 'idle', 'free')]),
+        ('doc_worksheet_checkouts_total', 'counter',
+         'Live documentation worksheets handed out.',
+         [({}, pool['checkouts'])]),
+        ('doc_kernels_reused_total', 'counter',
+         'Live documentation worksheets handed out with an idle process.',
+         [({}, pool['reused'])]),
+        ('doc_pool_exhausted_total', 'counter',
+         'Live documentation worksheets handed out by quitting a running '
+         'process.',
+         [({}, pool['exhausted'])]),
+        ('doc_pool_refused_total', 'counter',
+         'Live documentation pages refused because every worksheet of the '
+         'pool was in use.',
+         [({}, pool['refused'])]),
+        ))
+
+    docs = g.notebook.doc_cache.stats()
+    metrics.append(
+        ('doc_pages_total', 'counter',
+         'Live documentation pages opened, by where the processed page '
+         'was found.',
+         [({'cache': 'memory'}, docs['hits']),
+          ({'cache': 'disk'}, docs['disk_hits']),
+          ({'cache': 'none'}, docs['misses'])]))
+    return metrics
+
+
+@admin.route('/metrics')
+@admin_or_token_required('metrics_token')
+def metrics():
+    return current_app.response_class(
+        prometheus_metrics(notebook_metrics()),
+        mimetype='text/plain; version=0.0.4')
+
+
 @admin.route('/notebooksettings', methods=['GET', 'POST'])
 @admin_required
 @with_lock
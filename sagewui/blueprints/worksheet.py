@@ -15,7 +15,6 @@ import re
 import threading
 import time
 from cgi import escape
-from collections import defaultdict
 from functools import wraps
 
 from flask import Blueprint
@@ -25,18 +24,17 @@ from flask import request
 from flask import redirect
 from flask import g
 from flask import current_app
+from flask import stream_with_context
 from flask_babel import gettext
 from flask.helpers import send_file
 from flask.helpers import send_from_directory
 from jinja2.exceptions import TemplateNotFound
 from werkzeug.utils import secure_filename
 
-from ..config import INTERACT_UPDATE_PREFIX
 from ..config import UN_GUEST
 from ..config import UN_PUB
 from ..config import UN_SAGE
 from ..util import tmp_filename
-from ..util.docHTMLProcessor import SphinxHTMLProcessor
 # New UI
 from ..util.newui import extended_wst_basic
 # New UI end
@@ -47,11 +45,11 @@ from ..util.templates import render_template
 
 from ..util.decorators import guest_or_login_required
 from ..util.decorators import login_required
+from ..util.decorators import worksheet_locks
 
 _ = gettext
 
 worksheet = Blueprint('worksheet', __name__)
-worksheet_locks = defaultdict(threading.Lock)
 
 base_url = 'html/notebook/{}.html'
 
@@ -530,7 +528,9 @@ def html_plain_text_window(worksheet, username):
 def pub_worksheet(source):
     # TODO: Independent pub pool and server settings.
     nb = g.notebook
-    proxy = doc_worksheet()
+    proxy = nb.doc_pool.checkout()
+    if proxy is None:
+        return None
     proxy.name = source.name
     proxy.last_change = source.last_change
     proxy.worksheet_that_was_published = nb.came_from_wst(source)
@@ -583,6 +583,9 @@ def public_worksheet(id):
 
     if g.notebook.conf['pub_interact']:
         worksheet = pub_worksheet(original_worksheet)
+        if worksheet is None:
+            return message_template(
+                _("The server is busy. Please try again later."))
         owner = worksheet.owner
         worksheet.owner = UN_PUB
         s = render_ws_template(ws=worksheet, username=g.username)
@@ -617,10 +620,10 @@ def public_worksheet_cells(id, filename):
 
 
 published_commands_allowed = set([
-    'alive', 'cells', 'cell_update', 'data', 'download', 'edit_published_page',
-    'eval', 'quit_sage', 'rate', 'rating_info', 'new_cell_before',
-    'new_cell_after', 'introspect', 'delete_all_output', 'copy',
-    'restart_sage', 'jsmol'])
+    'alive', 'cells', 'cell_update', 'cell_update_stream', 'data',
+    'download', 'edit_published_page', 'eval', 'quit_sage', 'rate',
+    'rating_info', 'new_cell_before', 'new_cell_after', 'introspect',
+    'delete_all_output', 'copy', 'restart_sage', 'jsmol'])
 
 readonly_commands_allowed = set([
     'alive', 'cells', 'data', 'datafile', 'download', 'quit_sage',
@@ -973,22 +976,20 @@ def worksheet_eval(worksheet):
         input_text = request.values.get(
             'input', '').replace('\r\n', '\n')  # DOS
 
-    # Handle an updated / recomputed interact.  TODO: JSON encode
-    # the update data.
+    # Handle an updated / recomputed interact.  Updates are coalesced by
+    # the worksheet.  TODO: JSON encode the update data.
     if 'interact' in request.values:
         r['interact'] = 1
-        input_text = INTERACT_UPDATE_PREFIX
-        variable = request.values.get('variable', '')
-        if variable != '':
-            adapt_number = int(request.values.get('adapt_number', -1))
-            value = request.values.get('value', '')
-            input_text += (
-                "\n_interact_.update('%s', '%s', "
-                "%s, _support_.base64.standard_b64decode('%s'), globals())" % (
-                    id, variable, adapt_number, value))
-
-        if int(request.values.get('recompute', 0)):
-            input_text += "\n_interact_.recompute('%s')" % id
+        worksheet.update_interact(
+            cell,
+            variable=request.values.get('variable', ''),
+            adapt_number=int(request.values.get('adapt_number', -1)),
+            value=request.values.get('value', ''),
+            recompute=bool(int(request.values.get('recompute', 0))),
+            username=g.username)
+        r['next_id'] = worksheet.next_compute_id(cell)
+        g.notebook.updater.update()
+        return encode_response(r)
 
     cell.input = input_text
 
@@ -1017,14 +1018,17 @@ def worksheet_eval(worksheet):
     return encode_response(r)
 
 
-@worksheet_command('cell_update')
-def worksheet_cell_update(worksheet):
+def cell_update_response(worksheet, id):
+    """
+    Returns the data reported to the client about the cell with the given
+    id.
 
+    This is the JSON object sent by the ``cell_update`` command and pushed
+    by the ``cell_update_stream`` command.  When the cell is done, its
+    output is added to the user's history.
+    """
     r = {}
-    r['id'] = id = get_cell_id()
-
-    # update the computation one "step".
-    worksheet.check_comp()
+    r['id'] = id
 
     # now get latest status on our cell
     r['status'], cell = worksheet.check_cell(id)
@@ -1057,6 +1061,23 @@ def worksheet_cell_update(worksheet):
     r['output_wrapped'] = cell.output_text(g.notebook.conf['word_wrap_cols'],
                                            html=True) + ' '
     r['introspect_html'] = cell.introspect_html
+    # Position of the worksheet in the queue of worksheets waiting for
+    # the server to let them compute, or None.
+    r['queue_position'] = (worksheet.queue_position if r['status'] == 'w'
+                           else None)
+    # Progress of the last interrupt of the worksheet (see
+    # Worksheet.interrupt_status)
+    r['interrupt_status'] = worksheet.interrupt_status
+
+    return r
+
+
+@worksheet_command('cell_update')
+def worksheet_cell_update(worksheet):
+    # update the computation one "step".
+    worksheet.check_comp()
+
+    r = cell_update_response(worksheet, get_cell_id())
 
     # Compute 'em, if we got 'em.
     worksheet.start_next_comp()
@@ -1064,6 +1085,114 @@ def worksheet_cell_update(worksheet):
     return encode_response(r)
 
 
+# Seconds between two computation steps of a cell update stream, seconds
+# after which an idle stream sends a keep-alive comment and seconds after
+# which the stream is closed (the client then reconnects).
+CELL_UPDATE_STREAM_DELTA = 0.25
+CELL_UPDATE_STREAM_KEEPALIVE = 15
+CELL_UPDATE_STREAM_TIMEOUT = 300
+
+# Number of cell update streams open now. Each one holds a request thread.
+cell_update_streams = [0]
+cell_update_streams_lock = threading.Lock()
+
+
+@worksheet_command('cell_update_stream', methods=['GET'])
+def worksheet_cell_update_stream(worksheet):
+    """
+    Pushes cell updates of a worksheet as server-sent events.
+
+    Each event carries the same JSON object as the ``cell_update``
+    command.  Events are sent for every cell in the evaluation queue
+    whenever its output changes and once when it is done.  A final event
+    with status ``'e'`` is sent when the queue is empty, and then the
+    stream ends.
+
+    The ``ids`` request value is an optional comma separated list of the
+    cells the client is waiting for, so that cells finished before the
+    stream was opened are reported too.
+
+    Servers that can not stream responses (``CELL_UPDATE_STREAM`` set to
+    False in the application config), or that already have
+    ``CELL_UPDATE_STREAM_MAX`` streams open, answer with 204 No Content,
+    which makes the client fall back to polling ``cell_update``.
+    """
+    if not current_app.config.get('CELL_UPDATE_STREAM', True):
+        return current_app.response_class(status=204)
+    with cell_update_streams_lock:
+        if (cell_update_streams[0] >=
+                current_app.config.get('CELL_UPDATE_STREAM_MAX', 4)):
+            return current_app.response_class(status=204)
+        cell_update_streams[0] += 1
+
+    def close_stream():
+        with cell_update_streams_lock:
+            cell_update_streams[0] -= 1
+
+    pending = []
+    for id in request.values.get('ids', '').split(','):
+        if id:
+            try:
+                pending.append(int(id))
+            except ValueError:
+                pending.append(id)
+
+    lock = worksheet_locks[worksheet.filename]
+
+    def events():
+        sent = {}
+        start = last_event = time.time()
+        while time.time() - start < CELL_UPDATE_STREAM_TIMEOUT:
+            data = []
+            with lock:
+                worksheet.check_comp()
+                queue = worksheet.queue_id_list
+                pending.extend(id for id in queue if id not in pending)
+                if not pending:
+                    data.append(encode_response({'status': 'e'}))
+                for id in list(pending):
+                    status, cell = worksheet.check_cell(id)
+                    if status == 'w':
+                        # Only the head of the queue produces output.
+                        # Other cells are queued or their files are
+                        # being harvested.
+                        if id not in queue[:1]:
+                            continue
+                        key = (cell.output_text(raw=True),
+                               cell.introspect_html,
+                               worksheet.queue_position,
+                               worksheet.interrupt_status)
+                        if sent.get(id) == key:
+                            continue
+                        sent[id] = key
+                    else:
+                        pending.remove(id)
+                        sent.pop(id, None)
+                    data.append(encode_response(
+                        cell_update_response(worksheet, id)))
+                worksheet.start_next_comp()
+
+            for d in data:
+                yield 'data: {}\n\n'.format(d)
+            if not pending:
+                return
+
+            if data:
+                last_event = time.time()
+            elif time.time() - last_event > CELL_UPDATE_STREAM_KEEPALIVE:
+                last_event = time.time()
+                yield ': keep-alive\n\n'
+            time.sleep(CELL_UPDATE_STREAM_DELTA)
+
+    response = current_app.response_class(
+        stream_with_context(events()), mimetype='text/event-stream')
+    # The server closes the response also if the client goes away.
+    response.call_on_close(close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 ########################################################
 # Cell introspection
 ########################################################
@@ -1616,9 +1745,9 @@ def worksheet_quit_sage(worksheet):
 
 @worksheet_command('interrupt')
 def worksheet_interrupt(worksheet):
-    # XXX: TODO -- this must not block long (!)
-    worksheet.sage().interrupt()
-    return 'failed' if worksheet.sage().is_computing() else 'success'
+    # The interrupt is confirmed by the cell updates (see
+    # Worksheet.interrupt)
+    return 'success' if worksheet.interrupt() else 'pending'
 
 
 @worksheet_command('delete_all_output')
@@ -1641,39 +1770,6 @@ def worksheet_print(worksheet):
 #######################################################
 # Live "docbrowser" worksheets from HTML documentation
 #######################################################
-doc_worksheet_number = -1
-
-
-def doc_worksheet():
-    global doc_worksheet_number
-    doc_worksheet_number = doc_worksheet_number % g.notebook.conf[
-        'doc_pool_size']
-    W = None
-    for X in g.notebook.user_wsts(UN_SAGE):
-        if X.compute_process_has_been_started():
-            continue
-        if X.id_number == doc_worksheet_number:
-            W = X
-            W.clear()
-            break
-
-    if W is None:
-        # The first argument here is the worksheet's title, which the
-        # caller should set with W.set_name.
-        W = g.notebook.create_wst('', UN_SAGE)
-    return W
-
-
-def extract_title(html_page):
-    # XXX: This might be better as a regex
-    h = html_page.lower()
-    i = h.find('<title>')
-    if i == -1:
-        return gettext("Untitled")
-    j = h.find('</title>')
-    return html_page[i + len('<title>'): j]
-
-
 @login_required
 def worksheet_file(path):
     # Create a live Sage worksheet from the given path.
@@ -1681,18 +1777,26 @@ def worksheet_file(path):
         return message_template(_('Document does not exist.'),
                                 username=g.username)
 
-    doc_page_html = open(path).read()
-    doc_page = SphinxHTMLProcessor().process_doc_html(doc_page_html)
-
-    title = (extract_title(doc_page_html).replace('&mdash;', '--') or
-             'Live Sage Documentation')
+    # The page is processed once, while it is not modified (see
+    # sagewui.util.doc_cache).
+    title, doc_page = g.notebook.doc_cache.get(path)
+    if title is None:
+        title = gettext("Untitled")
+    title = title.replace('&mdash;', '--') or 'Live Sage Documentation'
 
-    W = doc_worksheet()
+    W = g.notebook.doc_pool.checkout()
+    if W is None:
+        return message_template(
+            _("The server is busy. Please try again later."),
+            username=g.username)
     W.edit_save(doc_page)
     W.system = 'sage'
     W.name = title
     W.save()
-    W.quit()
+    if not W.compute_process_has_been_started():
+        # The process of W is running if it is reused (see
+        # sagewui.gui.doc_pool).
+        W.quit()
 
     # FIXME: For some reason, an extra cell gets added so we
     # remove it here.
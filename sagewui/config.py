@@ -12,6 +12,8 @@ from appdirs import user_data_dir
 from flask_babel import lazy_gettext
 from pexpect.exceptions import ExceptionPexpect
 
+from .sage_server.output import MAX_OUTPUT
+from .sage_server.output import MAX_OUTPUT_LINES
 from .sage_server.workers import sage
 from .util import sage_browser
 
@@ -24,6 +26,8 @@ try:
     sage_conf = sage()
 except ExceptionPexpect:
     raise OSError('Install sage and ensure that "sage" is in system PATH')
+# The whole output is read back below.
+sage_conf.max_output = None
 
 sage_conf.execute('\n'.join((
     'from sage.env import SAGE_ENV',
@@ -62,6 +66,7 @@ BASE_PATH = user_data_dir(APP_NAME)
 DB_PATH = os.path.join(BASE_PATH, 'db')
 SSL_PATH = os.path.join(BASE_PATH, 'ssl')
 PID_PATH = os.path.join(BASE_PATH, 'run')
+DOC_CACHE_PATH = os.path.join(BASE_PATH, 'doc_cache')
 HOME_PATH = BASE_PATH
 PID_FILE_TEMPLATE = 'sagewui-{}.pid'
 
@@ -152,15 +157,7 @@ SYSTEMS = (('sage', False),
 
 
 # Cell output control
-# Maximum number of characters allowed in output.  This is needed
-# avoid overloading web browser.  For example, it should be possible
-# to gracefully survive:
-#    while True:
-#       print("hello world")
-# On the other hand, we don't want to loose the output of big matrices
-# and numbers, so don't make this too small.
-MAX_OUTPUT = 32000
-MAX_OUTPUT_LINES = 120
+# MAX_OUTPUT and MAX_OUTPUT_LINES are defined in sage_server.output.
 # Used to detect and format tracebacks.
 # See :func:`.util.text.format_exception`.
 TRACEBACK = 'Traceback (most recent call last):'
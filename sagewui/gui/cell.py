@@ -36,6 +36,9 @@ from ..config import INTERACT_HTML
 from ..config import MAX_OUTPUT
 from ..config import MAX_OUTPUT_LINES
 from ..config import TRACEBACK
+from ..sage_server.output import output_head
+from ..sage_server.output import output_tail
+from ..sage_server.output import truncated_output
 from ..util import cached_property
 from ..util import set_restrictive_permissions
 from ..util import word_wrap
@@ -47,6 +50,7 @@ from ..util.text import format_exception
 # we don't get several of these combined in one.
 re_cell = re.compile('"cell://.*?"')
 re_cell_2 = re.compile("'cell://.*?'")   # same, but with single quotes
+re_cell_any = re.compile('"cell://.*?"|\'cell://.*?\'')  # both
 # Matches script blocks.
 re_script = re.compile(r'<script[^>]*?>.*?</script>', re.DOTALL | re.I)
 prompt_re = re.compile(r'^\s*(sage:|>>>|\.\.\.)', re.DOTALL | re.UNICODE)
@@ -496,6 +500,8 @@ class ComputeCell(Cell):
         # self.introspect = False
         self.__introspect = False
         self.__introspect_html = ''  # property
+        # (version, {arguments: text}); see output_text and edit_text
+        self.__rendered = (None, {})
 
         # Data model
         self.__input = input  # property
@@ -653,6 +659,7 @@ class ComputeCell(Cell):
         """
         self.__changed_input = value
         self.__input = self.__changed_input
+        self.__rendered = (None, {})
 
     @changed_input.deleter
     def changed_input(self):
@@ -803,6 +810,28 @@ class ComputeCell(Cell):
             sage: C.output_text(raw=True)
             '\u011b\u0161\u010d\u0159\u017e\xfd\xe1\xed\xe9\u010f\u010e'
         """
+        # The output is rendered again only after it or the version of the
+        # cell change, not every time the cell is polled.
+        return self._memoized(
+            (ncols, html, raw, allow_interact),
+            lambda: self._render_output_text(ncols, html, raw, allow_interact))
+
+    def _memoized(self, key, render):
+        # The texts rendered from the input and the output are kept until
+        # any of them or the version of the cell change.
+        version, rendered = self.__rendered
+        if version != self.version:
+            rendered = {}
+            self.__rendered = (self.version, rendered)
+        try:
+            return rendered[key]
+        except KeyError:
+            pass
+        s = render()
+        rendered[key] = s
+        return s
+
+    def _render_output_text(self, ncols, html, raw, allow_interact):
         if allow_interact and self.__interact_output is not None:
             # Get the input template
             z = self.output_text(ncols, html, raw, allow_interact=False)
@@ -866,8 +895,7 @@ class ComputeCell(Cell):
             sage: len(C.plain_text)
             12
         """
-        output = output
-        html = html
+        self.__rendered = (None, {})
         if output.count(INTERACT_TEXT) > 1:
             html = ('<h3><font color="red">WARNING: multiple @interacts in '
                     'one cell disabled (not yet implemented).</font></h3>')
@@ -895,22 +923,17 @@ class ComputeCell(Cell):
             'Output truncated!' not in output and
             (len(output) > MAX_OUTPUT or
              output.count('\n') > MAX_OUTPUT_LINES)):
-            url = ""
+            url = None
             if not self.computing:
                 file = os.path.join(self.directory(), "full_output.txt")
                 open(file, "w").write(output)
-                url = ("<a target='_new' href='%s/full_output.txt' "
-                       "class='file_link'>full_output.txt</a>" % (
-                           self.url_to_self()))
-                html += "<br>" + url
-            lines = output.splitlines()
-            start = '\n'.join(lines[:MAX_OUTPUT_LINES // 2])[:MAX_OUTPUT // 2]
-            end = '\n'.join(lines[-MAX_OUTPUT_LINES // 2:])[-MAX_OUTPUT // 2:]
-            warning = 'WARNING: Output truncated!  '
-            if url:
-                # make the link to the full output appear at the top too.
-                warning += '\n<html>%s</html>\n' % url
-            output = warning + '\n\n' + start + '\n\n...\n\n' + end
+                url = '%s/full_output.txt' % self.url_to_self()
+                html += ("<br><a target='_new' href='%s' "
+                         "class='file_link'>full_output.txt</a>" % url)
+            # The link to the full output appears at the top too.
+            output = truncated_output(
+                output_head(output, MAX_OUTPUT, MAX_OUTPUT_LINES),
+                output_tail(output, MAX_OUTPUT, MAX_OUTPUT_LINES), url)
         self.__output = output
         if not self.is_interactive_cell():
             self._out_html = html
@@ -956,10 +979,11 @@ class ComputeCell(Cell):
         """
         self.__output = ''
         self._out_html = ''
+        self.__rendered = (None, {})
         self.evaluated = False
         self.delete_files()
 
-    def update_html_output(self, output=''):
+    def update_html_output(self, output='', defer=False):
         """
         Updates this compute cell's the file list with HTML-style
         links or embeddings.
@@ -973,6 +997,9 @@ class ComputeCell(Cell):
 
         - ``output`` - a string (default: ''); the new output
 
+        - ``defer`` - a boolean (default: False); whether to wait until
+          the HTML output is needed (see :meth:`output_html`)
+
         EXAMPLES::
 
             sage: nb = sagenb.notebook.notebook.Notebook(
@@ -997,7 +1024,10 @@ class ComputeCell(Cell):
             sage: W.quit()
             sage: nb.delete()
         """
-        if self.is_interactive_cell():
+        if defer:
+            self._out_html = None
+            self.__html_output = output
+        elif self.is_interactive_cell():
             self._out_html = ""
         else:
             self._out_html = self.files_html(output)
@@ -1129,7 +1159,12 @@ class ComputeCell(Cell):
             '\u010e\n///\n\u011b\u0161\u010d\u0159\u017e\xfd\xe1\xed\xe9'
             '\u010f\u010e\n}}}'
         """
-        return self.format_text(plain=False)
+        # Kept, since the body of the worksheet is made of the edit texts
+        # of all its cells every time it is saved.
+        ncols = self.word_wrap_cols
+        return self._memoized(('edit_text', ncols),
+                              lambda: self.format_text(plain=False,
+                                                       ncols=ncols))
 
     def interrupt(self):
         """
@@ -1177,6 +1212,18 @@ class ComputeCell(Cell):
         """
         return self in self.worksheet().queue
 
+    @property
+    def interact_update(self):
+        """
+        Returns whether the last input of this compute cell is an update
+        of its interact controls instead of its code.
+
+        OUTPUT:
+
+        - a boolean
+        """
+        return self.__interact_input is not None
+
     def is_interactive_cell(self):
         r"""
         Returns whether this compute cell contains
@@ -1281,6 +1328,8 @@ class ComputeCell(Cell):
             '<strong>5</strong>'
         """
         try:
+            if self._out_html is None:
+                self.update_html_output(self.__html_output)
             return self._out_html
         except AttributeError:
             self._out_html = ''
@@ -1313,9 +1362,8 @@ class ComputeCell(Cell):
         """
         end = '?%d' % self.version
         begin = self.url_to_self()
-        for s in re_cell.findall(urls) + re_cell_2.findall(urls):
-            urls = urls.replace(s, begin + s[7:-1] + end)
-        return urls
+        return re_cell_any.sub(
+            lambda m: begin + m.group()[7:-1] + end, urls)
 
     def parse_html(self, s, ncols, pre_wrapping):
         r"""
@@ -1368,21 +1416,23 @@ class ComputeCell(Cell):
             s = format_exception(format_html(s), ncols)
 
         # Everything not wrapped in <html> ... </html> should be
-        # escaped and word wrapped.
-        t = ''
-
-        while len(s) > 0:
-            i = s.find('<html>')
+        # escaped and word wrapped. The pieces are joined at the end, and s
+        # is not sliced, so that large output takes linear time.
+        t = []
+        p = 0
+        while p < len(s):
+            i = s.find('<html>', p)
             if i == -1:
-                t += format(s)
+                t.append(format(s[p:]))
                 break
-            j = s.find('</html>')
+            j = s.find('</html>', p)
             if j == -1:
-                t += format(s[:i])
+                t.append(format(s[p:i]))
                 break
-            t += format(s[:i]) + format_html(s[i + 6:j])
-            s = s[j + 7:]
-        t = t.replace('</html>', '')
+            t.append(format(s[p:i]))
+            t.append(format_html(s[i + 6:j]))
+            p = j + 7
+        t = ''.join(t).replace('</html>', '')
 
         # Get rid of the <script> tags, since we do not want them to
         # be evaluated twice.  They are only evaluated in the wrapped
@@ -0,0 +1,190 @@
+"""
+Pool of live documentation worksheets
+
+The pages of the documentation are opened as worksheets of the ``_sage_``
+user.  A fixed number of them (the ``doc_pool_size`` notebook option) are
+reused, in this order:
+
+- worksheets whose process has been idle for the ``doc_timeout`` and was
+  kept running to be reused, with its variables removed (at most
+  ``doc_idle_kernels``);
+
+- worksheets whose process was quit;
+
+- new worksheets, while there are less than ``doc_pool_size``;
+
+- the least recently opened worksheet without a running process or, if
+  all of them have one (the pool is exhausted), the least recently opened
+  one not opened nor evaluated for the ``doc_timeout``, whose process is
+  quit.  If every worksheet has been used since then, the pool is busy
+  and no worksheet is handed out.
+
+AUTHORS:
+
+  - J Miguel Farto
+"""
+
+#############################################################################
+#
+#       Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  The full text of the GPL is available at:
+#                  http://www.gnu.org/licenses/
+#
+#############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+
+import threading
+from collections import OrderedDict
+from time import time as walltime
+
+from ..config import UN_SAGE
+
+
+class DocWorksheetPool(object):
+    """
+    Live documentation worksheets.
+
+    INPUT:
+
+        - ``notebook`` -- the notebook where the worksheets are.
+
+        - ``size`` -- a function returning the maximum number of worksheets.
+
+        - ``idle_kernels`` -- a function returning the maximum number of
+          idle worksheet processes kept to be reused.
+
+        - ``timeout`` -- a function returning the number of seconds a
+          worksheet must be unused before its process is quit to hand it
+          out again.
+    """
+
+    def __init__(self, notebook, size, idle_kernels, timeout):
+        self.notebook = notebook
+        self.size = size
+        self.idle_kernels = idle_kernels
+        self.timeout = timeout
+        self.checkouts = 0  # worksheets handed out
+        self.reused = 0  # of them with an idle process
+        self.exhausted = 0  # of them whose process was quit
+        self.refused = 0  # checkouts with every worksheet in use
+        self._slots = None  # id numbers of the worksheets of the pool
+        self._free = OrderedDict()  # id numbers without a running process
+        self._idle = OrderedDict()  # id numbers with an idle process
+        # id numbers in use -> walltime they were handed out, oldest first
+        self._busy = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _worksheet(self, id_number):
+        return self.notebook.filename_wst('{}/{}'.format(UN_SAGE, id_number))
+
+    def _load(self):
+        # The worksheets left by a previous run of the server are reused.
+        self._slots = set()
+        worksheets = sorted(self.notebook.user_wsts(UN_SAGE),
+                            key=lambda W: W.id_number)
+        for W in worksheets:
+            if len(self._slots) >= self.size():
+                break
+            if W.name == 'scratch' or W.compute_process_has_been_started():
+                continue
+            self._slots.add(W.id_number)
+            self._free[W.id_number] = True
+
+    def _take(self):
+        # Return the id number of the worksheet to hand out (None for a new
+        # one) and whether its process is kept, or (None, None) if the
+        # pool is busy.
+        if self._slots is None:
+            self._load()
+        if self._idle:
+            self.reused += 1
+            return self._idle.popitem(last=False)[0], True
+        if self._free:
+            return self._free.popitem(last=False)[0], False
+        if len(self._slots) < self.size() or not self._busy:
+            return None, False
+        for id_number in self._busy:
+            if not self._worksheet(
+                    id_number).compute_process_has_been_started():
+                break
+        else:
+            # Don't take a worksheet from someone reading or evaluating it.
+            deadline = walltime() - self.timeout()
+            for id_number, opened in self._busy.items():
+                if (opened < deadline and self._worksheet(
+                        id_number).last_compute_walltime() < deadline):
+                    break
+            else:
+                return None, None
+            self.exhausted += 1
+        del self._busy[id_number]
+        return id_number, False
+
+    def checkout(self):
+        """
+        Return a cleared worksheet for a documentation page, or None if
+        every worksheet of the pool is in use.
+        """
+        with self._lock:
+            id_number, keep = self._take()
+            if keep is None:
+                self.refused += 1
+                return None
+            self.checkouts += 1
+            if id_number is None:
+                # The caller sets the name.
+                W = self.notebook.create_wst('', UN_SAGE)
+                id_number = W.id_number
+                self._slots.add(id_number)
+            self._busy[id_number] = walltime()
+        W = self._worksheet(id_number)
+        if not keep and W.compute_process_has_been_started():
+            W.quit()
+        W.clear()
+        return W
+
+    def release(self, W):
+        """
+        Return the documentation worksheet ``W``, whose process has been
+        idle for the ``doc_timeout``, to the pool.  If there are less than
+        ``idle_kernels`` idle processes kept, the variables of the process
+        of ``W`` are removed and it is kept running to be reused.
+
+        OUTPUT: bool; whether the process is kept.  If it is not, the
+        caller must quit it.
+        """
+        with self._lock:
+            if self._slots is None or W.id_number not in self._slots:
+                return False
+            if W.id_number in self._idle:
+                return True
+            self._busy.pop(W.id_number, None)
+            self._free.pop(W.id_number, None)
+            if (len(self._idle) < self.idle_kernels() and
+                    W.reset_compute_process()):
+                self._idle[W.id_number] = True
+                return True
+            self._free[W.id_number] = True
+            return False
+
+    def stats(self):
+        """
+        Return a dictionary with the number of worksheets of the pool
+        (``size``), of them ``busy``, ``idle`` (with an idle process kept)
+        and ``free``, the number of worksheets handed out
+        (``checkouts``), of them with an idle process (``reused``) and
+        with a running process that was quit because all the worksheets
+        had one (``exhausted``), and the number of checkouts ``refused``
+        because all the worksheets were in use.
+        """
+        with self._lock:
+            return {'size': len(self._slots or ()), 'busy': len(self._busy),
+                    'idle': len(self._idle), 'free': len(self._free),
+                    'checkouts': self.checkouts, 'reused': self.reused,
+                    'exhausted': self.exhausted, 'refused': self.refused}
@@ -27,6 +27,8 @@ import logging
 import os
 import re
 import shutil
+import threading
+import time
 import traceback
 import sys
 
@@ -36,6 +38,13 @@ from .. import config
 from ..config import SYSTEMS
 from ..config import UN_PUB
 from ..config import UN_SAGE
+from ..sage_server.scheduler import EvaluationScheduler
+from ..sage_server.scheduler import ServerPoolScheduler
+from ..sage_server.telemetry import children_map
+from ..sage_server.telemetry import host_memory
+from ..sage_server.telemetry import memory_used_ratio
+from ..sage_server.telemetry import TelemetrySampler
+from ..sage_server.watchdog import ProcessWatchdog
 from ..sage_server.workers import sage
 from ..storage import FilesystemDatastore
 from ..util import cached_property
@@ -45,6 +54,8 @@ from ..util import set_restrictive_permissions
 from ..util import sort_worksheet_list
 from ..util import walltime
 from ..util.decorators import global_lock
+from ..util.decorators import worksheet_locks
+from ..util.doc_cache import DocPageCache
 from ..util.docHTMLProcessor import docutilsHTMLProcessor
 from ..util.docHTMLProcessor import SphinxHTMLProcessor
 from ..util.notification import logger
@@ -54,7 +65,8 @@ from ..util.text import extract_text
 
 from ..models import ServerConfiguration
 from ..controllers import UserManager
-from .worksheet import update_worksheets
+from .doc_pool import DocWorksheetPool
+from .worksheet import worksheet_processes
 
 
 class WorksheetDict(dict):
@@ -109,6 +121,9 @@ class NotebookUpdater(object):
     def idle_check(self):
         t = walltime()
         if t > self.last_idle_time + self.idle_interval:
+            # The watchdog takes the global_lock itself, only while it
+            # lists the worksheet processes.
+            self.notebook.update_worksheet_processes()
             with global_lock:
                 # if someone got the lock before we did, they might have
                 # already idled, so we check against the last_idle_time again
@@ -116,8 +131,8 @@ class NotebookUpdater(object):
                 # don't need it unless we are actually thinking about quitting
                 # worksheets
                 if t > self.last_idle_time + self.idle_interval:
-                    self.notebook.update_worksheet_processes()
                     self.notebook.quit_idle_worksheet_processes()
+                    self.notebook.reclaim_kernels()
                     self.last_idle_time = t
 
     def update(self):
@@ -201,6 +216,12 @@ class Notebook(object):
         except IOError:
             pass
 
+        # Worksheets whose process was quit to keep the kernel budget, and
+        # whose process is being quit -> bytes it frees
+        self.__reclaimed = set()
+        self.__reclaiming = {}
+        self.reclaimed_kernels = 0
+
         # Old stuff
         self.updater = NotebookUpdater(self)
 
@@ -1144,6 +1165,67 @@ class Notebook(object):
     def set_server_pool(self, servers):
         self.conf['server_pool'] = servers
 
+    @cached_property()
+    def server_pool_scheduler(self):
+        return ServerPoolScheduler()
+
+    @cached_property()
+    def telemetry(self):
+        return TelemetrySampler(
+            self._telemetry_sources,
+            interval=lambda: self.conf['telemetry_interval'])
+
+    @cached_property()
+    def watchdog(self):
+        return ProcessWatchdog(
+            worksheet_processes,
+            interval=lambda: self.conf['watchdog_interval'],
+            lock=global_lock)
+
+    @cached_property()
+    def doc_cache(self):
+        return DocPageCache(config.DOC_CACHE_PATH,
+                            max_pages=self.conf['doc_cache_size'])
+
+    @cached_property()
+    def doc_pool(self):
+        return DocWorksheetPool(
+            self,
+            size=lambda: self.conf['doc_pool_size'],
+            idle_kernels=lambda: self.conf['doc_idle_kernels'],
+            timeout=lambda: self.conf['doc_timeout'])
+
+    def _telemetry_sources(self):
+        for W in tuple(self.__worksheets.values()):
+            yield (W.filename,
+                   {'worksheet': W.filename, 'name': W.name,
+                    'owner': W.owner},
+                   W.compute_process_resource_usage)
+
+    def interact_state_stats(self):
+        """
+        Return a list of dictionaries with the interact state kept by the
+        running worksheet processes (see
+        :meth:`Worksheet.compute_process_interact_stats`), the largest
+        first.
+        """
+        stats = []
+        for W in tuple(self.__worksheets.values()):
+            s = W.compute_process_interact_stats()
+            if s is None:
+                continue
+            stats.append({'worksheet': W.filename, 'name': W.name,
+                          'owner': W.owner, 'cells': s['cells'],
+                          'bytes': s['bytes']})
+        return sorted(stats, key=lambda s: -s['bytes'])
+
+    def server_pool_stats(self):
+        """
+        Return a list of dictionaries with the load and health statistics
+        of every node in the server pool.
+        """
+        return self.server_pool_scheduler.stats(self.server_pool() or ())
+
     def get_ulimit(self):
         try:
             return self.__ulimit
@@ -1177,9 +1259,13 @@ class Notebook(object):
         return sage(
             server_pool=self.server_pool(),
             max_vmem=tbl['v'],
+            max_walltime=self.conf['max_walltime'] or None,
             max_cputime=tbl['t'],
             max_processes=tbl['u'],
-            init_code='\n'.join((init_code, "DIR = '{}'".format(self.DIR))))
+            init_code='\n'.join((init_code, "DIR = '{}'".format(self.DIR))),
+            scheduler=self.server_pool_scheduler,
+            capacity=self.conf['server_pool_capacity'],
+            remote_command=self.conf['server_pool_command'])
 
     # Computing control
 
@@ -1188,19 +1274,185 @@ class Notebook(object):
             W.quit()
 
     def update_worksheet_processes(self):
-        update_worksheets()
+        self.watchdog.check()
 
     def quit_idle_worksheet_processes(self):
         timeout = self.conf['idle_timeout']
         doc_timeout = self.conf['doc_timeout']
 
-        for W in self.__worksheets.values():
+        for W in tuple(self.__worksheets.values()):
             if W.compute_process_has_been_started():
                 if W.docbrowser:
+                    # Some idle processes are kept to be reused by other
+                    # documentation pages.
+                    if (0 < doc_timeout < W.time_idle() and
+                            self.doc_pool.release(W)):
+                        continue
                     W.quit_if_idle(doc_timeout)
                 else:
                     W.quit_if_idle(timeout)
 
+    def running_worksheet_processes(self):
+        return [W for W in tuple(self.__worksheets.values())
+                if W.compute_process_has_been_started()]
+
+    def kernel_budget(self):
+        """
+        Return a dictionary with the running worksheet processes, the
+        budget limits and the host memory in use.
+        """
+        return {
+            'running': len(self.running_worksheet_processes()),
+            'max_kernels': self.conf['max_kernels'],
+            'memory_watermark': self.conf['kernel_memory_watermark'],
+            'memory_used': memory_used_ratio(),
+            'reclaimed': self.reclaimed_kernels,
+            }
+
+    def reclaim_kernels(self, starting=None):
+        """
+        Quit the least recently computing worksheet processes while there
+        are more than ``max_kernels`` of them or the host memory in use is
+        above ``kernel_memory_watermark``.
+
+        The processes to quit are chosen before quitting any of them: just
+        enough to get under both limits, each one freeing its proportional
+        set size.  Worksheets with queued cells or in use by a request are
+        never quit, so the budget may be exceeded if every process is busy.
+
+        The chosen processes are quit in a background thread, and this
+        returns at once; later calls count them as already quit.  If the
+        ``hibernate`` option is set, they save their sessions first, as
+        idle processes do (see :meth:`Worksheet.hibernate`): the worksheets
+        can be used meanwhile, and a process is not quit if its worksheet
+        evaluates something before it is done.
+
+        INPUT:
+
+            - ``starting`` -- a worksheet (default: None) whose process is
+              about to be started.  It is counted but not quit.
+
+        OUTPUT:
+
+            - an integer; the number of processes to quit.
+        """
+        max_kernels = self.conf['max_kernels']
+        watermark = self.conf['kernel_memory_watermark']
+        if not max_kernels and not watermark:
+            return 0
+
+        running = [W for W in self.running_worksheet_processes()
+                   if W is not starting and
+                   W.filename not in self.__reclaiming]
+        excess = 0  # processes to quit
+        if max_kernels:
+            excess = len(running) + (starting is not None) - max_kernels
+        shortfall = 0  # bytes to free
+        memory = host_memory() if watermark else None
+        if memory is not None:
+            total, available = memory
+            shortfall = (total - available - total * watermark / 100 -
+                         sum(list(self.__reclaiming.values())))
+        if excess <= 0 and shortfall <= 0:
+            return 0
+
+        children = children_map()
+        victims = []
+        reclaiming = {}
+        for W in sorted((W for W in running if not W.queue),
+                        key=lambda W: W.last_compute_walltime()):
+            if excess <= 0 and shortfall <= 0:
+                break
+            usage = W.compute_process_resource_usage(children)
+            size = 0
+            if usage is not None:
+                size = usage['pss'] or usage['rss'] or 0
+            if excess <= 0 and not size:
+                # Quitting it frees no memory of this host.
+                continue
+            if worksheet_locks[W.filename].locked():
+                # The worksheet is in use.
+                continue
+            victims.append(W)
+            reclaiming[W.filename] = size
+            excess -= 1
+            shortfall -= size
+
+        if victims:
+            self.__reclaiming.update(reclaiming)
+            thread = threading.Thread(target=self._reclaim, args=(victims,))
+            thread.daemon = True
+            thread.start()
+        return len(victims)
+
+    def _reclaim(self, victims):
+        # Quit the processes of the worksheets chosen by reclaim_kernels
+        # once they have saved their sessions, unless the worksheets are
+        # used again. The processes are only touched with the locks of
+        # their worksheets held.
+        pending = [(W, W.last_compute_walltime()) for W in victims]
+        while pending:
+            waiting = []
+            for W, last in pending:
+                lock = worksheet_locks[W.filename]
+                if not lock.acquire(False):
+                    waiting.append((W, last))
+                    continue
+                try:
+                    if (W.last_compute_walltime() != last or
+                            not W.compute_process_has_been_started()):
+                        # It has been used again, or quit meanwhile.
+                        pass
+                    elif W.hibernate() is None:
+                        waiting.append((W, last))
+                        continue
+                    else:
+                        # worksheet name may contain unicode, so we use %r
+                        print('Reclaiming worksheet process for %r.' %
+                              W.name)
+                        W.quit()
+                        if not os.path.exists(W.session_filename):
+                            self.__reclaimed.add(W.filename)
+                        self.reclaimed_kernels += 1
+                except Exception:
+                    traceback.print_exc()
+                finally:
+                    lock.release()
+                self.__reclaiming.pop(W.filename, None)
+            pending = waiting
+            if pending:
+                time.sleep(0.1)
+
+    def kernel_was_reclaimed(self, W):
+        """
+        Return True if the process of ``W`` was quit by
+        :meth:`reclaim_kernels` since it was last started.
+        """
+        try:
+            self.__reclaimed.remove(W.filename)
+        except KeyError:
+            return False
+        return True
+
+    @cached_property()
+    def evaluation_scheduler(self):
+        return EvaluationScheduler()
+
+    def admit_computation(self, W):
+        """
+        Return True if the worksheet ``W`` may start computing a cell now
+        (see :class:`sagewui.sage_server.scheduler.EvaluationScheduler`).
+        """
+        limit = self.conf['max_computing']
+        user_limit = self.conf['max_computing_per_user']
+        if not limit and not user_limit:
+            return True
+        return self.evaluation_scheduler.request(
+            W.filename, W.owner, limit=limit, user_limit=user_limit)
+
+    def release_computation(self, W):
+        self.evaluation_scheduler.release(W.filename)
+
     def quit_worksheet(self, W):
         try:
             del self.__worksheets[W.filename]
@@ -37,11 +37,15 @@ from builtins import open
 
 import bz2
 import calendar
+import hashlib
 import os
 import re
 import shutil
+import threading
 import time
+import traceback
 
+from collections import OrderedDict
 from itertools import count
 
 from flask_babel import gettext
@@ -50,6 +54,7 @@ from .. import config
 # Imports specifically relevant to the sage notebook
 from .cell import ComputeCell, TextCell
 from ..config import INITIAL_NUM_CELLS
+from ..config import INTERACT_UPDATE_PREFIX
 from ..config import UN_PUB
 from ..config import UN_SAGE
 from ..config import SYSTEMS
@@ -58,16 +63,17 @@ from ..config import WS_ACTIVE
 from ..config import WS_ARCHIVED
 from ..config import WS_TRASH
 from ..util import cached_property
-from ..util import ignore_nonexistent_files
 from ..util import makedirs
+from ..util import move_path
 from ..util import id_generator
 from ..util import set_default
 from ..util import set_restrictive_permissions
 from ..util import walltime
+from ..util.decorators import worksheet_locks
 from ..util.templates import completions_html
 from ..util.templates import prettify_time_ago
 from ..util.text import best_completion
-from ..util.text import extract_cells
+from ..util.text import iter_cells
 from ..util.text import ignore_prompts_and_output
 from ..util.text import search_keywords
 from ..util.text import extract_text
@@ -78,16 +84,49 @@ _ = gettext
 # given user.
 
 
+# (process, filename of its worksheet)
 all_worksheet_processes = []
 
 
-def update_worksheets():
+def worksheet_processes():
     """
-    Iterate through and "update" all the worksheets.  This is needed
-    for things like wall timeouts.
+    Return pairs ``(process, lock)`` with the running worksheet processes
+    and the locks of their worksheets, forgetting the processes that have
+    been quit.
     """
-    for S in all_worksheet_processes:
-        S.update()
+    all_worksheet_processes[:] = [(S, filename) for S, filename
+                                  in all_worksheet_processes
+                                  if S.is_started()]
+    return [(S, worksheet_locks[filename])
+            for S, filename in all_worksheet_processes]
+
+
+def harvest_files(filenames, cell_dir):
+    """
+    Move the files created by the computation of a cell to the cell
+    directory ``cell_dir``.  This is run in a thread by
+    :meth:`Worksheet.check_comp`.
+    """
+    try:
+        # We wipe the cell directory and make a new one to
+        # clean up any cruft (like dead symbolic links to
+        # temporary files that were deleted, old files from
+        # old evaluations, ...).
+        try:
+            shutil.rmtree(cell_dir)
+        except OSError:
+            # Probably the directory didn't exist. If there
+            # is a different problem, the makedirs() below will
+            # see it.
+            pass
+        os.makedirs(cell_dir)
+
+        for X in filenames:
+            target = os.path.join(cell_dir, os.path.split(X)[1])
+            move_path(X, target)
+            set_restrictive_permissions(target)
+    except Exception:
+        traceback.print_exc()
 
 
 def Worksheet_from_basic(obj, notebook_worksheet_directory):
@@ -215,6 +254,29 @@ class Worksheet(object):
         self.__filename = os.path.join(owner, str(id_number))  # property ro
         self.__computing = False
         self.__queue = []
+        # Cell id -> (control updates, recompute) of the interacts waiting
+        # to be evaluated. See update_interact.
+        self.__interact_updates = {}
+        # Ids of the deleted cells whose interact state is dropped by the
+        # next evaluation
+        self.__forget_interacts = set()
+        # Output files of the current computation linked to its cell
+        self.__linked = set()
+        # Cell id -> (thread, cell, output) of the cells whose output files
+        # are being moved to the cell directory
+        self.__harvests = {}
+        # (snapshot filename, ids of the %auto cells not evaluated yet) of
+        # a process whose state is saved after its %auto cells
+        self.__auto_snapshot = None
+        # The last process was quit by the notebook kernel budget
+        self.__kernel_reclaimed = False
+        # (temporary filename, deadline) of the session being saved by
+        # the process (see hibernate)
+        self.__hibernation = None
+        # Walltimes of the first and the last unanswered interrupt
+        self.__interrupt_walltime = None
+        self.__interrupt_sent = None
+        self.__interrupt_status = None  # property ro
 
         # TODO: move to storage backend
         # set the directory in which the worksheet files will be stored.
@@ -793,6 +855,38 @@ class Worksheet(object):
         # TODO: move to storage backend
         return os.path.join(self.directory, 'worksheet.html')
 
+    @property
+    def session_filename(self):
+        """
+        Return path to the file where the variables of a hibernated
+        worksheet process are saved.
+        """
+        # TODO: move to storage backend
+        return os.path.join(os.path.abspath(self.directory), 'session.sobj')
+
+    @property
+    def auto_snapshot_filename(self):
+        """
+        Return path to the file where the variables of the worksheet
+        process are saved after evaluating the %auto cells.  The name
+        depends on the input of these cells, so that a snapshot is not
+        used after any of them changes.
+        """
+        key = hashlib.sha1('{}\n'.format(self.system).encode('utf-8'))
+        for C in self.cells:
+            if C.is_auto_cell():
+                key.update('{}\n{}\n'.format(C.id, C.input).encode('utf-8'))
+        # TODO: move to storage backend
+        return os.path.join(os.path.abspath(self.directory),
+                            'auto-{}.sobj'.format(key.hexdigest()))
+
+    def _remove_auto_snapshots(self, keep=None):
+        for name in os.listdir(self.directory):
+            filename = os.path.join(os.path.abspath(self.directory), name)
+            if (name.startswith('auto-') and name.endswith('.sobj') and
+                    filename != keep):
+                os.remove(filename)
+
     @property
     def download_name(self):
         """
@@ -1417,10 +1511,13 @@ class Worksheet(object):
             return
         basename = '{:.0f}'.format(time.time())
 
-        with open(self.worksheet_html_filename, 'w') as f:
-            f.write(self.body)
-        with open(self.snapshot_filename(basename), 'wb') as f:
-            f.write(bz2.compress(self.body.encode('utf-8')))
+        compressor = bz2.BZ2Compressor()
+        with open(self.worksheet_html_filename, 'w') as f, \
+                open(self.snapshot_filename(basename), 'wb') as g:
+            for t in self.iter_body():
+                f.write(t)
+                g.write(compressor.compress(t.encode('utf-8')))
+            g.write(compressor.flush())
 
         self.limit_snapshots()
         self.saved_by_info[basename] = user
@@ -1492,8 +1589,21 @@ class Worksheet(object):
                the worksheet with {{{}}} wiki-formatting, suitable for hand
                editing.
         """
-        return '\n\n'.join(
-            t for t in (C.edit_text.strip() for C in self.cells) if t)
+        return ''.join(self.iter_body())
+
+    def iter_body(self):
+        """
+        Return an iterator over the pieces of the body of this worksheet
+        (see :attr:`body`), so that it can be written as it is made.  The
+        edit text of each cell is kept by the cell until it changes.
+        """
+        separator = ''
+        for C in self.cells:
+            t = C.edit_text.strip()
+            if t:
+                yield separator
+                yield t
+                separator = '\n\n'
 
     @property
     def body_is_loaded(self):
@@ -1567,14 +1677,16 @@ class Worksheet(object):
             3
         """
         text = text.replace('\r\n', '\n')
-        data = extract_cells(text)
 
+        # The cells are read twice, so that they are never all in memory
+        # before being made: first for the ids in use.
         id_gen = id_generator(set(
-            x[0] for typ, x in data if typ == 'compute' and x[0] is not None))
+            x[0] for typ, x in iter_cells(text)
+            if typ == 'compute' and x[0] is not None))
         used_ids = set()
 
         cells = []
-        for typ, T in data:
+        for typ, T in iter_cells(text):
             if typ == 'plain':
                 id = next(id_gen)
                 C = self._new_text_cell(T, id=id)
@@ -1591,7 +1703,9 @@ class Worksheet(object):
                 C.input = input
                 C.set_output_text(output, '')
                 if html:
-                    C.update_html_output(output)
+                    # The files of the cell are looked for when it is
+                    # rendered.
+                    C.update_html_output(output, defer=True)
 
             cells.append(C)
             used_ids.add(id)
@@ -1886,6 +2000,10 @@ class Worksheet(object):
                 # Delete the cell's output.
                 C.delete_output()
 
+                # Free its interact state in the compute process.
+                if self.compute_process_has_been_started():
+                    self.__forget_interacts.add(C.id)
+
                 # Delete this cell from the list of cells in this worksheet:
                 del cells[i]
 
@@ -2037,18 +2155,22 @@ class Worksheet(object):
         except AttributeError:
             pass
         try:
+            nb = self.notebook()
             init_code = '\n'.join((
                 "DATA = '{}'".format(os.path.abspath(self.data_directory)),
                 'sys.path.append(DATA)',
+                '_interact_.set_max_state({})'.format(
+                    nb.conf['max_interact_states']),
                 ))
-            self.__sage = self.notebook().new_worksheet_process(
-                init_code=init_code)
+            nb.reclaim_kernels(starting=self)
+            self.__kernel_reclaimed = nb.kernel_was_reclaimed(self)
+            self.__sage = nb.new_worksheet_process(init_code=init_code)
         except Exception as msg:
             print("ERROR initializing compute process:\n")
             print(msg)
             del self.__sage
             raise RuntimeError(msg)
-        all_worksheet_processes.append(self.__sage)
+        all_worksheet_processes.append((self.__sage, self.filename))
         del self.next_block_id_generator  # Set counter to 0
         S = self.__sage
 
@@ -2058,8 +2180,41 @@ class Worksheet(object):
         if self.pretty_print:
             S.execute('pretty_print_default(True)', mode='raw')
 
-        if not self.is_published:
-            self._enqueue_auto_cells()
+        # Restore the state after the %auto cells, if it was saved with
+        # the same cells, instead of evaluating them again.
+        snapshot = None
+        if self.notebook().conf['auto_snapshot'] and not self.docbrowser:
+            snapshot = self.auto_snapshot_filename
+            self._remove_auto_snapshots(keep=snapshot)
+            if os.path.exists(snapshot):
+                S.execute(
+                    'try:\n'
+                    '    load_session(%r)\n'
+                    'except Exception:\n'
+                    '    _support_.os.remove(%r)\n' % (snapshot, snapshot),
+                    mode='raw')
+            else:
+                snapshot = None
+
+        # Restore the variables of a hibernated process. The process loads
+        # them before evaluating any cell, so we don't wait here.
+        filename = self.session_filename
+        if os.path.exists(filename):
+            S.execute(
+                'try:\n'
+                '    load_session(%r)\n'
+                'except Exception:\n'
+                '    pass\n'
+                '_support_.os.remove(%r)\n' % (filename, filename),
+                mode='raw')
+
+        self.__auto_snapshot = None
+        if not self.is_published and snapshot is None:
+            auto = self._enqueue_auto_cells()
+            if (auto and self.notebook().conf['auto_snapshot'] and
+                    not self.docbrowser):
+                self.__auto_snapshot = (self.auto_snapshot_filename,
+                                        set(C.id for C in auto))
         return self.__sage
 
     def compute_process_has_been_started(self):
@@ -2073,6 +2228,36 @@ class Worksheet(object):
         except AttributeError:
             return False
 
+    def compute_process_interact_stats(self):
+        """
+        Return a dictionary with the number of interact ``cells`` whose
+        state is kept by the compute process and its approximate size in
+        ``bytes``, as reported after the last evaluation, or None if the
+        process is not running.
+        """
+        try:
+            S = self.__sage
+        except AttributeError:
+            return None
+        if not S.is_started():
+            return None
+        return S.interact_stats()
+
+    def compute_process_resource_usage(self, children=None):
+        """
+        Return the resource usage of the compute process tree (see
+        :func:`sagewui.sage_server.telemetry.tree_usage`), or None if it
+        is not running.  ``children`` is passed to
+        :meth:`sagewui.sage_server.interfaces.SageServerABC.resource_usage`.
+        """
+        try:
+            S = self.__sage
+        except AttributeError:
+            return None
+        if not S.is_started():
+            return None
+        return S.resource_usage(children)
+
     def restart_sage(self):
         """
         Restart Sage kernel.
@@ -2081,6 +2266,28 @@ class Worksheet(object):
         self.sage()
         self.start_next_comp()
 
+    def reset_compute_process(self):
+        """
+        Remove the variables and the interact state of the compute process,
+        so that it can be reused for other contents (see
+        :class:`sagewui.gui.doc_pool.DocWorksheetPool`).
+
+        OUTPUT: bool; False if the process is not running or is computing.
+        """
+        try:
+            S = self.__sage
+        except AttributeError:
+            return False
+        if not S.is_started() or self.__computing or self.__queue:
+            return False
+        self.__forget_interacts = set()
+        try:
+            S.execute("_support_.reset_globals(keep=['DATA'])\n"
+                      '_interact_.reset_state()', mode='raw')
+        except OSError:
+            return False
+        return True
+
     def reset_interact_state(self):
         """
         Reset the interact state of this worksheet.
@@ -2089,6 +2296,7 @@ class Worksheet(object):
             S = self.__sage
         except AttributeError:
             return
+        self.__forget_interacts = set()
         try:
             S.execute('_interact_.reset_state()', mode='raw')
         except OSError:
@@ -2100,13 +2308,40 @@ class Worksheet(object):
         if not self.__queue or self.__computing:
             return
 
+        if not self.compute_process_has_been_started():
+            # Start the process first, so that the %auto cells are
+            # evaluated before the queued cells.
+            self.sage()
+            if not self.__queue or self.__computing:
+                return
+
         C = self.__queue[0]
         if C.interrupted:
             return
+        if self.__harvests:
+            # The files of the last evaluations are still being moved out
+            # of the temporary directory of the worksheet process, which
+            # is reused.
+            return
+        if self.__hibernation is not None:
+            # The worksheet is used again while the process saves its
+            # session. The session is dropped, since the process goes on.
+            if self._collect_hibernation() is None:
+                return
+            if os.path.exists(self.session_filename):
+                os.remove(self.session_filename)
 
         cell_system = self.get_cell_system(C)
         percent_directives = C.percent_directives
 
+        if C.interact_update and C.id in self.__interact_updates:
+            # Interact updates are admitted as any other evaluation.
+            if not self.notebook().admit_computation(self):
+                return
+            self._start_interact_update(C, *self.__interact_updates.pop(C.id))
+            return
+        self.__interact_updates.pop(C.id, None)
+
         if cell_system == 'sage' and C.introspect:
             before_prompt, after_prompt = C.introspect
             I = before_prompt
@@ -2118,6 +2353,10 @@ class Worksheet(object):
                 C.set_output_text('Exited %s process' % S, '')
                 return
 
+            # Wait until the notebook lets us compute (see check_comp).
+            if not self.notebook().admit_computation(self):
+                return
+
         # Handle any percent directives
         if 'save_server' in percent_directives:
             self.notebook().save()
@@ -2128,6 +2367,20 @@ class Worksheet(object):
             '_interact_.SAGE_CELL_ID=%r\n__SAGE_TMP_DIR__=os.getcwd()\n' %
             C.id)
 
+        if not C.introspect:
+            # The interact state of the previous evaluation of the cell
+            # and of the deleted cells is not used anymore.
+            for id in sorted(self.__forget_interacts | {C.id}, key=str):
+                input += '_interact_.forget_state(%r)\n' % id
+            self.__forget_interacts = set()
+
+        if self.__kernel_reclaimed and not C.introspect:
+            # Tell the user why the previous state is lost.
+            self.__kernel_reclaimed = False
+            input += 'print(%r)\n' % _(
+                'The worksheet process was stopped to free server resources. '
+                'Variables defined before have been lost.')
+
         print_time = C.time
         if C.time:
             input += '__SAGE_t__=cputime()\n__SAGE_w__=walltime()\n'
@@ -2146,12 +2399,93 @@ class Worksheet(object):
         input += self.preparse_input(I, C)
 
         self.__computing = True
+        self.__linked = set()
+        self.__interrupt_walltime = None
+        self.__interrupt_status = None
         mode = ('sage' if cell_system == 'sage' and not C.introspect
                 else 'python')
         self.sage().execute(
             input, os.path.abspath(self.data_directory),
             mode=mode, print_time=print_time)
 
+    def _collect_harvests(self, wait=False):
+        """
+        Finish the cells whose output files have been moved (see
+        :func:`harvest_files`).  If ``wait`` is True, wait for all of them.
+        """
+        for id, (harvest, C, out) in list(self.__harvests.items()):
+            if wait:
+                harvest.join()
+            elif harvest.is_alive():
+                continue
+            del self.__harvests[id]
+            # Generate html, etc.
+            C.set_output_text(out, C.files_html(out))
+
+    def update_interact(self, C, variable='', adapt_number=-1, value='',
+                        recompute=False, username=None):
+        """
+        Queue an update of the interact of the cell ``C``: set the control
+        ``variable`` to ``value`` (base64 encoded), then recompute the
+        interact if ``recompute`` is True.
+
+        Updates are coalesced: while the cell is waiting or computing,
+        only the last value of each control is kept, so the cell is
+        evaluated at most once more with all of them.
+        """
+        controls, recompute_pending = self.__interact_updates.get(
+            C.id, (OrderedDict(), False))
+        if variable:
+            # The last value wins, in the order of the last updates.
+            controls.pop(variable, None)
+            controls[variable] = (adapt_number, value)
+        self.__interact_updates[C.id] = (controls,
+                                         recompute_pending or recompute)
+
+        C.input = INTERACT_UPDATE_PREFIX
+        C.eval_method = 'eval'
+        C.interrupted = False
+        C.evaluated = True
+        C.introspect = False
+        self.enqueue(C, username=username)
+        # TODO:  move to storage backend
+        C.delete_files()
+
+    def _start_interact_update(self, C, controls, recompute):
+        """
+        Start evaluating the coalesced interact updates of the cell ``C``
+        (see :meth:`update_interact`).  They are fixed calls of the
+        interact module, so they are neither preparsed nor reformatted.
+        """
+        input = '_interact_.SAGE_CELL_ID=%r\n' % C.id
+        for variable, (adapt_number, value) in controls.items():
+            input += (
+                "_interact_.update('%s', '%s', "
+                "%s, _support_.base64.standard_b64decode('%s'), "
+                "globals())\n" % (C.id, variable, adapt_number, value))
+        if recompute:
+            input += "_interact_.recompute('%s')\n" % C.id
+        self.__computing = True
+        self.__linked = set()
+        self.__interrupt_walltime = None
+        self.__interrupt_status = None
+        self.sage().execute(input, os.path.abspath(self.data_directory),
+                            mode='exec')
+
+    def _stop_computing(self):
+        self.__computing = False
+        self.notebook().release_computation(self)
+
+    @property
+    def queue_position(self):
+        """
+        Return the position of this worksheet in the queue of worksheets
+        waiting to compute, or None if it is not waiting.
+        """
+        if not self.__queue or self.__computing:
+            return None
+        return self.notebook().evaluation_scheduler.position(self.filename)
+
     def check_comp(self, wait=0.2):
         r"""
         Check on currently computing cells in the queue.
@@ -2179,44 +2513,58 @@ class Worksheet(object):
             sage: nb.delete()
         """
 
+        self._collect_harvests()
         if len(self.__queue) == 0:
             return 'e', None
         S = self.sage()
         C = self.__queue[0]
 
         if C.interrupted:
-            self.__computing = False
+            self._stop_computing()
             del self.__queue[0]
             return 'd', C
 
+        if not self.__computing:
+            # The computation was not admitted yet. Try again.
+            self.start_next_comp()
+            if not self.__computing:
+                return 'w', C
+
         try:
             output_status = S.output_status()
         except RuntimeError:
             # verbose(
             #  "Computation was interrupted or failed. Restarting.\n%s" % msg)
-            self.__computing = False
+            self._stop_computing()
             self.start_next_comp()
             return 'w', C
 
         # TODO: reimplement output postprosessing to get meaningful tracebacks
         out = output_status.output
 
+        if not output_status.done and self.__interrupt_walltime is not None:
+            if self._check_interrupt(S):
+                return 'd', C
+
         if not output_status.done:
             # Still computing
             if not C.introspect:
                 C.set_output_text(out, '')
 
                 ########################################################
-                # Create temporary symlinks to output files seen so far
-                if len(output_status.filenames) > 0:
+                # Create temporary symlinks to new output files
+                new = [X for X in output_status.filenames
+                       if X not in self.__linked]
+                if new:
                     cell_dir = os.path.abspath(C.directory())
                     if not os.path.exists(cell_dir):
                         os.makedirs(cell_dir)
-                    for X in output_status.filenames:
+                    for X in new:
                         target = os.path.join(cell_dir, os.path.split(X)[1])
-                        if os.path.exists(target):
+                        if os.path.lexists(target):
                             os.unlink(target)
                         os.symlink(X, target)
+                        self.__linked.add(X)
                 ########################################################
             return 'w', C
 
@@ -2242,62 +2590,55 @@ class Worksheet(object):
                         '<html><!--notruncate-->{}</html>'.format(out), '')
 
         # Finished a computation.
-        self.__computing = False
+        self._stop_computing()
         del self.__queue[0]
+        if C.id in self.__interact_updates and C not in self.__queue:
+            # The interact controls were changed while computing.
+            self.__queue.append(C)
 
         if not C.introspect:
             filenames = output_status.filenames
-            if len(filenames) > 0:
-                # Move files to the cell directory
-                cell_dir = os.path.abspath(C.directory())
-                # We wipe the cell directory and make a new one to
-                # clean up any cruft (like dead symbolic links to
-                # temporary files that were deleted, old files from
-                # old evaluations, ...).
-                try:
-                    shutil.rmtree(cell_dir)
-                except OSError:
-                    # Probably the directory didn't exist. If there
-                    # is a different problem, the makedirs() below will
-                    # see it.
-                    pass
-                os.makedirs(cell_dir)
-
-                for X in filenames:
-                    target = os.path.join(cell_dir, os.path.split(X)[1])
-                    # We move X to target. Note that we don't actually
-                    # do a rename: in a client/server setup, X might be
-                    # owned by a different Unix user than ourselves.
-                    if os.path.isdir(X):
-                        shutil.copytree(X, target,
-                                        ignore=ignore_nonexistent_files)
-                        shutil.rmtree(X, ignore_errors=True)
-                    else:
-                        shutil.copy(X, target)
-                        os.unlink(X)
-                    set_restrictive_permissions(target)
-            # Generate html, etc.
-            html = C.files_html(out)
-            C.set_output_text(out, html)
             C.introspect_html = ''
+            if len(filenames) > 0:
+                # Move files to the cell directory out of the request
+                # thread. The cell is done when they are moved (see
+                # check_cell).
+                C.set_output_text(out, '')
+                harvest = threading.Thread(
+                    target=harvest_files,
+                    args=(filenames, os.path.abspath(C.directory())))
+                harvest.daemon = True
+                harvest.start()
+                self.__harvests[C.id] = (harvest, C, out)
+            else:
+                # Generate html, etc.
+                html = C.files_html(out)
+                C.set_output_text(out, html)
+
+        if self.__interrupt_walltime is not None:
+            # The interrupt succeeded. Don't evaluate the queued cells.
+            self.__interrupt_walltime = None
+            self.__interrupt_status = 'done'
+            C.interrupt()
+            self.clear_queue()
 
+        self._check_auto_snapshot(C)
         return 'd', C
 
-    def interrupt(self, callback=None, timeout=1):
+    def interrupt(self):
         r"""
         Interrupt all currently queued up calculations.
 
-        INPUT:
-
-        - ``timeout`` -- time to wait for interruption to succeed
-
-        - ``callback`` -- callback to be called. Called with True if
-          interrupt succeeds, else called with False.
+        This only signals the worksheet process and returns immediately.
+        The interrupt is confirmed by :meth:`check_comp`: when the current
+        computation stops, the rest of the queue is dropped.  Meanwhile,
+        the interrupt is sent again every ``interrupt_grace`` seconds, and
+        the process is restarted after ``interrupt_restart`` seconds (if
+        it is not 0).  :attr:`interrupt_status` tells the progress.
 
         OUTPUT:
 
-        -  ``deferred`` - a Deferred object with the given callbacks and
-           errbacks
+        - a boolean; True if nothing is computing.
 
         EXAMPLES: We create a worksheet and start a large factorization
         going::
@@ -2315,13 +2656,14 @@ class Worksheet(object):
             sage: W.check_comp()
             ('w', Cell 0: in=factor(2^997-1), out=...)
 
-        We interrupt it successfully.
+        We interrupt it.
 
         ::
 
-            sage: W.interrupt(
-                )         # not tested -- needs running reactor
-            True
+            sage: W.interrupt()
+            False
+            sage: W.interrupt_status
+            'pending'
 
         Now we check and nothing is computing.
 
@@ -2329,7 +2671,9 @@ class Worksheet(object):
 
             sage: W.check_comp(
                 )        # random -- could fail on heavily loaded machine
-            ('e', None)
+            ('d', Cell 0: in=factor(2^997-1), out=...)
+            sage: W.interrupt_status
+            'done'
 
         Clean up.
 
@@ -2338,20 +2682,59 @@ class Worksheet(object):
             sage: W.quit()
             sage: nb.delete()
         """
-        if len(self.__queue) == 0:
+        if not self.__queue or not self.__computing:
             # nothing to do
+            self.clear_queue()
             return True
         # stop the current computation in the running Sage
-        S = self.__sage
-        S.interrupt()
-
-        time.sleep(timeout)
+        self.__sage.interrupt()
+        self.__interrupt_sent = walltime()
+        if self.__interrupt_walltime is None:
+            self.__interrupt_walltime = self.__interrupt_sent
+            self.__interrupt_status = 'pending'
+        return False
 
-        if S.is_computing():
-            return False
-        else:
+    @property
+    def interrupt_status(self):
+        """
+        Return the status of the last interrupt: None if there is none,
+        'pending', 'escalated' if it has been sent again, 'done' or
+        'restarted' if the worksheet process had to be restarted.
+        """
+        return self.__interrupt_status
+
+    def _check_interrupt(self, S):
+        """
+        Escalate an unanswered interrupt (see :meth:`interrupt`).
+
+        OUTPUT: bool; whether the worksheet process was restarted.
+        """
+        conf = self.notebook().conf
+        elapsed = walltime() - self.__interrupt_walltime
+        if conf['interrupt_restart'] and elapsed > conf['interrupt_restart']:
+            # worksheet name may contain unicode, so we use %r
+            print('Restarting uninterruptible worksheet process for %r.' %
+                  self.name)
+            ids = self.queue_id_list
+            self.__queue[0].set_output_text(
+                _('The worksheet process did not stop, so it was '
+                  'restarted.'), '')
+            self.restart_sage()
+            # The cells were reloaded by restart_sage
+            for C in self.cells:
+                if isinstance(C, ComputeCell) and C.id in ids:
+                    C.interrupt()
+            self.__interrupt_walltime = None
+            self.__interrupt_status = 'restarted'
             return True
 
+        grace = conf['interrupt_grace']
+        if grace and walltime() - self.__interrupt_sent > grace:
+            S.interrupt()
+            self.__interrupt_sent = walltime()
+            self.__interrupt_status = 'escalated'
+        return False
+
     def quit(self):
         try:
             S = self.__sage
@@ -2360,6 +2743,8 @@ class Worksheet(object):
             self.notebook().quit_worksheet(self)
             return
 
+        # The temporary files are deleted by S.quit()
+        self._collect_harvests(wait=True)
         try:
             S.quit()
         except AttributeError as msg:
@@ -2369,6 +2754,10 @@ class Worksheet(object):
             print("WARNING: Error deleting Sage object!")
 
         del self.__sage
+        self.__forget_interacts = set()
+        if self.__hibernation is not None:
+            # Keep the session if it was saved before the process quit.
+            self._collect_hibernation()
 
         # We do this to avoid getting a stale Sage that uses old code.
         self.save()
@@ -2386,6 +2775,62 @@ class Worksheet(object):
 
     # Idle timeout
 
+    def hibernate(self):
+        r"""
+        Save the picklable variables of the worksheet process in
+        :attr:`session_filename`, so that they are restored the next time
+        the process is started.
+
+        This is done only if the ``hibernate`` notebook option is set and
+        the process is not computing.  The process saves the session in
+        the background: the first call starts it and the next ones check
+        whether it is done, giving up ``hibernate_timeout`` seconds after
+        the first one.
+
+        OUTPUT: None while the session is being saved, else a bool;
+        whether the session was saved.
+        """
+        if self.__hibernation is not None:
+            return self._collect_hibernation()
+        conf = self.notebook().conf
+        if not conf['hibernate'] or self.docbrowser:
+            return False
+        try:
+            S = self.__sage
+        except AttributeError:
+            return False
+        if not S.is_started() or self.__computing or self.__queue:
+            return False
+
+        # Save to a temporary file, so that a session is never partially
+        # written if the process is killed.
+        filename = self.session_filename
+        tmp_filename = '{}.tmp.sobj'.format(os.path.splitext(filename)[0])
+        S.execute(
+            'save_session(%r)\n_support_.os.rename(%r, %r)\n' % (
+                tmp_filename, tmp_filename, filename),
+            mode='python')
+        self.__hibernation = (tmp_filename,
+                              walltime() + conf['hibernate_timeout'])
+        return None
+
+    def _collect_hibernation(self):
+        """
+        Return None if the process is still saving its session (see
+        :meth:`hibernate`), else whether the session was saved.
+        """
+        tmp_filename, deadline = self.__hibernation
+        try:
+            done = self.__sage.output_status().done
+        except (AttributeError, RuntimeError):
+            done = True
+        if not done and walltime() < deadline:
+            return None
+        self.__hibernation = None
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        return done and os.path.exists(self.session_filename)
+
     def quit_if_idle(self, timeout):
         r"""
         Quit the worksheet process if it has been "idle" for more than
@@ -2396,6 +2841,10 @@ class Worksheet(object):
         """
         # Quit only if timeout is greater than zero
         if timeout > 0 and self.time_idle() > timeout:
+            if self.hibernate() is None:
+                # The process is saving its session. It is quit by a later
+                # check, when it is done.
+                return
             # worksheet name may contain unicode, so we use %r, which prints
             # the \xXX form for unicode characters
             print("Quitting ignored worksheet process for %r." % self.name)
@@ -2452,9 +2901,43 @@ class Worksheet(object):
         self.start_next_comp()
 
     def _enqueue_auto_cells(self):
-        for c in self.cells:
-            if c.is_auto_cell():
-                self.enqueue(c)
+        """
+        Queue the %auto cells before the cells waiting to be evaluated.
+
+        OUTPUT: the list of %auto cells.
+        """
+        auto = [C for C in self.cells if C.is_auto_cell()]
+        if not auto:
+            return auto
+        self._record_that_we_are_computing()
+        i = 1 if self.__computing else 0
+        self.__queue[i:] = [C for C in auto if C not in self.__queue[:i]] + [
+            C for C in self.__queue[i:] if C not in auto]
+        self.start_next_comp()
+        return auto
+
+    def _check_auto_snapshot(self, C):
+        """
+        Save the state of the worksheet process when the last of the %auto
+        cells queued at its start (see :meth:`sage`) is done, if no other
+        cell was evaluated before.
+        """
+        if self.__auto_snapshot is None or C.introspect:
+            return
+        filename, pending = self.__auto_snapshot
+        if C.id not in pending or C.interrupted:
+            self.__auto_snapshot = None
+            return
+        pending.discard(C.id)
+        if pending:
+            return
+        self.__auto_snapshot = None
+        if filename != self.auto_snapshot_filename:
+            # Some %auto cell has changed since the process was started.
+            return
+        self._remove_auto_snapshots()
+        self.sage().execute('_support_.save_snapshot(%r)' % filename,
+                            mode='raw')
 
     def check_cell(self, id):
         """
@@ -2470,8 +2953,10 @@ class Worksheet(object):
           cell's status ('d' for "done" or 'w' for "working") and the
           cell itself.
         """
+        self._collect_harvests()
         cell = self.get_cell_with_id(id)
-        status = 'w' if cell in self.__queue else 'd'
+        status = ('w' if cell in self.__queue or cell.id in self.__harvests
+                  else 'd')
         return status, cell
 
     def clear_queue(self):
@@ -2479,11 +2964,14 @@ class Worksheet(object):
         for C in self.__queue:
             C.interrupt()
         self.__queue = []
-        self.__computing = False
+        self.__interact_updates = {}
+        self.__auto_snapshot = None
+        self._stop_computing()
 
     def clear(self):
-        self.__computing = False
+        self._stop_computing()
         self.__queue = []
+        self.__interact_updates = {}
         del self.cells
 
     # Processing of input and output to worksheet process.
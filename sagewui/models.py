@@ -48,14 +48,32 @@ app_defaults = {
     'idle_timeout': 0,        # timeout in seconds for worksheets
     'doc_timeout': 600,         # timeout in seconds for live docs
     'idle_check_interval': 360,
+    'telemetry_interval': 30,  # seconds between kernel usage samples
+    'metrics_token': '',  # bearer token for /metrics; '' = admins only
+    'watchdog_interval': 5,  # seconds between kernel limit checks
+    'max_walltime': 0,  # seconds a worksheet process may run; 0 = no limit
+    'max_kernels': 0,  # running worksheet processes; 0 = no limit
+    'kernel_memory_watermark': 0,  # percent of host memory; 0 = no limit
+    'max_computing': 0,  # worksheets computing at once; 0 = no limit
+    'max_computing_per_user': 0,  # the same for each user
+    'interrupt_grace': 5,  # seconds before sending an interrupt again
+    'interrupt_restart': 0,  # seconds before restarting; 0 = never
+    'hibernate': False,  # save the session of quit worksheet processes
+    'hibernate_timeout': 60,  # seconds
+    'auto_snapshot': False,  # save the state after the %auto cells
+    'max_interact_states': 0,  # interacts kept per process; 0 = no limit
 
     'save_interval': 360,        # seconds
 
     'doc_pool_size': 128,
+    'doc_cache_size': 64,  # processed doc pages kept in memory
+    'doc_idle_kernels': 2,  # idle doc worksheet processes kept for reuse
 
     'pub_interact': False,
 
     'server_pool': [],
+    'server_pool_capacity': 0,  # worksheet processes per node; 0 = no limit
+    'server_pool_command': 'ssh -t {user_at_host} "{command}"',
 
     'system': 'sage',
 
@@ -112,6 +130,91 @@ app_gui_hints = {
         GROUP: G_SERVER,
         TYPE: T_INTEGER,
     },
+    'telemetry_interval': {
+        DESC: _('Worksheet process usage sampling interval (seconds, 0 to '
+                'disable)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'metrics_token': {
+        DESC: _('Bearer token allowing access to /metrics without login '
+                '(empty for admins only)'),
+        GROUP: G_SERVER,
+        TYPE: T_STRING,
+    },
+    'watchdog_interval': {
+        DESC: _('Worksheet process limits checking interval (seconds, 0 to '
+                'disable)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'max_walltime': {
+        DESC: _('Maximum running time of a worksheet process (seconds, 0 '
+                'for no limit)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'max_kernels': {
+        DESC: _('Maximum number of running worksheet processes (0 for no '
+                'limit)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'kernel_memory_watermark': {
+        DESC: _('Stop the least recently used worksheet processes when the '
+                'host memory in use exceeds this percent (0 to disable)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'max_computing': {
+        DESC: _('Maximum number of worksheets computing at the same time '
+                '(0 for no limit)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'max_computing_per_user': {
+        DESC: _('Maximum number of worksheets of a user computing at the '
+                'same time (0 for no limit)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'interrupt_grace': {
+        DESC: _('Time to wait before interrupting a computation again '
+                '(seconds, 0 to disable)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'interrupt_restart': {
+        DESC: _('Time to wait before restarting a worksheet process that '
+                'can not be interrupted (seconds, 0 to disable)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'hibernate': {
+        DESC: _('Save the variables of idle worksheet processes before '
+                'quitting them and restore them on restart'),
+        GROUP: G_SERVER,
+        TYPE: T_BOOL,
+    },
+    'hibernate_timeout': {
+        DESC: _('Maximum time to save the variables of a worksheet process '
+                '(seconds)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'auto_snapshot': {
+        DESC: _('Save the variables of worksheet processes after evaluating '
+                'the automatic cells and restore them on restart instead of '
+                'evaluating the cells again'),
+        GROUP: G_SERVER,
+        TYPE: T_BOOL,
+    },
+    'max_interact_states': {
+        DESC: _('Maximum number of interacts whose state is kept by each '
+                'worksheet process (0 for no limit)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
     'save_interval': {
         DESC: _('Save interval (seconds)'),
         GROUP: G_SERVER,
@@ -122,6 +225,16 @@ app_gui_hints = {
         GROUP: G_SERVER,
         TYPE: T_INTEGER,
     },
+    'doc_cache_size': {
+        DESC: _('Processed doc pages kept in memory'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'doc_idle_kernels': {
+        DESC: _('Idle doc worksheet processes kept for reuse'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
     'pub_interact': {
         DESC: _(
             'Enable published interacts (EXPERIMENTAL; USE AT YOUR OWN RISK)'),
@@ -133,6 +246,18 @@ app_gui_hints = {
         GROUP: G_SERVER,
         TYPE: T_LIST,
     },
+    'server_pool_capacity': {
+        DESC: _('Maximum worksheet processes per worksheet process user '
+                '(0 for no limit)'),
+        GROUP: G_SERVER,
+        TYPE: T_INTEGER,
+    },
+    'server_pool_command': {
+        DESC: _('Command running a worksheet process as a worksheet process '
+                'user'),
+        GROUP: G_SERVER,
+        TYPE: T_STRING,
+    },
     'system': {
         DESC: _('Default system'),
         GROUP: G_SERVER,
@@ -457,7 +457,11 @@ class NotebookFrontend(object):
 
         signal.signal(signal.SIGINT, my_sigint)
 
-        resource = WSGIResource(reactor, reactor.getThreadPool(), flask_app)
+        pool = reactor.getThreadPool()
+        resource = WSGIResource(reactor, pool, flask_app)
+        # Each cell update stream holds a thread of the pool, which serves
+        # every request.
+        flask_app.config['CELL_UPDATE_STREAM_MAX'] = max(1, pool.max // 5)
 
         class QuietSite(server.Site):
             def log(*args, **kwargs):
@@ -507,6 +511,10 @@ class NotebookFrontend(object):
             'keyfile': self.conf['priv_pem']
             } if self.conf['secure'] else None
 
+        # WSGIContainer buffers whole responses in the IOLoop thread, so a
+        # cell update stream would block the server.
+        flask_app.config['CELL_UPDATE_STREAM'] = False
+
         self.open_page()
         wsgi_app = WSGIContainer(flask_app)
         http_server = HTTPServer(wsgi_app, ssl_options=ssl_options)
@@ -0,0 +1,893 @@
+"""
+sage_server compute agent
+
+A compute agent is a long-lived daemon running on a compute node. It starts
+and controls worksheet processes on behalf of a notebook server, which
+reaches it through a single TCP or Unix socket connection shared by all the
+worksheet processes on that node.  Output, files created by computations and
+the files in the worksheet data directories are sent over the same
+connection, so no shared filesystem is needed.
+
+Start an agent on the compute node::
+
+    python -m sagewui.sage_server.agent --listen 0.0.0.0:8765 \\
+        --token_file ~/.sagewui_agent_token
+
+    python -m sagewui.sage_server.agent --listen /var/run/sagewui/agent.sock
+
+and use ``agent://<token>@<host>:8765`` or
+``agent:///var/run/sagewui/agent.sock`` as server pool entries.  The agent
+refuses to listen at a TCP address reachable from other hosts without a
+token, unless ``--no_token`` is given.
+
+Messages are JSON objects, each one preceded by its length as a four byte
+big endian integer.  Requests have the form ``{'id': n, 'method': name,
+'params': {...}}`` and are answered by ``{'id': n, 'result': value}`` or
+``{'id': n, 'error': message}``.  Requests are served concurrently, so
+replies may arrive in any order.  The first request of a connection must be
+``hello``, carrying the agent token.  Worksheet processes are quit when the
+connection that started them is closed.
+
+AUTHORS:
+
+  - J Miguel Farto
+"""
+
+#############################################################################
+#
+#       Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  The full text of the GPL is available at:
+#                  http://www.gnu.org/licenses/
+#
+#############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+from builtins import range
+from builtins import str
+from future.moves.queue import Queue
+from future.moves.urllib.parse import urlparse
+
+import argparse
+import hmac
+import json
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import uuid
+from base64 import b64decode
+from base64 import b64encode
+from time import time as walltime
+
+from .interfaces import OutputStatus
+from .interfaces import ProcessLimits
+from .interfaces import SageServerABC
+from .interfaces import SageServerExpect
+from .scheduler import node_label
+
+
+PROTOCOL_VERSION = 1
+MAX_MESSAGE_SIZE = 1 << 30
+# Seconds to wait for the answer to the periodic update of a process.  It
+# is short because the watchdog updates the worksheet processes one after
+# another, so a slow agent delays the checks of all of them.
+UPDATE_TIMEOUT = 5
+
+_header = struct.Struct('!I')
+
+
+class AgentError(RuntimeError):
+    pass
+
+
+class AgentTimeout(AgentError):
+    pass
+
+
+# Protocol
+
+def send_message(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(_header.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise EOFError('connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock):
+    size = _header.unpack(_recv_exactly(sock, _header.size))[0]
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError('message too large ({} bytes)'.format(size))
+    return json.loads(_recv_exactly(sock, size).decode('utf-8'))
+
+
+def parse_address(address):
+    """
+    Return ``(family, address, token)`` for a server pool entry of the
+    form ``agent://[token@]host:port`` or ``agent://[token@]/path``, or
+    for an agent ``--listen`` argument (``host:port`` or a path).
+    """
+    if address.startswith('agent:'):
+        url = urlparse(address)
+        token = url.username
+        if url.hostname:
+            return socket.AF_INET, (url.hostname, url.port), token
+        return socket.AF_UNIX, url.path, token
+    if os.path.sep in address:
+        return socket.AF_UNIX, address, None
+    host, port = address.rsplit(':', 1)
+    return socket.AF_INET, (host, int(port)), None
+
+
+def is_loopback(address):
+    """
+    Return True if ``address``, a ``--listen`` argument of the agent, is
+    a Unix socket or only reachable from this host.
+    """
+    family, address = parse_address(address)[:2]
+    if family == socket.AF_UNIX:
+        return True
+    try:
+        infos = socket.getaddrinfo(address[0], address[1])
+    except socket.gaierror:
+        return False
+    return all(info[4][0].startswith('127.') or info[4][0] == '::1'
+               for info in infos)
+
+
+def _encode(data):
+    return b64encode(data).decode('ascii')
+
+
+def _decode(data):
+    return b64decode(data.encode('ascii'))
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime]
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return _encode(f.read())
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(_decode(data))
+
+
+# Server side
+
+class AgentConnection(object):
+    """
+    Connection from the notebook server to a compute agent, shared by all
+    the worksheet processes running on the agent node.
+
+    Calls from several threads are multiplexed on the same socket.  If
+    the connection is lost, pending calls fail with :class:`AgentError`,
+    ``generation`` is increased and the next call reconnects.
+    """
+
+    def __init__(self, address, timeout=60):
+        self.family, self.address, self.token = parse_address(address)
+        self.timeout = timeout
+        self.generation = 0
+        self._sock = None
+        self._serial = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def _connect(self, timeout):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.address)
+            send_message(sock, {'id': 0, 'method': 'hello', 'params': {
+                'token': self.token, 'version': PROTOCOL_VERSION}})
+            reply = recv_message(sock)
+        except (EOFError, ValueError, socket.error) as msg:
+            sock.close()
+            raise AgentError('unable to connect to the compute agent at '
+                             '{}: {}'.format(self.address, msg))
+        if 'error' in reply:
+            sock.close()
+            raise AgentError(reply['error'])
+        sock.settimeout(None)
+        self.generation += 1
+        self._sock = sock
+        reader = threading.Thread(target=self._reader, args=(sock,))
+        reader.daemon = True
+        reader.start()
+
+    def _reader(self, sock):
+        try:
+            while True:
+                message = recv_message(sock)
+                with self._lock:
+                    call = self._pending.pop(message.get('id'), None)
+                if call is not None:
+                    call[1] = message
+                    call[0].set()
+        except (EOFError, ValueError, socket.error):
+            self._disconnect(sock)
+
+    def _disconnect(self, sock):
+        with self._lock:
+            if self._sock is not sock:
+                return
+            self._sock = None
+            pending, self._pending = self._pending, {}
+        try:
+            sock.close()
+        except socket.error:
+            pass
+        for call in pending.values():
+            call[1] = {'error': 'connection to the compute agent lost'}
+            call[0].set()
+
+    def call(self, method, timeout=None, **params):
+        """
+        Call ``method`` on the agent and return its result.
+        :class:`AgentTimeout` is raised if there is no answer in
+        ``timeout`` seconds (default: ``self.timeout``).
+        """
+        if timeout is None:
+            timeout = self.timeout
+        with self._lock:
+            if self._sock is None:
+                self._connect(timeout)
+            sock = self._sock
+            self._serial += 1
+            id = self._serial
+            call = self._pending[id] = [threading.Event(), None]
+        try:
+            with self._send_lock:
+                send_message(
+                    sock, {'id': id, 'method': method, 'params': params})
+        except socket.error:
+            self._disconnect(sock)
+        if not call[0].wait(timeout):
+            with self._lock:
+                self._pending.pop(id, None)
+            raise AgentTimeout(
+                'the compute agent did not answer {}'.format(method))
+        reply = call[1]
+        if 'error' in reply:
+            raise AgentError(reply['error'])
+        return reply.get('result')
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def agent_connection(address):
+    """
+    Return the connection to the compute agent at ``address``, shared by
+    all its worksheet processes.
+    """
+    with _connections_lock:
+        try:
+            return _connections[address]
+        except KeyError:
+            connection = _connections[address] = AgentConnection(address)
+            return connection
+
+
+class SageServerAgent(SageServerABC):
+    """
+    A worksheet process running on a compute node, controlled through the
+    compute agent of the node.
+
+    INPUT:
+
+        - ``address`` -- a string; ``agent://[token@]host:port`` or
+          ``agent://[token@]/path/of/unix/socket``.
+
+        - ``process_limits`` -- None or a ProcessLimits objects as defined by
+          the ``sagenb.interfaces.ProcessLimits`` object.
+
+        - ``python`` -- command running python on the compute node.
+
+        - ``init_code`` -- code run when the process starts.
+
+        - ``scheduler`` -- (default: None) a
+          :class:`sagewui.sage_server.scheduler.ServerPoolScheduler`
+          that is notified when this process starts, answers, fails to
+          start or quits.
+
+        - ``scheduled`` -- (default: False) whether ``scheduler`` already
+          counts this process as starting (see
+          :meth:`sagewui.sage_server.scheduler.ServerPoolScheduler.choose`).
+    """
+
+    def __init__(self,
+                 address,
+                 process_limits=None,
+                 python='sage --python',
+                 init_code=None,
+                 scheduler=None,
+                 scheduled=False):
+        # The node known to the scheduler, without the token.
+        self._node = node_label(address)
+        self._connection = None
+        self._kernel = uuid.uuid4().hex
+        self._process_limits = process_limits
+        self._python = python
+        self._init_code = init_code
+        self._scheduler = scheduler
+        self._scheduled = scheduled and scheduler is not None
+        self._spawn_walltime = None
+        self._generation = None
+        self._is_started = False
+        self._is_computing = False
+        self._output = ''
+        self._tempdir = ''
+        self._all_tempdirs = []
+        self._data_files = {}
+
+        try:
+            self._connection = agent_connection(address)
+            self.start()
+        except (AgentError, ValueError):
+            # Give the place in the node back to the scheduler.
+            self.quit()
+            raise
+
+    def __repr__(self):
+        """
+        Return string representation of this worksheet process.
+        """
+        return "Compute agent implementation of worksheet process"
+
+    def __del__(self):
+        try:
+            self._cleanup_tempfiles()
+        except:
+            pass
+
+    def _cleanup_tempfiles(self):
+        for X in self._all_tempdirs:
+            shutil.rmtree(X, ignore_errors=True)
+        self._all_tempdirs = []
+
+    def _call(self, method, timeout=None, **params):
+        return self._connection.call(method, timeout=timeout,
+                                     kernel=self._kernel, **params)
+
+    def start(self):
+        """
+        Start this worksheet process running.
+        """
+        if self._scheduler is not None and not self._scheduled:
+            self._scheduler.kernel_starting(self._node)
+            self._scheduled = True
+        self._spawn_walltime = walltime()
+        self._data_files = {}
+        limits = self._process_limits
+        try:
+            self._call('start',
+                       process_limits=None if limits is None else vars(limits),
+                       python=self._python, init_code=self._init_code)
+        except AgentError:
+            self._start_failed()
+            self._is_started = False
+            raise
+        self._generation = self._connection.generation
+        self._is_started = True
+        self._is_computing = False
+
+    def quit(self):
+        """
+        Quit this worksheet process.
+        """
+        if self.is_started():
+            try:
+                self._call('quit')
+            except AgentError:
+                pass
+        self._is_started = False
+        self._is_computing = False
+        self._cleanup_tempfiles()
+        if self._scheduled:
+            # A process quit before answering is not a failed start.
+            self._scheduler.kernel_stopped(
+                self._node, starting=self._spawn_walltime is not None)
+            self._scheduled = False
+        self._spawn_walltime = None
+
+    def interrupt(self):
+        """
+        Send an interrupt signal to the currently running computation
+        in the controlled process.  This may or may not succeed.  Call
+        ``self.is_computing()`` to find out if it did.
+        """
+        if not self.is_started():
+            return
+        try:
+            self._call('interrupt')
+        except AgentError:
+            pass
+
+    def update(self, children=None):
+        """
+        This should be called periodically by the server processes.
+        It does things like checking for timeouts, etc.  ``children``
+        does not apply to the agent host.
+        """
+        if not self.is_started():
+            return None
+        try:
+            state = self._call('update', timeout=UPDATE_TIMEOUT)
+        except AgentTimeout:
+            # The agent is busy. Try again on the next update.
+            return None
+        except AgentError:
+            self._lost()
+            return None
+        self._update_state(state)
+        return state.get('quit')
+
+    def resource_usage(self, children=None):
+        # The process tree runs on the agent host, where ``children`` does
+        # not apply.
+        if not self.is_started():
+            return None
+        try:
+            return self._call('resource_usage')
+        except AgentError:
+            return None
+
+    def is_computing(self):
+        return self._is_computing
+
+    def is_started(self):
+        return (self._is_started and
+                self._generation == self._connection.generation)
+
+    def _lost(self):
+        self._is_started = False
+        self._is_computing = False
+        self._start_failed()
+        if self._scheduled:
+            self._scheduler.kernel_stopped(self._node)
+            self._scheduled = False
+
+    def _update_state(self, state):
+        if not state['started']:
+            self._lost()
+        elif state['ready'] and self._spawn_walltime is not None:
+            if self._scheduler is not None:
+                self._scheduler.kernel_ready(
+                    self._node, walltime() - self._spawn_walltime)
+            self._spawn_walltime = None
+        elif (self._spawn_walltime is not None and
+              self._scheduler is not None and
+              walltime() - self._spawn_walltime >
+              self._scheduler.start_timeout):
+            self._start_failed()
+
+    def _start_failed(self):
+        if self._spawn_walltime is not None:
+            if self._scheduler is not None:
+                self._scheduler.kernel_failed(self._node)
+            self._spawn_walltime = None
+
+    def _data_update(self, data):
+        """
+        Return the files of the data directory ``data`` changed since the
+        last execution, and the names of all of them.
+        """
+        files = {}
+        names = []
+        for name in os.listdir(data):
+            path = os.path.join(data, name)
+            if not os.path.isfile(path):
+                continue
+            names.append(name)
+            key = _file_key(path)
+            if self._data_files.get(name) != key:
+                files[name] = _read_file(path)
+                self._data_files[name] = key
+        for name in set(self._data_files) - set(names):
+            del self._data_files[name]
+        return {'files': files, 'names': names}
+
+    def execute(self, code, data=None, mode='sage', print_time=False):
+        """
+        Start executing the given code in this subprocess.
+
+        INPUT:
+
+            - ``code`` -- a code containing code to be executed.
+
+            - ``data`` -- a code or None; if given, must specify an
+              absolute path on the server host filesystem.  Its files
+              are copied to the data directory of the worksheet process.
+        """
+        if not self.is_started():
+            self.start()
+
+        params = {'code': code, 'mode': mode, 'print_time': print_time}
+        if mode != 'raw':
+            # One local directory receives the files of every execution.
+            # The worksheet moves them out when the execution is done.
+            if not os.path.isdir(self._tempdir):
+                self._tempdir = tempfile.mkdtemp()
+                self._all_tempdirs.append(self._tempdir)
+            for name in os.listdir(self._tempdir):
+                path = os.path.join(self._tempdir, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.unlink(path)
+            self._output = ''
+            self._is_computing = True
+            if data is not None:
+                params['data'] = self._data_update(data)
+
+        try:
+            self._call('execute', **params)
+        except AgentError as msg:
+            self._is_computing = False
+            self._output = str(msg)
+
+    def output_status(self):
+        """
+        Return OutputStatus object, which includes output from the
+        subprocess from the last executed command up until now,
+        information about files that were created, and whether
+        computing is now done.
+
+        The files created since the last call are copied from the compute
+        node to a local temporary directory.
+
+        OUTPUT:
+
+            - ``OutputStatus`` object.
+        """
+        if not self._is_computing:
+            return OutputStatus(self._output, [], True)
+        try:
+            status = self._call('output_status')
+        except AgentError:
+            self._lost()
+            raise
+
+        for name, data in status['files']:
+            path = os.path.join(self._tempdir, name)
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            _write_file(path, data)
+
+        self._update_state(status)
+        self._output = status['output']
+        self._is_computing = not status['done']
+        files = []
+        if os.path.exists(self._tempdir):
+            files = [os.path.join(self._tempdir, x)
+                     for x in os.listdir(self._tempdir)]
+        return OutputStatus(self._output, files, status['done'])
+
+
+# Agent side
+
+class AgentKernel(object):
+    """
+    A worksheet process run by the compute agent.
+    """
+
+    def __init__(self, process_limits=None, python='sage --python',
+                 init_code=None, sage_code=None):
+        self.lock = threading.Lock()
+        self.data_dir = os.path.join(tempfile.mkdtemp(), 'data')
+        os.mkdir(self.data_dir)
+        if process_limits is not None:
+            process_limits = ProcessLimits(**process_limits)
+        # DATA in init_code is the directory in the notebook server.
+        init_code = '\n'.join((
+            init_code or '',
+            "DATA = '{}'".format(self.data_dir),
+            'sys.path.append(DATA)',
+            ))
+        self.sent = {}
+        try:
+            self.sage = SageServerExpect(process_limits=process_limits,
+                                         python=python, init_code=init_code,
+                                         sage_code=sage_code)
+        except RuntimeError:
+            shutil.rmtree(os.path.dirname(self.data_dir), ignore_errors=True)
+            raise
+
+    def state(self):
+        return {'started': self.sage.is_started(),
+                'ready': self.sage.is_ready()}
+
+    def execute(self, code, mode, print_time, data=None):
+        if data is not None:
+            for name, content in data['files'].items():
+                _write_file(os.path.join(self.data_dir, name), content)
+            for name in set(os.listdir(self.data_dir)) - set(data['names']):
+                os.unlink(os.path.join(self.data_dir, name))
+        self.sent = {}
+        self.sage.execute(code, self.data_dir if data is not None else None,
+                          mode=mode, print_time=print_time)
+
+    def output_status(self):
+        status = self.sage.output_status()
+        files = []
+        for path in status.filenames:
+            top = os.path.dirname(path)
+            if os.path.isdir(path):
+                paths = [os.path.join(dirpath, name)
+                         for dirpath, dirnames, filenames in os.walk(path)
+                         for name in filenames]
+            else:
+                paths = [path]
+            for path in paths:
+                try:
+                    key = _file_key(path)
+                    name = os.path.relpath(path, top)
+                    if self.sent.get(name) != key:
+                        files.append((name, _read_file(path)))
+                        self.sent[name] = key
+                except (IOError, OSError):
+                    # Removed while we were looking at it.
+                    pass
+        if status.done:
+            # Everything has been sent to the notebook server.
+            for path in status.filenames:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+        state = self.state()
+        state.update({'output': status.output, 'done': status.done,
+                      'files': files})
+        return state
+
+    def quit(self):
+        self.sage.quit()
+        shutil.rmtree(os.path.dirname(self.data_dir), ignore_errors=True)
+
+
+class AgentSession(object):
+    """
+    A connection from a notebook server to the compute agent, and the
+    worksheet processes started through it.
+    """
+
+    def __init__(self, agent, sock):
+        self.agent = agent
+        self.sock = sock
+        self.kernels = {}
+        self.send_lock = threading.Lock()
+
+    def run(self):
+        try:
+            message = recv_message(self.sock)
+            params = message.get('params', {})
+            if (message.get('method') != 'hello' or
+                    not self.agent.check_token(params.get('token'))):
+                self.reply(message, error='authentication failed')
+                return
+            self.reply(message, result={'version': PROTOCOL_VERSION})
+            while True:
+                self.agent.jobs.put((self, recv_message(self.sock)))
+        except (EOFError, ValueError, socket.error):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+        for kernel in list(self.kernels.values()):
+            with kernel.lock:
+                kernel.quit()
+        self.kernels.clear()
+
+    def reply(self, message, result=None, error=None):
+        reply = {'id': message.get('id')}
+        if error is not None:
+            reply['error'] = error
+        else:
+            reply['result'] = result
+        try:
+            with self.send_lock:
+                send_message(self.sock, reply)
+        except socket.error:
+            pass
+
+    def handle(self, message):
+        params = dict(message.get('params', {}))
+        method = message.get('method')
+        id = params.pop('kernel', None)
+        kernel = self.kernels.get(id)
+        try:
+            if method == 'start':
+                if kernel is not None:
+                    with kernel.lock:
+                        self.kernels.pop(id, None)
+                        kernel.quit()
+                params['sage_code'] = self.agent.sage_code
+                self.kernels[id] = AgentKernel(**params)
+                return self.reply(message, result=True)
+            if kernel is None:
+                return self.reply(message, error='unknown worksheet process')
+            with kernel.lock:
+                if method == 'execute':
+                    kernel.execute(**params)
+                    result = True
+                elif method == 'output_status':
+                    result = kernel.output_status()
+                elif method == 'interrupt':
+                    kernel.sage.interrupt()
+                    result = True
+                elif method == 'resource_usage':
+                    result = kernel.sage.resource_usage()
+                elif method == 'update':
+                    reason = kernel.sage.update()
+                    result = kernel.state()
+                    result['quit'] = reason
+                elif method == 'quit':
+                    self.kernels.pop(id, None)
+                    kernel.quit()
+                    result = True
+                else:
+                    raise ValueError('unknown method {}'.format(method))
+        except Exception as msg:
+            return self.reply(message, error='{}: {}'.format(
+                type(msg).__name__, msg))
+        self.reply(message, result=result)
+
+
+class ComputeAgent(object):
+    """
+    The compute agent daemon.
+
+    INPUT:
+
+        - ``address`` -- a string; ``host:port`` or the path of a Unix
+          socket.
+
+        - ``token`` -- (default: None) a string that notebook servers must
+          send to connect.
+
+        - ``workers`` -- an integer (default: 8); number of requests served
+          at the same time.
+
+        - ``sage_code`` -- (default: None) directory of the worksheet
+          process initialization scripts.
+    """
+
+    def __init__(self, address, token=None, workers=8, sage_code=None):
+        self.family, self.address = parse_address(address)[:2]
+        self.token = token
+        self.sage_code = sage_code
+        self.jobs = Queue()
+        for i in range(workers):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+
+    def check_token(self, token):
+        if self.token is None:
+            return True
+        return hmac.compare_digest(
+            (token or '').encode('utf-8'), self.token.encode('utf-8'))
+
+    def _worker(self):
+        while True:
+            session, message = self.jobs.get()
+            session.handle(message)
+
+    def serve_forever(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.address)
+        if self.family == socket.AF_UNIX:
+            os.chmod(self.address, 0o600)
+        sock.listen(16)
+        try:
+            while True:
+                connection = sock.accept()[0]
+                session = AgentSession(self, connection)
+                thread = threading.Thread(target=session.run)
+                thread.daemon = True
+                thread.start()
+        finally:
+            sock.close()
+            if self.family == socket.AF_UNIX:
+                os.unlink(self.address)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Sage notebook compute agent')
+    parser.add_argument(
+        '--listen',
+        dest='listen',
+        default='localhost:8765',
+        help='host:port or path of the Unix socket to listen at',
+        )
+    parser.add_argument(
+        '--token_file',
+        dest='token_file',
+        default=None,
+        help='file containing the token notebook servers must send',
+        )
+    parser.add_argument(
+        '--no_token',
+        dest='no_token',
+        action='store_true',
+        help='listen at a TCP address reachable from other hosts without '
+             'a token',
+        )
+    parser.add_argument(
+        '--sage_code',
+        dest='sage_code',
+        default=None,
+        help='directory of the worksheet process initialization scripts',
+        )
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        default=8,
+        type=int,
+        help='number of requests served at the same time',
+        )
+    args = parser.parse_args(args)
+
+    token = None
+    if args.token_file is not None:
+        with open(args.token_file) as f:
+            token = f.read().strip()
+    elif not is_loopback(args.listen):
+        if not args.no_token:
+            parser.error('anybody reaching {} could run code as {}. Use '
+                         '--token_file, or --no_token if this is '
+                         'intended.'.format(args.listen,
+                                            os.environ.get('USER')))
+        print('WARNING: anybody reaching {} can run code as {}.'.format(
+            args.listen, os.environ.get('USER')), file=sys.stderr)
+
+    agent = ComputeAgent(args.listen, token=token, workers=args.workers,
+                         sage_code=args.sage_code)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -27,9 +27,11 @@ from builtins import chr
 from builtins import object
 from builtins import str
 
+import codecs
+import json
 import os
-import re
 import shutil
+import signal
 import stat
 import tempfile
 from time import time as walltime
@@ -38,6 +40,45 @@ from base64 import b64encode
 
 import pexpect
 
+from .output import MAX_OUTPUT
+from .output import MAX_OUTPUT_LINES
+from .output import OutputSink
+from .telemetry import tree_usage
+
+# Marks the line with the status of an execution printed by the worksheet
+# process after its output. It must be the same as in
+# sage_code/support.py.
+STATUS_TRAILER = '___SAGE_STATUS___'
+# Longest status line held back from the output of an execution until the
+# prompt arrives.  A longer one is taken as output.
+MAX_STATUS = 1 << 16
+# The whole output of an execution too long to be kept in memory is
+# written to this file of its temporary directory.
+FULL_OUTPUT = 'full_output.txt'
+
+
+def split_status_trailer(output):
+    """
+    Return a tuple ``(output, status)`` with the output of an execution
+    without the status trailer, and the status dictionary (or None if
+    there is no trailer).
+    """
+    i = output.rfind(STATUS_TRAILER)
+    if i == -1:
+        return output, None
+    try:
+        status = json.loads(
+            output[i + len(STATUS_TRAILER):].split('\n', 1)[0].strip())
+    except ValueError:
+        return output, None
+    output = output[:i]
+    # Remove the newline printed before the trailer
+    for newline in ('\r\n', '\n'):
+        if output.endswith(newline):
+            output = output[:-len(newline)]
+            break
+    return output, status
+
 
 class SageServerABC(object):
     """
@@ -84,12 +125,29 @@ class SageServerABC(object):
         """
         raise NotImplementedError
 
-    def update(self):
+    def update(self, children=None):
         """
-        Update this worksheet process
+        Update this worksheet process.
+
+        INPUT:
+
+            - ``children`` -- (default: None) passed to
+              :meth:`resource_usage`.
+
+        OUTPUT:
+
+            - None, or a string with the reason why the process has been
+              quit (e.g. ``'walltime'``).
         """
         # default implementation is to do nothing.
 
+    def pid(self):
+        """
+        Return the id of the controlled process in this machine, or None
+        if it is not running here.
+        """
+        return None
+
     def is_computing(self):
         """
         Return True if a computation is currently running in this worksheet
@@ -139,6 +197,29 @@ class SageServerABC(object):
         """
         raise NotImplementedError
 
+    def resource_usage(self, children=None):
+        """
+        Return the resource usage of the process tree of this worksheet
+        process (see :func:`sagewui.sage_server.telemetry.tree_usage`), or
+        None if it is not available.
+
+        INPUT:
+
+            - ``children`` -- (default: None) the result of
+              :func:`sagewui.sage_server.telemetry.children_map`, to be
+              shared by several calls.  It is read from ``/proc`` if None.
+        """
+        return None
+
+    def interact_stats(self):
+        """
+        Return the interact state statistics reported by the worksheet
+        process after the last execution (a dictionary with the number of
+        ``cells`` and their approximate size in ``bytes``), or None if
+        they are not known.
+        """
+        return None
+
 
 class SageServerExpect(SageServerABC):
     """
@@ -149,7 +230,23 @@ class SageServerExpect(SageServerABC):
           the ``sagenb.interfaces.ProcessLimits`` object.
     """
 
-    modes = ['raw', 'python', 'sage']
+    # raw code is executed without output, exec code is executed as is,
+    # python code is reformatted and sage code is preparsed.
+    modes = ['raw', 'exec', 'python', 'sage']
+    # Seconds between two looks for new files in the temporary directory
+    # while computing.
+    files_interval = 1
+    # Code whose base64 encoding is longer is passed to the worksheet
+    # process in a file (None for no limit).
+    max_inline_code = 4096
+    # Bytes read from the worksheet process at most on each look for its
+    # output, so that a process printing without end can't hold the server.
+    max_read = 4 * 1024 ** 2
+    # Output of an execution longer than this number of characters or
+    # lines is truncated, and written whole to FULL_OUTPUT (None for no
+    # limit).
+    max_output = MAX_OUTPUT
+    max_output_lines = MAX_OUTPUT_LINES
 
     def __init__(self,
                  process_limits=None,
@@ -169,12 +266,24 @@ class SageServerExpect(SageServerABC):
         self._all_tempdirs = []
         self._process_limits = process_limits
         self._max_walltime = None
+        self._max_cputime = None
         self._start_walltime = None
         self._data_dir = None
         self._python = python
-        self._so_far = ''
+        self._decoder = None
+        self._sink = None  # output of the last execution
+        self._held = ''  # output not yet known not to be the label/trailer
+        self._output_started = False  # the start label has been read
+        self._status = None  # status trailer of the last execution
+        self._ready_window = ''
         self._start_label = None
         self._tempdir = ''
+        self._scratch = None
+        self._inbox = None
+        self._files = []
+        self._files_walltime = 0
+        self._interact_stats = None
+        self._is_ready = False
 
         if sage_code is None:
             sage_code = os.path.join(os.path.split(__file__)[0], 'sage_code')
@@ -210,6 +319,8 @@ class SageServerExpect(SageServerABC):
 
         if process_limits and process_limits.max_walltime:
             self._max_walltime = process_limits.max_walltime
+        if process_limits and process_limits.max_cputime:
+            self._max_cputime = process_limits.max_cputime
         self.execute(init_code, mode='raw')
         self.execute('print("INIT OK")', mode='python')
 
@@ -248,13 +359,19 @@ class SageServerExpect(SageServerABC):
         Send an interrupt signal to the currently running computation
         in the controlled process.  This may or may not succeed.  Call
         ``self.is_computing()`` to find out if it did.
+
+        The signal is sent to the whole process group, so that it also
+        reaches the subprocesses, and this returns immediately.
         """
         if self._expect is None:
             return
         try:
-            self._expect.sendline(chr(3))
-        except:
-            pass
+            os.killpg(self._expect.pid, signal.SIGINT)
+        except OSError:
+            try:
+                self._expect.sendline(chr(3))
+            except:
+                pass
 
     def quit(self):
         """
@@ -267,17 +384,28 @@ class SageServerExpect(SageServerABC):
             self._expect.sendline('quit_sage()')
         except:
             pass
-        try:
-            os.killpg(self._expect.pid, 9)
-            os.kill(self._expect.pid, 9)
-        except OSError:
-            pass
+        # The process may have already left its process group. Whatever
+        # survives is killed by the watchdog (see
+        # sagewui.sage_server.watchdog).
+        for kill in (os.killpg, os.kill):
+            try:
+                kill(self._expect.pid, signal.SIGKILL)
+            except OSError:
+                pass
         self._expect = None
         self._is_started = False
         self._is_computing = False
         self._start_walltime = None
+        if self._sink is not None:
+            if self._output_started:
+                self._sink.write(self._held)
+            self._held = ''
+            self._sink.close()
         self._cleanup_tempfiles()
         self._cleanup_data_dir()
+        self._scratch = None
+        self._inbox = None
+        self._interact_stats = None
 
     def start(self):
         """
@@ -285,28 +413,48 @@ class SageServerExpect(SageServerABC):
         """
         self._expect = pexpect.spawn(self.command())
         self._expect.setecho(False)
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
         self._is_started = True
+        self._is_ready = False
+        self._ready_window = ''
         self._is_computing = False
         self._number = 0
         self._read()
         self._start_walltime = walltime()
 
-    def update(self):
+    def update(self, children=None):
         """
         This should be called periodically by the server processes.
         It does things like checking for timeouts, etc.
         """
-        self._check_for_walltimeout()
+        return self._check_for_limits(children)
 
-    def _check_for_walltimeout(self):
+    def _check_for_limits(self, children=None):
         """
-        Check if the walltimeout has been reached, and if so, kill
-        this worksheet process.
+        Check if the walltime or the CPU time limits have been reached,
+        and if so, kill this worksheet process.
+
+        The CPU time limit is also enforced by the kernel for each process
+        (see :class:`ProcessLimits`), but here it applies to the whole
+        process tree.
+
+        OUTPUT:
+
+            - None, ``'walltime'`` or ``'cputime'``.
         """
-        if (self._is_started and
-                self._max_walltime and self._start_walltime and
+        if not self._is_started:
+            return None
+        reason = None
+        if (self._max_walltime and self._start_walltime and
                 walltime() - self._start_walltime > self._max_walltime):
+            reason = 'walltime'
+        elif self._max_cputime:
+            usage = self.resource_usage(children)
+            if usage is not None and usage['cpu_time'] > self._max_cputime:
+                reason = 'cputime'
+        if reason is not None:
             self.quit()
+        return reason
 
     def is_computing(self):
         """
@@ -329,6 +477,42 @@ class SageServerExpect(SageServerABC):
         """
         return self._is_started
 
+    def pid(self):
+        """
+        Return the id of the controlled process, or None if it is not
+        running.
+        """
+        if self._expect is None:
+            return None
+        return self._expect.pid
+
+    def resource_usage(self, children=None):
+        pid = self.pid()
+        if pid is None:
+            return None
+        return tree_usage(pid, children)
+
+    def interact_stats(self):
+        return self._interact_stats
+
+    def _died(self):
+        """
+        Called when the worksheet process has exited by itself, before
+        it is quit.
+        """
+        pass
+
+    def is_ready(self):
+        """
+        Return True if this worksheet subprocess has already run its
+        initialization code.
+
+        OUTPUT:
+
+            - ``bool``
+        """
+        return self._is_ready
+
     def get_tmpdir(self):
         """
         Return two strings (local, remote), where local is the name
@@ -347,6 +531,55 @@ class SageServerExpect(SageServerABC):
         s = tempfile.mkdtemp()
         return (s, s)
 
+    def _scratch_dirs(self):
+        """
+        Return the (local, remote) temporary directories where the code is
+        executed (see :meth:`get_tmpdir`).  They are created once and
+        reused by every execution.
+        """
+        if self._scratch is None or not os.path.isdir(self._scratch[0]):
+            self._scratch = self.get_tmpdir()
+            self._all_tempdirs.append(self._scratch[0])
+        return self._scratch
+
+    def _code_file(self, code):
+        """
+        Write ``code`` (bytes) to a new file in a temporary directory that the
+        worksheet process can read (see :meth:`get_tmpdir`) and return
+        its name in the worksheet process machine.  The worksheet process
+        removes it.
+        """
+        if self._inbox is None or not os.path.isdir(self._inbox[0]):
+            self._inbox = self.get_tmpdir()
+            self._all_tempdirs.append(self._inbox[0])
+        local, remote = self._inbox
+        fd, path = tempfile.mkstemp(suffix='.py', dir=local)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(code)
+        os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IROTH |
+                 stat.S_IRGRP)
+        return os.path.join(remote, os.path.basename(path))
+
+    def _clean_scratch(self, data=None):
+        """
+        Remove the files left in the local temporary directory by the
+        previous execution, except the link to ``data``.
+        """
+        local = self._scratch[0]
+        for name in os.listdir(local):
+            path = os.path.join(local, name)
+            if os.path.islink(path):
+                if data is not None and os.readlink(path) == data:
+                    continue
+                os.unlink(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
     def execute(self, code, data=None, mode='sage', print_time=False):
         """
         Start executing the given code in this subprocess.
@@ -367,48 +600,133 @@ class SageServerExpect(SageServerABC):
                 "unable to start subprocess using command '%s'" % self.command(
                     ))
 
+        tempdir = None
         if mode != 'raw':
             self._number += 1
             self._start_label = 'START{}'.format(self._number)
-            local, remote = self.get_tmpdir()
-            code = '_support_.os.chdir("{}")\n{}'.format(remote, code)
+            local, tempdir = self._scratch_dirs()
+            self._clean_scratch(data)
             if data is not None:
                 # make a symbolic link from the data directory into local tmp
                 # directory
                 self._data = os.path.split(data)[1]
                 self._data_dir = data
                 os.chmod(data, stat.S_IRWXO | stat.S_IRWXU | stat.S_IRWXG)
-                os.symlink(data, os.path.join(local, self._data))
+                link = os.path.join(local, self._data)
+                if not os.path.lexists(link):
+                    os.symlink(data, link)
             else:
                 self._data = ''
 
             self._tempdir = local
-            self._so_far = ''
+            self._files = []
+            self._files_walltime = walltime()
+            self._sink = OutputSink(os.path.join(local, FULL_OUTPUT),
+                                    self.max_output, self.max_output_lines)
+            self._held = ''
+            self._output_started = False
+            self._status = None
             self._is_computing = True
 
-            self._all_tempdirs.append(self._tempdir)
-
         try:
+            code = code.encode('utf-8')
+            code_file = None
+            # Length of the base64 encoding
+            if (self.max_inline_code and
+                    4 * ((len(code) + 2) // 3) > self.max_inline_code):
+                code_file = self._code_file(code)
+                code = ''
+            else:
+                code = b64encode(code).decode('utf-8')
+            # The worksheet process runs the code in tempdir and reports
+            # the files created there (see split_status_trailer).
             self._expect.sendline(
                 '_support_.execute_code('
                 '"{}", globals(), mode="{}", start_label="{}", '
-                'print_time={})'.format(
-                    b64encode(code.encode('utf-8')).decode('utf-8'),
-                    mode, self._start_label, print_time))
+                'print_time={}, tempdir={}, code_file={})'.format(
+                    code, mode, self._start_label, print_time,
+                    'None' if tempdir is None else '"{}"'.format(tempdir),
+                    'None' if code_file is None else '"{}"'.format(code_file)
+                    ))
         except OSError as msg:
             self._is_computing = False
-            self._so_far = str(msg)
+            if self._sink is not None:
+                self._sink.write(str(msg))
+                self._sink.close()
 
     def _read(self):
+        """
+        Read the output of the worksheet process available now, waiting
+        for it at most the timeout.
+        """
+        if self._expect is None:
+            return
+        size = 0
+        timeout = self._timeout
         try:
-            self._expect.expect(pexpect.EOF, self._timeout)
+            while size < self.max_read:
+                data = self._expect.read_nonblocking(self._expect.maxread,
+                                                     timeout)
+                size += len(data)
+                timeout = 0
+                self._received(self._decoder.decode(data))
+        except pexpect.TIMEOUT:
+            pass
+        except pexpect.EOF:
             # got EOF subprocess must have crashed; cleanup
             print("got EOF subprocess must have crashed...")
-            print(self._expect.before)
+            self._died()
             self.quit()
-        except:
+        except (pexpect.ExceptionPexpect, OSError, ValueError):
             pass
 
+    def _received(self, text):
+        """
+        Parse ``text``, the next output of the worksheet process.  The
+        output of an execution, between its start label and the status
+        trailer, goes to its sink as it arrives.
+        """
+        if not self._is_ready:
+            window = self._ready_window + text
+            self._is_ready = 'INIT OK' in window
+            self._ready_window = window[-len('INIT OK'):]
+        if self._sink is None or not self._is_computing:
+            return
+
+        text = self._held + text
+        self._held = ''
+        if not self._output_started:
+            i = text.find(self._start_label)
+            if i == -1:
+                self._held = text[-len(self._start_label):]
+                return
+            text = text[i + len(self._start_label):]
+            self._output_started = True
+
+        i = text.find(self._prompt)
+        if i != -1:
+            text, self._status = split_status_trailer(text[:i])
+            self._sink.write(text)
+            self._sink.close()
+            self._is_computing = False
+            return
+        # What may be the beginning of the trailer or the prompt is held
+        # until the next output: the last trailer, if nothing but the
+        # beginning of the prompt follows its line, or else the last
+        # characters.  Anything else printed by the execution goes to the
+        # sink, even if it contains the trailer.
+        i = text.rfind(STATUS_TRAILER)
+        if i != -1:
+            j = text.find('\n', i)
+            if (len(text) - i > MAX_STATUS or
+                    j != -1 and len(text) - j - 1 >= len(self._prompt)):
+                i = -1
+        if i == -1:
+            i = len(text) - len(STATUS_TRAILER) - len(self._prompt)
+        i = max(0, i - 2)
+        self._sink.write(text[:i])
+        self._held = text[i:]
+
     def output_status(self):
         """
         Return OutputStatus object, which includes output from the
@@ -416,6 +734,9 @@ class SageServerExpect(SageServerABC):
         information about files that were created, and whether
         computing is now done.
 
+        Output too long is truncated, with a link to the file with the
+        whole of it (see :class:`sagewui.sage_server.output.OutputSink`).
+
         OUTPUT:
 
             - ``OutputStatus`` object.
@@ -423,29 +744,30 @@ class SageServerExpect(SageServerABC):
         self._read()
         if self._expect is None:
             self._is_computing = False
-        else:
-            self._so_far = self._expect.before.decode('utf-8')
-
-        v = re.findall('{}.*{}'.format(self._start_label, self._prompt),
-                       self._so_far, re.DOTALL)
-        if len(v) > 0:
-            self._is_computing = False
-            s = v[0][len(self._start_label):-len(self._prompt)]
-        else:
-            v = re.findall('{}.*'.format(self._start_label),
-                           self._so_far, re.DOTALL)
-            if len(v) > 0:
-                s = v[0][len(self._start_label):]
-            else:
-                s = ''
 
-        if s.endswith(self._prompt):
-            s = s[:-len(self._prompt)]
-
-        files = []
-        if os.path.exists(self._tempdir):
-            files = [os.path.join(self._tempdir, x) for x in os.listdir(
-                self._tempdir) if x != self._data]
+        s = ''
+        if self._sink is not None:
+            s = self._sink.getvalue(url='cell://{}'.format(FULL_OUTPUT))
+
+        status = None
+        if not self._is_computing:
+            status = self._status
+        if status is not None:
+            self._files = status['files']
+            self._interact_stats = status.get('interact')
+        elif (not self._is_computing or
+                walltime() - self._files_walltime >= self.files_interval):
+            self._files_walltime = walltime()
+            self._files = []
+            if os.path.exists(self._tempdir):
+                self._files = os.listdir(self._tempdir)
+        if (not self._is_computing and self._sink is not None and
+                self._sink.truncated and self._sink.spill is not None and
+                FULL_OUTPUT not in self._files):
+            # Created here after the worksheet process listed its files.
+            self._files.append(FULL_OUTPUT)
+        files = [os.path.join(self._tempdir, x) for x in self._files
+                 if x != self._data]
 
         return OutputStatus(s, files, not self._is_computing)
 
@@ -492,14 +814,35 @@ class SageServerExpectRemote(SageServerExpect):
 
         - ``process_limits`` -- None or a ProcessLimits objects as defined by
           the ``sagenb.interfaces.ProcessLimits`` object.
+
+        - ``remote_command`` -- (default: ``'ssh -t {user_at_host}
+          "{command}"'``) template of the command that runs the worksheet
+          process on the remote machine.  A local stand-in, as ``'sh -c
+          "{command}"'``, can be used for testing.
+
+        - ``scheduler`` -- (default: None) a
+          :class:`sagewui.sage_server.scheduler.ServerPoolScheduler`
+          that is notified when this process starts, answers, fails to
+          start or quits.
+
+        - ``scheduled`` -- (default: False) whether ``scheduler`` already
+          counts this process as starting (see
+          :meth:`sagewui.sage_server.scheduler.ServerPoolScheduler.choose`).
     """
 
     def __init__(self,
                  user_at_host,
                  local_directory=None,
                  remote_directory=None,
+                 remote_command='ssh -t {user_at_host} "{command}"',
+                 scheduler=None,
+                 scheduled=False,
                  **kwargs):
         self._user_at_host = user_at_host
+        self._remote_command = remote_command
+        self._scheduler = scheduler
+        self._spawn_walltime = None
+        self._scheduled = scheduled and scheduler is not None
 
         if local_directory is None:
             local_directory = os.environ.get("SAGENB_TMPDIR")
@@ -513,11 +856,96 @@ class SageServerExpectRemote(SageServerExpect):
             remote_directory = local_directory
         self._remote_directory = remote_directory
 
-        SageServerExpect.__init__(self, **kwargs)
+        try:
+            SageServerExpect.__init__(self, **kwargs)
+        except (RuntimeError, pexpect.ExceptionPexpect, OSError):
+            # Give the place in the node back to the scheduler.
+            self._start_failed()
+            self.quit()
+            raise
 
     def command(self):
-        return 'ssh -t {} "{}"'.format(
-            self._user_at_host, SageServerExpect.command(self))
+        return self._remote_command.format(
+            user_at_host=self._user_at_host,
+            command=SageServerExpect.command(self))
+
+    def resource_usage(self, children=None):
+        # The process tree runs on another machine.
+        return None
+
+    def interrupt(self):
+        # The process group is the local ssh client. Let the remote
+        # terminal deliver the interrupt.
+        if self._expect is None:
+            return
+        try:
+            self._expect.sendline(chr(3))
+        except:
+            pass
+
+    def start(self):
+        """
+        Start this worksheet process running.
+        """
+        if self._scheduler is not None and not self._scheduled:
+            self._scheduler.kernel_starting(self._user_at_host)
+            self._scheduled = True
+        self._spawn_walltime = walltime()
+        try:
+            SageServerExpect.start(self)
+        except pexpect.ExceptionPexpect:
+            self._start_failed()
+            raise
+
+    def quit(self):
+        """
+        Quit this worksheet process.
+        """
+        SageServerExpect.quit(self)
+        if self._scheduled:
+            # A process quit before answering is not a failed start.
+            self._scheduler.kernel_stopped(
+                self._user_at_host, starting=self._spawn_walltime is not None)
+            self._scheduled = False
+        self._spawn_walltime = None
+
+    def _died(self):
+        # The process died before answering (e.g. ssh could not connect).
+        self._start_failed()
+
+    def update(self, children=None):
+        reason = SageServerExpect.update(self, children)
+        self._check_for_start()
+        return reason
+
+    def output_status(self):
+        status = SageServerExpect.output_status(self)
+        self._check_for_start()
+        return status
+
+    def _check_for_start(self):
+        """
+        Report to the scheduler whether the process has answered, or has
+        taken too long to do it.  The output is not read here: it is read
+        by :meth:`output_status`, with the lock of the worksheet held.
+        """
+        if self._spawn_walltime is None or self._expect is None:
+            return
+        if self.is_ready():
+            if self._scheduler is not None:
+                self._scheduler.kernel_ready(
+                    self._user_at_host, walltime() - self._spawn_walltime)
+            self._spawn_walltime = None
+        elif (self._scheduler is not None and
+              walltime() - self._spawn_walltime >
+              self._scheduler.start_timeout):
+            self._start_failed()
+
+    def _start_failed(self):
+        if self._spawn_walltime is not None:
+            if self._scheduler is not None:
+                self._scheduler.kernel_failed(self._user_at_host)
+            self._spawn_walltime = None
 
     def get_tmpdir(self):
         """
@@ -0,0 +1,181 @@
+"""
+sage_server output
+
+Bounded capture of the output of an execution.  A computation may print
+without end, so only the beginning and the end of its output are kept in
+memory, and the whole of it is streamed to a file as it arrives.
+
+AUTHORS:
+
+  - J Miguel Farto
+"""
+
+#############################################################################
+#
+#       Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  The full text of the GPL is available at:
+#                  http://www.gnu.org/licenses/
+#
+#############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+from builtins import open
+
+from collections import deque
+
+# Maximum number of characters and lines of the output shown in a cell.
+# This is needed to avoid overloading the web browser.  For example, it
+# should be possible to gracefully survive:
+#    while True:
+#       print("hello world")
+# On the other hand, we don't want to lose the output of big matrices and
+# numbers, so don't make this too small.  Longer outputs are truncated to
+# the first and the last halves of them.
+MAX_OUTPUT = 32000
+MAX_OUTPUT_LINES = 120
+
+TRUNCATED = 'WARNING: Output truncated!  '
+
+
+def output_head(text, max_output=MAX_OUTPUT, max_lines=MAX_OUTPUT_LINES):
+    """
+    Return the first half of the lines and characters allowed of ``text``.
+    """
+    i = -1
+    for _ in range(max_lines // 2):
+        i = text.find('\n', i + 1)
+        if i == -1:
+            i = len(text[:-1]) if text.endswith('\n') else len(text)
+            break
+    return text[:i][:max_output // 2]
+
+
+def output_tail(text, max_output=MAX_OUTPUT, max_lines=MAX_OUTPUT_LINES):
+    """
+    Return the last half of the lines and characters allowed of ``text``.
+    """
+    if text.endswith('\n'):
+        text = text[:-1]
+    i = len(text)
+    for _ in range(max_lines // 2):
+        i = text.rfind('\n', 0, i)
+        if i == -1:
+            break
+    return text[i + 1:][-(max_output // 2):]
+
+
+def truncated_output(head, tail, url=None):
+    """
+    Return the text shown for an output truncated to ``head`` and
+    ``tail``, with a link to ``url`` (the full output), if given.
+    """
+    warning = TRUNCATED
+    if url is not None:
+        warning += ("\n<html><a target='_new' href='{}' class='file_link'>"
+                    "full_output.txt</a></html>\n".format(url))
+    return '{}\n\n{}\n\n...\n\n{}'.format(warning, head, tail)
+
+
+class OutputSink(object):
+    """
+    Output of an execution, kept whole while it is within ``max_output``
+    characters and ``max_lines`` lines.  Beyond that, only its head and
+    a ring of its last ``max_output // 2`` characters are kept, and the
+    whole output is written to ``spill``.
+
+    INPUT:
+
+        - ``spill`` -- (default: None) a filename.  It is only created if
+          the output is too long.
+
+        - ``max_output`` -- an integer (default: ``MAX_OUTPUT``), or None
+          for no limit.
+
+        - ``max_lines`` -- an integer (default: ``MAX_OUTPUT_LINES``).
+    """
+
+    def __init__(self, spill=None, max_output=MAX_OUTPUT,
+                 max_lines=MAX_OUTPUT_LINES):
+        self.spill = spill
+        self.max_output = max_output
+        self.max_lines = max_lines
+        self.size = 0  # characters written
+        self.lines = 0  # newlines written
+        self.head = None  # set when the output is truncated
+        self._chunks = deque()  # the whole output or its tail
+        self._length = 0  # characters in _chunks
+        self._file = None
+
+    @property
+    def truncated(self):
+        return self.head is not None
+
+    def write(self, text):
+        """
+        Append ``text`` to the output.
+        """
+        if not text:
+            return
+        self.size += len(text)
+        self.lines += text.count('\n')
+        self._chunks.append(text)
+        self._length += len(text)
+        if self.head is None:
+            if self.max_output is None or (self.size <= self.max_output and
+                                           self.lines <= self.max_lines):
+                return
+            text = ''.join(self._chunks)
+            self._chunks = deque((text,))
+            self.head = output_head(text, self.max_output, self.max_lines)
+            if self.spill is not None:
+                try:
+                    self._file = open(self.spill, 'w', encoding='utf-8',
+                                      newline='')
+                except (IOError, OSError):
+                    self.spill = None
+        self._evict()
+
+    def _evict(self):
+        # Keep at least the characters of the tail, and at most twice
+        # as many.
+        keep = self.max_output // 2
+        chunks = self._chunks
+        while len(chunks) > 1 and self._length - len(chunks[0]) >= keep:
+            self._length -= len(chunks[0])
+            self._spill(chunks.popleft())
+        if self._length > 2 * keep:
+            text = ''.join(chunks)
+            self._spill(text[:-keep])
+            self._chunks = deque((text[-keep:],))
+            self._length = keep
+
+    def _spill(self, text):
+        if self._file is not None:
+            self._file.write(text)
+
+    def close(self):
+        """
+        Finish writing the output to ``spill``.
+        """
+        if self._file is not None:
+            for text in self._chunks:
+                self._file.write(text)
+            self._file.close()
+            self._file = None
+
+    def getvalue(self, url=None):
+        """
+        Return the output, or, if it is truncated, its head and tail with
+        a warning and a link to ``url``.
+        """
+        text = ''.join(self._chunks)
+        if self.head is None:
+            return text
+        return truncated_output(
+            self.head, output_tail(text, self.max_output, self.max_lines),
+            url)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*
+r"""
+Code cache
+
+Bounded memo of the preparsed and compiled code of the worksheet process,
+used by :func:`support.execute_code`: re-evaluated cells and interact
+updates send the same code again and again, and its preparsing and
+compilation don't depend on anything else than the preparser settings,
+which are part of the keys.
+
+AUTHORS:
+
+- J Miguel Farto
+"""
+# **************************************************
+# Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#
+# Distributed under the terms of the GNU General Public License (GPL)
+# **************************************************
+from __future__ import absolute_import
+from __future__ import print_function
+
+from collections import OrderedDict
+
+
+class CodeCache(object):
+    """
+    A least recently used memo of functions of code.
+
+    INPUT:
+
+    - ``max_entries`` -- an integer (default: 128).
+
+    - ``max_size`` -- an integer (default: 4 MB); bound of the total
+      length of the code kept.  Code longer than a tenth of it is not
+      kept.
+    """
+
+    def __init__(self, max_entries=128, max_size=4 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (size, value)
+        self._size = 0
+
+    def clear(self):
+        """
+        Forget every entry.
+        """
+        self._entries.clear()
+        self._size = 0
+
+    def get(self, key, code, function):
+        """
+        Return ``function(code)``, computed only if it is not kept for
+        ``(key, code)``.
+        """
+        entry = self._entries.pop((key, code), None)
+        if entry is not None:
+            self._entries[key, code] = entry
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = function(code)
+        size = len(code)
+        if isinstance(value, type(code)):
+            size += len(value)
+        if size * 10 > self.max_size:
+            return value
+        self._entries[key, code] = (size, value)
+        self._size += size
+        while (len(self._entries) > self.max_entries or
+               self._size > self.max_size):
+            self._size -= self._entries.popitem(last=False)[1][0]
+        return value
+
+    def stats(self):
+        """
+        Return a dictionary with the number of ``hits``, ``misses`` and
+        ``entries``, and the ``size`` of the code kept.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._entries), 'size': self._size}
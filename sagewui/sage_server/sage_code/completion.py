@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*
+r"""
+Tab completion
+
+Completion of global names and attributes for :func:`support.completions`.
+Sorted name lists are cached, so that a completion is a binary search for
+the prefix instead of a scan of the namespace:
+
+- the global names (and the builtins) are indexed until the namespace
+  changes (see :meth:`CompletionEngine.invalidate`);
+
+- the attributes (``dir``) of modules and classes are cached by object,
+  and those of other objects by type (and category, for Sage objects),
+  until the classes change.
+
+AUTHORS:
+
+- J Miguel Farto
+"""
+# **************************************************
+# Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#
+# Distributed under the terms of the GNU General Public License (GPL)
+# **************************************************
+from __future__ import absolute_import
+from __future__ import print_function
+
+import bisect
+import types
+import weakref
+from collections import OrderedDict
+
+# Maximum number of completions returned.
+MAX_COMPLETIONS = 500
+
+
+def prefixed(names, prefix):
+    """
+    Return the slice of the sorted list ``names`` that start with
+    ``prefix``.
+    """
+    if not prefix:
+        return names
+    i = bisect.bisect_left(names, prefix)
+    try:
+        # The names starting with prefix are less than its successor.
+        successor = prefix[:-1] + u'%c' % (ord(prefix[-1]) + 1)
+    except (OverflowError, ValueError):
+        j = i
+        while j < len(names) and names[j].startswith(prefix):
+            j += 1
+    else:
+        j = bisect.bisect_left(names, successor, i)
+    return names[i:j]
+
+
+def top(names, k, private=True):
+    """
+    Return the first ``k`` of the sorted ``names``, those not starting
+    with an underscore first.  If ``private`` is False, names starting
+    with an underscore are dropped.
+    """
+    public = []
+    underscored = []
+    for x in names:
+        if x[:1] != '_':
+            public.append(x)
+            if len(public) == k:
+                return public
+        elif private and len(underscored) < k:
+            underscored.append(x)
+    return public + underscored[:k - len(public)]
+
+
+def _reference(obj):
+    # A weak reference to obj or, if it can not have one, a function
+    # returning obj.
+    if obj is None:
+        return None
+    try:
+        return weakref.ref(obj)
+    except TypeError:
+        return lambda: obj
+
+
+class CompletionEngine(object):
+    """
+    Completions of global names and attributes.
+
+    INPUT:
+
+    - ``max_objects`` -- an integer (default: 256); number of attribute
+      lists cached.
+    """
+
+    def __init__(self, max_objects=256):
+        self.max_objects = max_objects
+        self._globals = None  # (namespace, number of names, sorted names)
+        # key -> (version, sorted, set, owner)
+        self._attributes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        """
+        Forget the global names, e.g. after executing code.
+        """
+        self._globals = None
+
+    def global_names(self, globs, builtins=()):
+        """
+        Return the sorted list of the names in ``globs`` and ``builtins``.
+        """
+        n = len(globs) + len(builtins)
+        if (self._globals is None or self._globals[0] is not globs or
+                self._globals[1] != n):
+            self._globals = (globs, n, sorted(set(globs) | set(builtins)))
+        return self._globals[2]
+
+    def complete_global(self, prefix, globs, builtins=(), k=MAX_COMPLETIONS):
+        """
+        Return the first ``k`` names of ``globs`` and ``builtins``
+        starting with ``prefix``.
+        """
+        return top(prefixed(self.global_names(globs, builtins), prefix), k)
+
+    def _key(self, obj):
+        # Return (key, version, owner) for the attribute cache, or None if
+        # the attributes of obj can not be cached. Owner is checked before
+        # using the names, since the id of a collected object is reused.
+        if isinstance(obj, types.ModuleType):
+            return ('module', id(obj)), len(vars(obj)), obj
+        if isinstance(obj, type):
+            return (('class', id(obj)),
+                    tuple(len(vars(c)) for c in obj.__mro__), obj)
+        cls = type(obj)
+        key = cls
+        if getattr(cls, '__dir__', None) not in (
+                None, getattr(object, '__dir__', None)):
+            # The attributes may depend on the object. Sage objects add
+            # those of their category.
+            try:
+                key = (cls, type(obj.category()))
+            except Exception:
+                return None
+        try:
+            mro = cls.__mro__
+        except AttributeError:
+            return None
+        return key, tuple(len(vars(c)) for c in mro), None
+
+    def _attributes_of(self, obj):
+        # Return (shared, own): the sorted attributes of obj shared with
+        # the objects with the same key, and the sorted rest.
+        key = self._key(obj)
+        instance = ()
+        if key is not None:
+            key, version, owner = key
+            if owner is None:
+                instance = getattr(obj, '__dict__', None) or ()
+            cached = self._attributes.pop(key, None)
+            if (cached is not None and cached[0] == version and
+                    (owner is None or cached[3]() is owner)):
+                self._attributes[key] = cached
+                self.hits += 1
+                return cached[1], sorted(
+                    x for x in instance if x not in cached[2])
+        self.misses += 1
+
+        names = dir(obj)
+        try:
+            names += obj.trait_names()
+        except Exception:
+            pass
+        names = set(names)
+        if key is None:
+            return sorted(names), []
+        # The attributes of the instance are not shared.
+        shared = names.difference(instance)
+        cached = (version, sorted(shared), shared, _reference(owner))
+        self._attributes[key] = cached
+        while len(self._attributes) > self.max_objects:
+            self._attributes.popitem(last=False)
+        return cached[1], sorted(names.intersection(instance))
+
+    def attributes(self, obj):
+        """
+        Return the sorted list of the attributes of ``obj`` (see ``dir``),
+        including its ``trait_names``.
+        """
+        shared, own = self._attributes_of(obj)
+        return sorted(shared + own) if own else shared
+
+    def complete_attribute(self, obj, prefix, k=MAX_COMPLETIONS):
+        """
+        Return the first ``k`` attributes of ``obj`` starting with
+        ``prefix``.  Attributes starting with an underscore are only
+        returned if ``prefix`` is not empty.
+        """
+        shared, own = self._attributes_of(obj)
+        names = prefixed(shared, prefix)
+        if own:
+            names = sorted(names + prefixed(own, prefix))
+        return top(names, k, private=bool(prefix))
@@ -160,6 +160,7 @@ import cgi
 import collections
 import inspect
 import math
+import sys
 import types
 
 # TODO: sage dependency
@@ -191,8 +192,12 @@ INTERACT_HTML = '<?__SAGE__HTML>'
 INTERACT_END = '<?__SAGE__END>'
 
 
-# Dictionary that stores the state of all active interact cells.
-state = {}
+# Dictionary that stores the state of all active interact cells, the
+# least recently used first.
+state = collections.OrderedDict()
+
+# Maximum number of interact cells whose state is kept. 0 means no limit.
+max_state = 0
 
 
 def reset_state():
@@ -211,10 +216,95 @@ def reset_state():
         sage: from sagenb.notebook.interact import reset_state
         sage: reset_state()
         sage: sagenb.notebook.interact.state
-        {}
+        OrderedDict()
+    """
+    state.clear()
+
+
+def _cell_id(cell_id):
+    # We cast the id to an integer, if it's an integer.
+    try:
+        return int(cell_id)
+    except ValueError:
+        return cell_id
+
+
+def _get_state(cell_id):
+    """
+    Return the state of the interact cell ``cell_id``, marking it as the
+    most recently used.  Raises KeyError if there is no state.
     """
-    global state
-    state = {}
+    S = state.pop(cell_id)
+    state[cell_id] = S
+    return S
+
+
+def _set_state(cell_id, S):
+    """
+    Store the state ``S`` of the interact cell ``cell_id``, dropping the
+    least recently used states over :data:`max_state`.
+    """
+    state.pop(cell_id, None)
+    state[cell_id] = S
+    while max_state and len(state) > max_state:
+        state.popitem(last=False)
+
+
+def set_max_state(n):
+    """
+    Keep the state of at most ``n`` interact cells.  0 means no limit.
+
+    EXAMPLES::
+
+        sage: from sagenb.notebook.interact import set_max_state
+        sage: set_max_state(1)
+        sage: sagenb.notebook.interact._set_state(1, {})
+        sage: sagenb.notebook.interact._set_state(2, {})
+        sage: list(sagenb.notebook.interact.state)
+        [2]
+        sage: set_max_state(0)
+    """
+    global max_state
+    max_state = max(0, int(n))
+    while max_state and len(state) > max_state:
+        state.popitem(last=False)
+
+
+def forget_state(cell_id):
+    """
+    Drop the :func:`interact` state of the cell ``cell_id``, if any.
+    This is done when the cell is deleted or evaluated again, so that the
+    function and the values of the controls can be freed.
+
+    EXAMPLES::
+
+        sage: from sagenb.notebook.interact import forget_state
+        sage: sagenb.notebook.interact._set_state(5, {})
+        sage: forget_state('5')
+        sage: 5 in sagenb.notebook.interact.state
+        False
+    """
+    state.pop(_cell_id(cell_id), None)
+
+
+def state_stats():
+    """
+    Return a dictionary with the number of interact ``cells`` whose state
+    is kept and an estimate of their size in ``bytes``.  Only the state
+    dictionaries and the values of the controls are measured, not the
+    objects referenced by the functions.
+    """
+    size = 0
+    for S in state.values():
+        size += sys.getsizeof(S)
+        for variables in (S.get('variables', {}), S.get('adapt', {})):
+            size += sys.getsizeof(variables)
+            for value in variables.values():
+                try:
+                    size += sys.getsizeof(value)
+                except TypeError:
+                    pass
+    return {'cells': len(state), 'bytes': size}
 
 _k = 0
 
@@ -2776,7 +2866,8 @@ def interact(f, layout=None, width='800px'):
 
     variables = {}
     adapt = {}
-    state[SAGE_CELL_ID] = {'variables': variables, 'adapt': adapt}
+    S = {'variables': variables, 'adapt': adapt}
+    _set_state(SAGE_CELL_ID, S)
 
     for control in controls:
         variables[control.var()] = control.default_value()
@@ -2799,7 +2890,7 @@ def interact(f, layout=None, width='800px'):
         if z:
             print(z)
 
-    state[SAGE_CELL_ID]['function'] = _
+    S['function'] = _
 
     return f
 
@@ -4017,14 +4108,10 @@ def update(cell_id, var, adapt, value, globs):
         sage: sagenb.notebook.interact.update(0, 'a', 0, '5', globals())
         __SAGE_INTERACT_RESTART__
     """
-    # We cast the id to an integer, if it's an integer.
-    try:
-        cell_id = int(cell_id)
-    except ValueError:
-        pass
+    cell_id = _cell_id(cell_id)
 
     try:
-        S = state[cell_id]
+        S = _get_state(cell_id)
         # Look up the function that adapts inputs to have the right
         # type
         adapt_function = S["adapt"][adapt]
@@ -4058,14 +4145,10 @@ def recompute(cell_id):
         __SAGE_INTERACT_RESTART__
 
     """
-    # We cast the id to an integer, if it's an integer.
-    try:
-        cell_id = int(cell_id)
-    except ValueError:
-        pass
+    cell_id = _cell_id(cell_id)
 
     try:
-        S = state[cell_id]
+        S = _get_state(cell_id)
         # Finally call the interactive function, which will use the
         # above variables.
         S['function']()
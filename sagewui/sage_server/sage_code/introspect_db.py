@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*
+r"""
+Precomputed introspection database
+
+A read-only file with the docstrings and source code of the objects of the
+Sage library, processed as :func:`support.docstring` and
+:func:`support.source_code` do, so that worksheet processes don't compute
+them again and again.  It is built by ``util/build_introspect_db.py``.
+
+The file is used through ``mmap``, so it is shared by all the worksheet
+processes and only the pages of the looked up entries are read.  Layout
+(integers are little endian):
+
+- header: magic ``SAGEIDB1``, number of entries and length of the version
+  (uint32 each), followed by the version (utf-8).
+
+- index: one record for each entry, sorted by name: name offset (uint64),
+  name length (uint32), value offset (uint64) and value length (uint32).
+
+- names (utf-8) and values (zlib compressed json dictionaries with the
+  ``fingerprint`` of the object and the ``doc`` and ``src`` html).
+
+AUTHORS:
+
+- J Miguel Farto
+"""
+# **************************************************
+# Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#
+# Distributed under the terms of the GNU General Public License (GPL)
+# **************************************************
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import types
+import zlib
+
+MAGIC = b'SAGEIDB1'
+HEADER = struct.Struct(str('<8sII'))
+RECORD = struct.Struct(str('<QIQI'))
+
+
+def fingerprint(obj):
+    """
+    Return a string that tells whether ``obj`` is the object of the
+    library that was introspected, or at least an object of the same
+    type, whose docstring and source code are the same.
+    """
+    t = type(obj)
+    s = '{}.{}'.format(t.__module__, t.__name__)
+    if isinstance(obj, (type, types.ModuleType, types.FunctionType,
+                        types.BuiltinFunctionType, types.MethodType)):
+        s += ':{}.{}'.format(getattr(obj, '__module__', None),
+                             getattr(obj, '__name__', None))
+    return s
+
+
+def write_db(filename, entries, version=''):
+    """
+    Write the introspection database ``filename``.
+
+    INPUT:
+
+    - ``entries`` -- an iterable of ``(name, value)`` pairs, where
+      ``value`` is a dictionary with the ``fingerprint`` of the object and
+      its ``doc`` and ``src`` html.
+
+    - ``version`` -- a string; the version of the library.
+    """
+    names = []
+    values = []
+    for name, value in sorted(entries, key=lambda entry: entry[0]):
+        names.append(name.encode('utf-8'))
+        values.append(zlib.compress(json.dumps(value).encode('utf-8')))
+    version = version.encode('utf-8')
+
+    offset = HEADER.size + len(version) + RECORD.size * len(names)
+    index = []
+    for name in names:
+        index.append([offset, len(name)])
+        offset += len(name)
+    for i, value in enumerate(values):
+        index[i].extend((offset, len(value)))
+        offset += len(value)
+
+    tmp_filename = '{}.tmp'.format(filename)
+    with open(tmp_filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(names), len(version)))
+        f.write(version)
+        for record in index:
+            f.write(RECORD.pack(*record))
+        for name in names:
+            f.write(name)
+        for value in values:
+            f.write(value)
+    os.rename(tmp_filename, filename)
+
+
+class _Names(object):
+    # The sorted names of the database, as a sequence for bisect.
+    def __init__(self, db):
+        self.db = db
+
+    def __len__(self):
+        return self.db.size
+
+    def __getitem__(self, i):
+        offset, length = self.db._record(i)[:2]
+        return self.db._map[offset:offset + length]
+
+
+class IntrospectionDB(object):
+    """
+    A read-only introspection database (see :func:`write_db`).
+
+    INPUT:
+
+    - ``filename`` -- a string.
+
+    Raises ValueError if the file is not an introspection database.
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.size, version_length = HEADER.unpack_from(
+                self._map, 0)
+        except struct.error:
+            raise ValueError('{} is not an introspection database'.format(
+                filename))
+        if magic != MAGIC:
+            raise ValueError('{} is not an introspection database'.format(
+                filename))
+        self._index = HEADER.size + version_length
+        self.version = self._map[HEADER.size:self._index].decode('utf-8')
+        self._names = _Names(self)
+
+    def _record(self, i):
+        return RECORD.unpack_from(self._map, self._index + i * RECORD.size)
+
+    def __len__(self):
+        return self.size
+
+    def get(self, name):
+        """
+        Return the dictionary stored for ``name``, or None.
+        """
+        key = name.encode('utf-8')
+        i = bisect.bisect_left(self._names, key)
+        if i == self.size or self._names[i] != key:
+            return None
+        offset, length = self._record(i)[2:]
+        return json.loads(zlib.decompress(
+            self._map[offset:offset + length]).decode('utf-8'))
+
+    def lookup(self, name, obj, field):
+        """
+        Return the ``field`` (``'doc'`` or ``'src'``) html of the object
+        ``obj`` named ``name``, or None if it is not in the database or
+        ``obj`` is not the object that was introspected.
+        """
+        value = self.get(name)
+        if value is None or value['fingerprint'] != fingerprint(obj):
+            return None
+        return value.get(field)
+
+
+def default_filename(version):
+    """
+    Return the name of the introspection database of the library
+    ``version``: ``$SAGENB_INTROSPECT_DB`` if set (an empty value disables
+    the database) or ``$DOT_SAGE/sagenb/introspect-<version>.db``.
+    """
+    filename = os.environ.get('SAGENB_INTROSPECT_DB')
+    if filename is None:
+        dot_sage = os.environ.get('DOT_SAGE')
+        if not dot_sage:
+            return None
+        filename = os.path.join(dot_sage, 'sagenb',
+                                'introspect-{}.db'.format(version))
+    return filename or None
+
+
+_db = {}
+
+
+def open_db(version):
+    """
+    Return the introspection database of the library ``version`` (see
+    :func:`default_filename`), or None if there is none.  It is opened
+    once.
+    """
+    try:
+        return _db[version]
+    except KeyError:
+        pass
+    db = None
+    filename = default_filename(version)
+    if filename is not None and os.path.exists(filename):
+        try:
+            db = IntrospectionDB(filename)
+        except (IOError, OSError, ValueError):
+            db = None
+        if db is not None and db.version != version:
+            db = None
+    _db[version] = db
+    return db
@@ -3,7 +3,10 @@
 r"""
 Process docstrings with Sphinx
 
-Processes docstrings with Sphinx. Can also be used as a commandline script:
+Processes docstrings with Sphinx. The Sphinx application is created once
+and reused, and the processed docstrings are cached on disk, shared by all
+the worksheet processes (see :func:`cache_directory`). Can also be used as
+a commandline script:
 
 ``python sphinxify.py <text>``
 
@@ -19,11 +22,14 @@ AUTHORS:
 from __future__ import absolute_import
 from __future__ import print_function
 
+import atexit
+import hashlib
 import os
 import re
 import shutil
 import sys
 from tempfile import mkdtemp
+from tempfile import NamedTemporaryFile
 
 from sage.env import SAGE_DOC
 
@@ -31,6 +37,13 @@ from sage.env import SAGE_DOC
 # We import Sphinx on demand, to reduce Sage startup time.
 Sphinx = None
 
+# Format -> (Sphinx application, source directory, temporary configuration
+# directory or None). See _builder.
+_builders = {}
+
+# Changing this invalidates the cached docstrings.
+CACHE_VERSION = '1'
+
 
 def is_sphinx_markup(docstring):
     """
@@ -87,44 +100,42 @@ def sphinxify(docstring, format='html'):
         sage: _ = sphinxify('A test')
         sage: assert n == len(sys.path)
     """
-    global Sphinx
-    if not Sphinx:
-        from sphinx.application import Sphinx
-
-    srcdir = mkdtemp()
-    base_name = os.path.join(srcdir, 'docstring')
-    rst_name = base_name + '.rst'
+    cache_name = _cache_name(docstring, format)
+    if cache_name is not None and os.path.exists(cache_name):
+        try:
+            return open(cache_name, 'r').read()
+        except (IOError, OSError):
+            pass
 
     if format == 'html':
         suffix = '.html'
     else:
         suffix = '.txt'
-    output_name = base_name + suffix
-
-    filed = open(rst_name, 'w')
-    filed.write(docstring)
-    filed.close()
-
-    # Sphinx constructor: Sphinx(srcdir, confdir, outdir, doctreedir,
-    # buildername, confoverrides, status, warning, freshenv).
-    temp_confdir = False
-    confdir = os.path.join(SAGE_DOC, 'en', 'introspect')
-    if not SAGE_DOC and not os.path.exists(confdir):
-        # If we don't have Sage, we need to do our own configuration
-        # This may be inefficient or broken.  TODO: Find a faster way to do
-        # this.
-        temp_confdir = True
-        confdir = mkdtemp()
-        generate_configuration(confdir)
-
-    doctreedir = os.path.join(srcdir, 'doctrees')
-    confoverrides = {'html_context': {}, 'master_doc': 'docstring'}
 
-    old_sys_path = list(sys.path)  # Sphinx modifies sys.path
-    sphinx_app = Sphinx(srcdir, confdir, srcdir, doctreedir, format,
-                        confoverrides, None, None, True)
-    sphinx_app.build(None, [rst_name])
-    sys.path = old_sys_path
+    try:
+        sphinx_app, srcdir = _builder(format)[:2]
+        base_name = os.path.join(srcdir, 'docstring')
+        rst_name = base_name + '.rst'
+        output_name = base_name + suffix
+        if os.path.exists(output_name):
+            os.remove(output_name)
+
+        filed = open(rst_name, 'w')
+        filed.write(docstring)
+        filed.close()
+
+        # Make Sphinx read the docstring again, even if the source file
+        # seems not to have changed.
+        sphinx_app.env.all_docs.pop('docstring', None)
+        old_sys_path = list(sys.path)  # Sphinx modifies sys.path
+        try:
+            sphinx_app.build(None, [rst_name])
+        finally:
+            sys.path = old_sys_path
+    except Exception:
+        # The application may be broken. Start again the next time.
+        _remove_builder(format)
+        raise
 
     # We need to remove "_" from __builtin__ that the gettext module installs
     import __builtin__
@@ -146,6 +157,8 @@ def sphinxify(docstring, format='html'):
         # Remove spurious \(, \), \[, \].
         output = output.replace('\\(', '').replace(
             '\\)', '').replace('\\[', '').replace('\\]', '')
+        if cache_name is not None:
+            _cache_write(cache_name, output)
     else:
         print("BUG -- Sphinx error")
         if format == 'html':
@@ -153,13 +166,126 @@ def sphinxify(docstring, format='html'):
         else:
             output = docstring
 
-    if temp_confdir:
-        shutil.rmtree(confdir, ignore_errors=True)
-    shutil.rmtree(srcdir, ignore_errors=True)
-
     return output
 
 
+def _builder(format):
+    """
+    Return a tuple ``(application, srcdir, temporary confdir)`` with the
+    Sphinx application that builds docstrings in ``format``, creating it
+    the first time.
+    """
+    global Sphinx
+    try:
+        return _builders[format]
+    except KeyError:
+        pass
+    if not Sphinx:
+        from sphinx.application import Sphinx
+
+    srcdir = mkdtemp()
+
+    # Sphinx constructor: Sphinx(srcdir, confdir, outdir, doctreedir,
+    # buildername, confoverrides, status, warning, freshenv).
+    temp_confdir = None
+    confdir = os.path.join(SAGE_DOC, 'en', 'introspect')
+    if not SAGE_DOC and not os.path.exists(confdir):
+        # If we don't have Sage, we need to do our own configuration
+        # This may be inefficient or broken.  TODO: Find a faster way to do
+        # this.
+        temp_confdir = confdir = mkdtemp()
+        generate_configuration(confdir)
+
+    doctreedir = os.path.join(srcdir, 'doctrees')
+    confoverrides = {'html_context': {}, 'master_doc': 'docstring'}
+
+    old_sys_path = list(sys.path)  # Sphinx modifies sys.path
+    try:
+        sphinx_app = Sphinx(srcdir, confdir, srcdir, doctreedir, format,
+                            confoverrides, None, None, True)
+    except Exception:
+        shutil.rmtree(srcdir, ignore_errors=True)
+        if temp_confdir is not None:
+            shutil.rmtree(temp_confdir, ignore_errors=True)
+        raise
+    finally:
+        sys.path = old_sys_path
+    _builders[format] = (sphinx_app, srcdir, temp_confdir)
+    return _builders[format]
+
+
+def _remove_builder(format):
+    sphinx_app, srcdir, temp_confdir = _builders.pop(format, (None, ) * 3)
+    if srcdir is not None:
+        shutil.rmtree(srcdir, ignore_errors=True)
+    if temp_confdir is not None:
+        shutil.rmtree(temp_confdir, ignore_errors=True)
+
+
+def remove_builders():
+    """
+    Remove the Sphinx applications and their temporary directories.
+    """
+    for format in list(_builders):
+        _remove_builder(format)
+
+
+atexit.register(remove_builders)
+
+
+def cache_directory():
+    """
+    Return the directory where the processed docstrings are cached, or
+    None if there is no cache.
+
+    It is ``$SAGENB_SPHINX_CACHE`` if set (an empty value disables the
+    cache), or ``$DOT_SAGE/sagenb/sphinx``.
+    """
+    directory = os.environ.get('SAGENB_SPHINX_CACHE')
+    if directory is None:
+        dot_sage = os.environ.get('DOT_SAGE')
+        if not dot_sage:
+            return None
+        directory = os.path.join(dot_sage, 'sagenb', 'sphinx')
+    return directory or None
+
+
+def _cache_name(docstring, format):
+    """
+    Return the name of the file where the ``docstring`` processed in
+    ``format`` is cached, or None if there is no cache.  The name is a
+    hash of the docstring and the Sphinx configuration, so that equal
+    docstrings of different objects are processed once.
+    """
+    directory = cache_directory()
+    if directory is None:
+        return None
+    if not isinstance(docstring, bytes):
+        docstring = docstring.encode('utf-8')
+    key = hashlib.sha1(docstring)
+    key.update('\0{}\0{}\0{}'.format(
+        CACHE_VERSION, format, SAGE_DOC).encode('utf-8'))
+    key = key.hexdigest()
+    return os.path.join(directory, key[:2], '{}.{}'.format(key, format))
+
+
+def _cache_write(cache_name, output):
+    # Written to a temporary file first, so that other processes never
+    # read a partial file.
+    directory = os.path.dirname(cache_name)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with NamedTemporaryFile('w', dir=directory, delete=False) as f:
+            f.write(output)
+    except (IOError, OSError):
+        return
+    try:
+        os.rename(f.name, cache_name)
+    except OSError:
+        os.remove(f.name)
+
+
 def generate_configuration(directory):
     r"""
     Generates a Sphinx configuration in ``directory``.
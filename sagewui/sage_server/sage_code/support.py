@@ -15,6 +15,7 @@ from __future__ import unicode_literals
 
 import ast
 import base64
+import json
 import os
 import sys
 from importlib import import_module
@@ -22,6 +23,8 @@ from pydoc import describe
 from pydoc import html
 from pydoc import resolve
 
+import sage.repl.interpreter
+import sage.repl.preparse
 import sage.server.support
 from sage.misc import sageinspect
 from sage.misc.cython import cython
@@ -29,12 +32,16 @@ from sage.misc.displayhook import DisplayHook
 from sage.misc.inline_fortran import InlineFortran
 from sage.misc.sagedoc import format_src
 from sage.misc.session import init as session_init
-from sage.repl.interpreter import _do_preparse
+from sage.misc.session import save_session
 from sage.repl.preparse import preparse
 from sage.repl.preparse import preparse_file
 from sage.symbolic.all import Expression
 from sage.symbolic.all import SR
+from sage.version import version as SAGE_VERSION
 
+from code_cache import CodeCache
+from completion import CompletionEngine
+from introspect_db import open_db
 from sphinxify import sphinxify
 from sphinxify import is_sphinx_markup
 
@@ -46,9 +53,19 @@ sys.displayhook = DisplayHook()
 # Initialization
 ######################################################################
 EMBEDDED_MODE = False
+# Marks the line with the status of an execution, printed after its output.
+# It must be the same as in sagewui.sage_server.interfaces.
+STATUS_TRAILER = '___SAGE_STATUS___'
 sage_globals = None
 globals_at_init = None
 global_names_at_init = None
+# Sorted names for completions(), kept between calls.
+completion_engine = CompletionEngine()
+# Preparsed and compiled code for execute_code(), kept between calls.
+preparse_cache = CodeCache()
+compile_cache = CodeCache()
+# The preparser settings of the code in preparse_cache.
+_preparsed_with = None
 
 
 def init(object_directory=None, globs={}):
@@ -62,7 +79,7 @@ def init(object_directory=None, globs={}):
 
     sage_globals = globs
     # globals_at_init = set(globs.keys())
-    globals_at_init = globs.values()
+    globals_at_init = dict(globs)
     global_names_at_init = set(globs.keys())
     EMBEDDED_MODE = True
 
@@ -78,6 +95,21 @@ def init(object_directory=None, globs={}):
     sageinspect.EMBEDDED_MODE = True
 
 
+def reset_globals(keep=()):
+    """
+    Restore the namespace of the worksheet process to its state after
+    :func:`init`: the names defined since are removed, except those in
+    ``keep``, and the redefined ones are restored.
+    """
+    for name in list(sage_globals):
+        if name not in globals_at_init and name not in keep:
+            del sage_globals[name]
+    for name, value in globals_at_init.items():
+        if sage_globals.get(name) is not value:
+            sage_globals[name] = value
+    completion_engine.invalidate()
+
+
 def setup_systems(globs):
     fortran = InlineFortran(globs)
     globs['fortran'] = fortran
@@ -165,32 +197,25 @@ def completions(s, globs, format=False, width=90, system="None"):
         return '(empty string)'
     try:
         if '.' not in s and '(' not in s:
-            v = [x for x in globs.keys() if x[:n] == s] + \
-                [x for x in __builtins__.keys() if x[:n] == s]
+            builtins = __builtins__
+            if not isinstance(builtins, dict):
+                builtins = vars(builtins)
+            v = completion_engine.complete_global(s, globs, builtins)
         else:
             if ')' not in s:
                 i = s.rfind('.')
                 method = s[i + 1:]
                 obj = s[:i]
-                n = len(method)
             else:
                 obj = preparse(s)
                 method = ''
             try:
                 O = eval(obj, globs)
-                D = dir(O)
-                try:
-                    D += O.trait_names()
-                except (AttributeError, TypeError):
-                    pass
-                if method == '':
-                    v = [obj + '.' + x for x in D if x and x[0] != '_']
-                else:
-                    v = [obj + '.' + x for x in D if x[:n] == method]
+                v = [obj + '.' + x for x in
+                     completion_engine.complete_attribute(O, method) if x]
             except Exception:
                 v = []
-        v = list(set(v))   # make unique
-        v.sort()
+        v = sorted(set(v))  # make unique
     except Exception:
         v = []
 
@@ -246,6 +271,9 @@ def docstring(obj_name, globs, system='sage'):
         obj = eval(obj_name, globs)
     except (AttributeError, NameError, SyntaxError):
         return "No object '%s' currently defined." % obj_name
+    html = precomputed(obj_name, obj, 'doc')
+    if html is not None:
+        return html
     s = ''
     newline = "\n\n"  # blank line to start new paragraph
     try:
@@ -272,6 +300,21 @@ def docstring(obj_name, globs, system='sage'):
     return html_markup(s.decode('utf-8'))
 
 
+def precomputed(name, obj, field):
+    """
+    Return the ``field`` (``'doc'`` or ``'src'``) html of the library
+    object ``obj`` named ``name`` from the introspection database (see
+    :mod:`introspect_db`), or None if it is not there.
+    """
+    db = open_db(SAGE_VERSION)
+    if db is None:
+        return None
+    try:
+        return db.lookup(name, obj, field)
+    except Exception:
+        return None
+
+
 def html_markup(s):
     if is_sphinx_markup(s):
         try:
@@ -325,6 +368,9 @@ def source_code(s, globs, system='sage'):
         obj = eval(s, globs)
     except NameError:
         return html_markup("No object %s" % s)
+    html = precomputed(s, obj, 'src')
+    if html is not None:
+        return html
 
     try:
         try:
@@ -475,6 +521,48 @@ def cython_import_all(filename, globals, verbose=False, compile_message=False,
             globals[k] = x
 
 
+######################################################################
+# Snapshots
+######################################################################
+
+class _Output(list):
+    # Collects what is printed.
+    def write(self, s):
+        self.append(s)
+
+    def flush(self):
+        pass
+
+
+def save_snapshot(filename):
+    """
+    Save the variables of the session in ``filename``, but only if every
+    one of them can be saved, so that loading the snapshot in a new
+    process is the same as evaluating again the code evaluated so far.
+
+    OUTPUT:
+
+    - a boolean; whether the snapshot was saved.
+    """
+    tmp_filename = '{}.tmp.sobj'.format(os.path.splitext(filename)[0])
+    output = _Output()
+    stdout = sys.stdout
+    sys.stdout = output
+    try:
+        save_session(tmp_filename, verbose=True)
+    except Exception:
+        output.append('Not saving')
+    finally:
+        sys.stdout = stdout
+    if any('Not saving' in line for line in output):
+        # Some variables (e.g. functions or modules) can not be saved.
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        return False
+    os.rename(tmp_filename, filename)
+    return True
+
+
 ###################################################
 # Preparser
 ###################################################
@@ -488,7 +576,18 @@ def do_preparse():
     """
     Return True if the preparser is set to on, and False otherwise.
     """
-    return _do_preparse
+    # preparser() rebinds it.
+    return sage.repl.interpreter._do_preparse
+
+
+def preparser_settings():
+    """
+    Return the settings that preparsed code depends on: whether the
+    preparser and automatic names are on, and the implicit multiplication
+    level.
+    """
+    return (do_preparse(), _automatic_names,
+            getattr(sage.repl.preparse, 'implicit_mul_level', None))
 
 
 ########################################################################
@@ -822,17 +921,66 @@ def preparse_worksheet_cell(s, globals):
     return s
 
 
-def execute_code(code, globals, mode='raw', start_label='', print_time=False):
-    code = base64.b64decode(code.encode('utf-8')).decode('utf-8')
+def preparse_code(code, globals, mode):
+    """
+    Return ``code`` preparsed for ``mode`` (``'python'`` or ``'sage'``),
+    as kept in :data:`preparse_cache` if it was preparsed before with the
+    same :func:`preparser_settings`.
+    """
+    global _preparsed_with
+    settings = preparser_settings()
+    if settings != _preparsed_with:
+        preparse_cache.clear()
+        _preparsed_with = settings
+    if mode == 'python':
+        return preparse_cache.get(mode, code, reformat_code)
+    if 'load' in code or 'attach' in code:
+        # The files loaded may change.
+        return preparse_worksheet_cell(code, globals)
+    return preparse_cache.get(
+        mode, code, lambda s: preparse_worksheet_cell(s, globals))
+
+
+def compile_code(code):
+    """
+    Return the code object of the string ``code``, as kept in
+    :data:`compile_cache` if it was compiled before.
+    """
+    return compile_cache.get(
+        None, code, lambda s: compile(s, '<string>', 'exec'))
+
+
+def code_cache_stats():
+    """
+    Return a dictionary with the statistics of the ``preparse`` and
+    ``compile`` caches (see :meth:`code_cache.CodeCache.stats`).
+    """
+    return {'preparse': preparse_cache.stats(),
+            'compile': compile_cache.stats()}
+
+
+def execute_code(code, globals, mode='raw', start_label='', print_time=False,
+                 tempdir=None, code_file=None):
+    if code_file is None:
+        code = base64.b64decode(code.encode('utf-8')).decode('utf-8')
+    else:
+        # Large code is passed in a file instead of the terminal.
+        with open(code_file, 'rb') as f:
+            code = f.read().decode('utf-8')
+        os.remove(code_file)
     if mode != 'raw':
         print(start_label)
 
-    if mode == 'raw':
+    if mode == 'sage':
+        # Names may be defined or deleted. Introspection (see
+        # completions) runs in python mode and keeps the index.
+        completion_engine.invalidate()
+
+    if mode in ('raw', 'exec'):
+        # The code is executed as is.
         pass
-    elif mode == 'python':
-        code = reformat_code(code)
-    elif mode == 'sage':
-        code = preparse_worksheet_cell(code, globals)
+    elif mode in ('python', 'sage'):
+        code = preparse_code(code, globals, mode)
     else:
         code = 'pass'
     if print_time and code != 'raw':
@@ -840,5 +988,24 @@ def execute_code(code, globals, mode='raw', start_label='', print_time=False):
             code, '\nprint("CPU time: %.2f s,  Wall time: %.2f '
                   's"%(cputime(__SAGE_t__), walltime(__SAGE_w__)))'))
 
-    # TODO: use previous ast analisys done when code is reformated
-    exec(code, globals)
+    if tempdir is None:
+        # TODO: use previous ast analisys done when code is reformated
+        exec(compile_code(code), globals)
+        return
+
+    os.chdir(tempdir)
+    try:
+        exec(compile_code(code), globals)
+    except (Exception, KeyboardInterrupt):
+        sys.excepthook(*sys.exc_info())
+    # Report the files created, so that the notebook server doesn't need
+    # to look for them.
+    try:
+        files = sorted(os.listdir(tempdir))
+    except OSError:
+        files = []
+    status = {'files': files}
+    interact = sys.modules.get('interact')
+    if interact is not None:
+        status['interact'] = interact.state_stats()
+    print('\n{}{}'.format(STATUS_TRAILER, json.dumps(status)))
@@ -0,0 +1,377 @@
+"""
+sage_server scheduler
+
+Placement of worksheet processes on the nodes of a server pool and
+admission of worksheet evaluations.
+
+AUTHORS:
+
+  - J Miguel Farto
+"""
+
+#############################################################################
+#
+#       Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  The full text of the GPL is available at:
+#                  http://www.gnu.org/licenses/
+#
+#############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+
+import random
+import threading
+from collections import defaultdict
+from collections import deque
+from collections import OrderedDict
+from itertools import count
+from time import time as walltime
+
+
+def node_label(entry):
+    """
+    Return the name of the node of the server pool entry ``entry``, with
+    the credentials of ``scheme://[token@]host:port`` entries removed, so
+    that it can be shown to the administrators.
+    """
+    scheme, sep, rest = entry.partition('://')
+    if not sep:
+        return entry
+    netloc, slash, path = rest.partition('/')
+    return scheme + sep + netloc.rpartition('@')[2] + slash + path
+
+
+class ServerPoolNode(object):
+    """
+    Load and health statistics of one node (``user@host``) of a server
+    pool.
+
+    INPUT:
+
+        - ``user_at_host`` -- a string; the node (see :func:`node_label`).
+
+        - ``latency_samples`` -- an integer (default: 16); number of
+          recent start latencies that are kept.
+    """
+
+    def __init__(self, user_at_host, latency_samples=16):
+        self.user_at_host = user_at_host
+        self.kernels = 0  # running or starting worksheet processes
+        self.starting = 0  # processes that have not answered yet
+        self.started = 0
+        self.failures = 0  # consecutive failed starts
+        self.total_failures = 0
+        self.down_until = 0
+        self.latencies = deque(maxlen=latency_samples)
+
+    @property
+    def latency(self):
+        """
+        Mean of the recent start latencies in seconds, or None if no
+        process has been started yet.
+        """
+        if not self.latencies:
+            return None
+        return sum(self.latencies) / len(self.latencies)
+
+    @property
+    def healthy(self):
+        return walltime() >= self.down_until
+
+    def as_dict(self):
+        return {
+            'user_at_host': self.user_at_host,
+            'kernels': self.kernels,
+            'starting': self.starting,
+            'started': self.started,
+            'failures': self.total_failures,
+            'latency': self.latency,
+            'healthy': self.healthy,
+            'down_for': max(0, self.down_until - walltime()),
+            }
+
+
+class ServerPoolScheduler(object):
+    """
+    Chooses the node of a server pool where a new worksheet process is
+    started.
+
+    Processes are placed on the healthy node with the fewest running
+    processes, using the mean start latency to break ties.  Nodes
+    where a process could not be started are considered down for
+    ``retry_interval`` seconds, doubled for every consecutive failure
+    up to ``max_retry_interval``.  Processes that do not answer after
+    ``start_timeout`` seconds count as failed starts.
+
+    Worksheet processes report back to the scheduler through
+    :meth:`kernel_starting`, :meth:`kernel_ready`, :meth:`kernel_failed`
+    and :meth:`kernel_stopped`.
+
+    INPUT:
+
+        - ``retry_interval`` -- seconds (default: 30).
+
+        - ``max_retry_interval`` -- seconds (default: 600).
+
+        - ``start_timeout`` -- seconds (default: 60).
+    """
+
+    def __init__(self, retry_interval=30, max_retry_interval=600,
+                 start_timeout=60):
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.start_timeout = start_timeout
+        self._nodes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _node(self, user_at_host):
+        label = node_label(user_at_host)
+        try:
+            return self._nodes[label]
+        except KeyError:
+            node = self._nodes[label] = ServerPoolNode(label)
+            return node
+
+    def choose(self, server_pool, capacity=0):
+        """
+        Return the node of ``server_pool`` where the next worksheet
+        process should be started.  The process is counted as starting on
+        the node from now on, so it must be created with ``scheduled``
+        set, and report back through :meth:`kernel_failed` or
+        :meth:`kernel_ready` and :meth:`kernel_stopped`.
+
+        INPUT:
+
+            - ``server_pool`` -- a list of strings ``user@host``.
+
+            - ``capacity`` -- an integer (default: 0); maximum number of
+              processes per node.  0 means no limit.
+
+        OUTPUT:
+
+            - a string.  A RuntimeError is raised if every node is full.
+        """
+        with self._lock:
+            entries = OrderedDict()
+            for user_at_host in server_pool:
+                entries[self._node(user_at_host)] = user_at_host
+            nodes = list(entries)
+            if capacity:
+                nodes = [node for node in nodes if node.kernels < capacity]
+            if not nodes:
+                raise RuntimeError(
+                    'all the nodes of the server pool are running {} '
+                    'worksheet processes'.format(capacity))
+
+            healthy = [node for node in nodes if node.healthy]
+            if not healthy:
+                # Every node is down. Retry the one that comes back first.
+                node = min(nodes, key=lambda node: node.down_until)
+            else:
+                least = min(node.kernels for node in healthy)
+                healthy = [node for node in healthy if node.kernels == least]
+                latencies = [node.latency for node in healthy
+                             if node.latency is not None]
+                if len(latencies) == len(healthy):
+                    node = min(healthy, key=lambda node: node.latency)
+                else:
+                    # Some node has no history. Give it a chance.
+                    node = random.choice([node for node in healthy
+                                          if node.latency is None])
+            # Reserve the place, so that concurrent starts don't exceed
+            # the capacity.
+            node.kernels += 1
+            node.starting += 1
+            return entries[node]
+
+    def kernel_starting(self, user_at_host):
+        with self._lock:
+            node = self._node(user_at_host)
+            node.kernels += 1
+            node.starting += 1
+
+    def kernel_ready(self, user_at_host, latency):
+        with self._lock:
+            node = self._node(user_at_host)
+            node.starting = max(0, node.starting - 1)
+            node.started += 1
+            node.failures = 0
+            node.down_until = 0
+            node.latencies.append(latency)
+
+    def kernel_failed(self, user_at_host):
+        with self._lock:
+            node = self._node(user_at_host)
+            node.starting = max(0, node.starting - 1)
+            node.failures += 1
+            node.total_failures += 1
+            node.down_until = walltime() + min(
+                self.retry_interval * 2 ** (node.failures - 1),
+                self.max_retry_interval)
+
+    def kernel_stopped(self, user_at_host, starting=False):
+        """
+        Tell that a process of ``user_at_host`` has quit.  ``starting``
+        tells whether it was quit before answering.
+        """
+        with self._lock:
+            node = self._node(user_at_host)
+            node.kernels = max(0, node.kernels - 1)
+            if starting:
+                node.starting = max(0, node.starting - 1)
+
+    def stats(self, server_pool=()):
+        """
+        Return a list of dictionaries with the statistics of every node
+        in ``server_pool`` or with running processes.
+        """
+        with self._lock:
+            labels = set(self._node(user_at_host).user_at_host
+                         for user_at_host in server_pool)
+            return [node.as_dict() for node in self._nodes.values()
+                    if node.user_at_host in labels or node.kernels]
+
+
+class EvaluationScheduler(object):
+    """
+    Decides which worksheets may start evaluating a cell, so that no user
+    can take all the computing resources of the server.
+
+    At most ``limit`` worksheets compute at the same time, and at most
+    ``user_limit`` of them belong to the same user.  Worksheets that can
+    not compute yet wait in a weighted fair queue: every request of a
+    user is tagged with the virtual time at which it would finish if
+    each user had a share of the server proportional to its weight, and
+    the waiting request with the smallest tag is admitted first.  Thus a
+    user queueing many evaluations does not delay the evaluations of
+    other users.
+
+    Worksheets poll the scheduler by calling :meth:`request` until they
+    are admitted, and call :meth:`release` when the evaluation is done.
+    Waiting or admitted worksheets that do not call :meth:`request` for
+    ``timeout`` seconds are dropped, so that abandoned worksheets don't
+    keep a place.
+
+    INPUT:
+
+        - ``timeout`` -- seconds (default: 60).
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self._running = OrderedDict()  # key -> user
+        self._confirmed = set()  # running keys that are really computing
+        self._waiting = {}  # key -> (finish tag, sequence, start tag, user)
+        self._finish = {}  # user -> finish tag of the last request
+        self._seen = {}  # key -> walltime of the last request
+        self._vtime = 0
+        self._sequence = count()
+        self._lock = threading.Lock()
+
+    def request(self, key, user, limit=0, user_limit=0, weight=1):
+        """
+        Ask for the admission of the evaluation of the worksheet ``key``
+        owned by ``user``.
+
+        INPUT:
+
+            - ``key`` -- a hashable; the worksheet.
+
+            - ``user`` -- a string.
+
+            - ``limit`` -- an integer (default: 0); maximum number of
+              worksheets computing.  0 means no limit.
+
+            - ``user_limit`` -- an integer (default: 0); maximum number of
+              worksheets of the same user computing.  0 means no limit.
+
+            - ``weight`` -- a positive number (default: 1); share of
+              ``user``.
+
+        OUTPUT:
+
+            - a boolean; whether the worksheet may start computing.
+        """
+        with self._lock:
+            self._seen[key] = walltime()
+            if key not in self._running and key not in self._waiting:
+                start = max(self._vtime, self._finish.get(user, 0))
+                finish = start + 1 / weight
+                self._finish[user] = finish
+                self._waiting[key] = (finish, next(self._sequence), start,
+                                      user)
+            self._admit(limit, user_limit)
+            if key in self._running:
+                self._confirmed.add(key)
+                return True
+            return False
+
+    def _forget(self, key):
+        self._running.pop(key, None)
+        self._waiting.pop(key, None)
+        self._confirmed.discard(key)
+        self._seen.pop(key, None)
+
+    def _admit(self, limit, user_limit):
+        deadline = walltime() - self.timeout
+        for key in list(self._waiting) + [
+                key for key in self._running if key not in self._confirmed]:
+            if self._seen.get(key, 0) < deadline:
+                self._forget(key)
+        if not self._waiting:
+            # Nobody is waiting. Forget the history of the users.
+            self._vtime = 0
+            self._finish.clear()
+            return
+
+        kernels = defaultdict(int)
+        for user in self._running.values():
+            kernels[user] += 1
+        for key, (finish, sequence, start, user) in sorted(
+                self._waiting.items(), key=lambda item: item[1][:2]):
+            if limit and len(self._running) >= limit:
+                break
+            if user_limit and kernels[user] >= user_limit:
+                continue
+            del self._waiting[key]
+            self._running[key] = user
+            kernels[user] += 1
+            self._vtime = max(self._vtime, start)
+
+    def release(self, key):
+        """
+        Tell that the worksheet ``key`` is not computing anymore.
+        """
+        with self._lock:
+            self._forget(key)
+
+    def position(self, key):
+        """
+        Return the position (starting at 1) of the worksheet ``key`` in
+        the queue of waiting worksheets, or None if it is not waiting.
+        """
+        with self._lock:
+            try:
+                tag = self._waiting[key][:2]
+            except KeyError:
+                return None
+            return 1 + sum(1 for waiting in self._waiting.values()
+                           if waiting[:2] < tag)
+
+    def stats(self):
+        """
+        Return a dictionary with the number of ``running`` and ``waiting``
+        worksheets, by user.
+        """
+        with self._lock:
+            stats = {'running': defaultdict(int), 'waiting': defaultdict(int)}
+            for user in self._running.values():
+                stats['running'][user] += 1
+            for finish, sequence, start, user in self._waiting.values():
+                stats['waiting'][user] += 1
+            return stats
@@ -0,0 +1,314 @@
+"""
+sage_server telemetry
+
+Resource usage of worksheet process trees, read from ``/proc``.
+
+AUTHORS:
+
+  - J Miguel Farto
+"""
+
+#############################################################################
+#
+#       Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  The full text of the GPL is available at:
+#                  http://www.gnu.org/licenses/
+#
+#############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import threading
+import traceback
+from collections import defaultdict
+from time import sleep
+from time import time as walltime
+
+PROC = '/proc'
+
+try:
+    CLOCK_TICKS = os.sysconf(str('SC_CLK_TCK'))
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+USAGE_FIELDS = ('processes', 'threads', 'cpu_time', 'rss', 'pss',
+                'open_files')
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8', 'replace')
+
+
+def _stat(pid):
+    """
+    Return the fields of ``/proc/<pid>/stat`` after the command name.
+    """
+    stat = _read(os.path.join(PROC, str(pid), 'stat'))
+    # The command name is between parentheses and may contain spaces.
+    return stat[stat.rfind(')') + 2:].split()
+
+
+def process_start_time(pid):
+    """
+    Return the start time of the process ``pid`` in clock ticks after the
+    boot, or None if the process does not exist.  Together with the id,
+    it tells a process apart from a later one that reuses the id.
+    """
+    try:
+        return int(_stat(pid)[19])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+def children_map():
+    """
+    Return a dictionary mapping process ids to the list of their children.
+    """
+    children = defaultdict(list)
+    for name in os.listdir(PROC):
+        if not name.isdigit():
+            continue
+        try:
+            ppid = int(_stat(name)[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+        children[ppid].append(int(name))
+    return children
+
+
+def session_map():
+    """
+    Return a dictionary mapping session ids to the list of the ids of
+    their live (not zombie) processes.
+    """
+    sessions = defaultdict(list)
+    for name in os.listdir(PROC):
+        if not name.isdigit():
+            continue
+        try:
+            stat = _stat(name)
+            if stat[0] == 'Z':
+                continue
+            sessions[int(stat[3])].append(int(name))
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+    return sessions
+
+
+def process_tree(pid, children=None):
+    """
+    Return the list of ids of the process ``pid`` and its descendants.
+    """
+    if children is None:
+        children = children_map()
+    tree = [pid]
+    i = 0
+    while i < len(tree):
+        tree.extend(children.get(tree[i], ()))
+        i += 1
+    return tree
+
+
+def process_usage(pid):
+    """
+    Return a dictionary with the resource usage of the process ``pid``:
+    ``threads``, ``cpu_time`` (seconds), ``rss`` and ``pss`` (bytes; pss
+    is None if the kernel does not provide it) and ``open_files``.
+    """
+    directory = os.path.join(PROC, str(pid))
+    stat = _stat(pid)
+    usage = {
+        'processes': 1,
+        # utime and stime
+        'cpu_time': (int(stat[11]) + int(stat[12])) / CLOCK_TICKS,
+        'threads': int(stat[17]),
+        'rss': 0,
+        'pss': None,
+        'open_files': 0,
+        }
+    for line in _read(os.path.join(directory, 'status')).splitlines():
+        if line.startswith('VmRSS:'):
+            usage['rss'] = int(line.split()[1]) * 1024
+            break
+    try:
+        for line in _read(
+                os.path.join(directory, 'smaps_rollup')).splitlines():
+            if line.startswith('Pss:'):
+                usage['pss'] = int(line.split()[1]) * 1024
+                break
+    except (IOError, OSError):
+        pass
+    try:
+        usage['open_files'] = len(os.listdir(os.path.join(directory, 'fd')))
+    except (IOError, OSError):
+        pass
+    return usage
+
+
+def tree_usage(pid, children=None):
+    """
+    Return the resource usage of the process ``pid`` and its descendants
+    (see :func:`process_usage`), or None if the process does not exist.
+    """
+    total = None
+    for p in process_tree(pid, children):
+        try:
+            usage = process_usage(p)
+        except (IOError, OSError, IndexError, ValueError):
+            # The process has finished.
+            continue
+        if total is None:
+            total = usage
+            continue
+        for field in USAGE_FIELDS:
+            if usage[field] is None or total[field] is None:
+                total[field] = None
+            else:
+                total[field] += usage[field]
+    if total is not None:
+        total['pid'] = pid
+    return total
+
+
+def host_memory():
+    """
+    Return a tuple ``(total, available)`` with the host memory in bytes,
+    or None if ``/proc/meminfo`` can not be read.
+    """
+    meminfo = {}
+    try:
+        for line in _read(os.path.join(PROC, 'meminfo')).splitlines():
+            key, value = line.split(':', 1)
+            meminfo[key] = int(value.split()[0]) * 1024
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    try:
+        total = meminfo['MemTotal']
+    except KeyError:
+        return None
+    available = meminfo.get('MemAvailable')
+    if available is None:
+        # Kernels older than 3.14
+        available = sum(meminfo.get(key, 0)
+                        for key in ('MemFree', 'Buffers', 'Cached'))
+    return total, available
+
+
+def memory_used_ratio():
+    """
+    Return the fraction of the host memory in use, or None if it is not
+    known.
+    """
+    memory = host_memory()
+    if memory is None or not memory[0]:
+        return None
+    total, available = memory
+    return (total - available) / total
+
+
+class TelemetrySampler(object):
+    """
+    Periodically records the resource usage of the worksheet processes.
+
+    INPUT:
+
+        - ``sources`` -- a function returning an iterable of ``(key, info,
+          usage)`` tuples, one for each worksheet process.  ``info`` is a
+          dictionary stored with the samples, and ``usage`` a function
+          of a ``children`` argument (see :func:`tree_usage`) returning
+          the resource usage of the process tree or None.
+
+        - ``interval`` -- a function returning the number of seconds
+          between samples.  Sampling is paused while it returns 0.
+    """
+
+    def __init__(self, sources, interval):
+        self.sources = sources
+        self.interval = interval
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+        Start sampling in a daemon thread, if it is not already running.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            interval = self.interval()
+            if interval > 0:
+                try:
+                    self.sample()
+                except Exception:
+                    traceback.print_exc()
+            sleep(interval if interval > 0 else 60)
+
+    def sample(self):
+        """
+        Record the resource usage of every worksheet process now.
+        """
+        samples = {}
+        t = walltime()
+        # /proc is walked once for all the process trees.
+        children = children_map()
+        for key, info, usage in self.sources():
+            u = usage(children)
+            if u is None:
+                continue
+            sample = dict(info)
+            sample.update(u)
+            sample['time'] = t
+            sample['cpu_percent'] = None
+            previous = self.samples.get(key)
+            if (previous is not None and previous['pid'] == u['pid'] and
+                    t > previous['time']):
+                sample['cpu_percent'] = 100 * max(
+                    0, u['cpu_time'] - previous['cpu_time']) / (
+                    t - previous['time'])
+            samples[key] = sample
+        with self._lock:
+            self.samples = samples
+
+    def by_worksheet(self):
+        """
+        Return the last samples, the most CPU hungry first.
+        """
+        with self._lock:
+            samples = list(self.samples.values())
+        return sorted(samples, key=lambda s: -(s['cpu_percent'] or 0))
+
+    def by_user(self):
+        """
+        Return the last samples added up by worksheet owner, the most CPU
+        hungry first.
+        """
+        users = {}
+        for sample in self.by_worksheet():
+            user = users.get(sample['owner'])
+            if user is None:
+                user = users[sample['owner']] = {
+                    'owner': sample['owner'], 'worksheets': 0,
+                    'cpu_percent': 0}
+                user.update((field, 0) for field in USAGE_FIELDS)
+            user['worksheets'] += 1
+            for field in USAGE_FIELDS + ('cpu_percent',):
+                if user[field] is not None:
+                    if sample[field] is None:
+                        user[field] = None
+                    else:
+                        user[field] += sample[field]
+        return sorted(users.values(), key=lambda u: -(u['cpu_percent'] or 0))
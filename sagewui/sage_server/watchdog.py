@@ -0,0 +1,186 @@
+"""
+sage_server watchdog
+
+Enforcement of the limits of the worksheet processes and removal of the
+processes they leave behind.
+
+AUTHORS:
+
+  - J Miguel Farto
+"""
+
+#############################################################################
+#
+#       Copyright (C) 2015 J Miguel Farto <jmfarto@gmail.com>
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  The full text of the GPL is available at:
+#                  http://www.gnu.org/licenses/
+#
+#############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import signal
+import threading
+import traceback
+from collections import defaultdict
+from time import sleep
+
+from .telemetry import children_map
+from .telemetry import process_start_time
+from .telemetry import session_map
+
+
+class ProcessWatchdog(object):
+    """
+    Periodically checks the worksheet processes.
+
+    Every check calls the ``update`` method of each worksheet process,
+    which quits the processes over their walltime or CPU time limits.  A
+    process is only updated if the lock of its worksheet is free, so that
+    it is not quit while a request is using it.  Otherwise, it is updated
+    on the next check.
+    Worksheet processes are started in their own session (see
+    :meth:`sagewui.sage_server.interfaces.SageServerExpect.start`), so
+    the session of a process that has been quit, or whose main process
+    has died, must be empty.  Every process left in it is killed, and the
+    session is checked again until it is.
+
+    INPUT:
+
+        - ``processes`` -- a function returning an iterable of pairs
+          ``(process, lock)`` with the running worksheet processes and the
+          locks of their worksheets (or None).
+
+        - ``interval`` -- a function returning the number of seconds
+          between checks.  Checking is paused while it returns 0.
+
+        - ``lock`` -- (default: None) a lock held while the list of the
+          worksheet processes is taken.
+    """
+
+    def __init__(self, processes, interval, lock=None):
+        self.processes = processes
+        self.interval = interval
+        self.killed = defaultdict(int)  # reason -> processes quit
+        self.reaped = 0  # processes killed in the session of a dead one
+        self.orphaned = 0  # sessions whose main process died
+        # Session id -> start time of its main process, of the running
+        # processes and of the sessions that must be empty
+        self._sessions = {}
+        self._dead = {}
+        self._lock = threading.Lock() if lock is None else lock
+        self._check_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+        Start checking in a daemon thread, if it is not already running.
+        """
+        with self._thread_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            interval = self.interval()
+            if interval > 0:
+                try:
+                    self.check()
+                except Exception:
+                    traceback.print_exc()
+            sleep(interval if interval > 0 else 60)
+
+    def check(self):
+        """
+        Update the worksheet processes and kill the processes left behind
+        by the dead ones now.
+
+        The lock is only held to take the list of the worksheet processes.
+        They are updated without it, since some of them (e.g. remote ones)
+        may take a while to answer.  A check is skipped if another one is
+        running.
+        """
+        if not self._check_lock.acquire(False):
+            return
+        try:
+            self._check()
+        finally:
+            self._check_lock.release()
+
+    def _check(self):
+        with self._lock:
+            running = list(self.processes())
+        sessions = {}  # session id -> start time of its main process
+        # The process trees of all the worksheet processes are read once.
+        children = children_map()
+        for S, lock in running:
+            if lock is None or lock.acquire(False):
+                try:
+                    reason = S.update(children)
+                finally:
+                    if lock is not None:
+                        lock.release()
+                if reason is not None:
+                    self.killed[reason] += 1
+            pid = S.pid()
+            if pid is not None:
+                sessions[pid] = process_start_time(pid)
+        # The processes that have just been quit are given until the next
+        # check to die.
+        dead = dict(self._dead)
+        for sid in set(self._sessions) - set(sessions):
+            self._dead[sid] = self._sessions[sid]
+        self._sessions = sessions
+
+        processes = session_map()
+        for sid in sessions:
+            if sid not in processes.get(sid, ()) and sid not in self._dead:
+                # The main process has died. Its children are orphans.
+                self.orphaned += 1
+                self._dead[sid] = dead[sid] = sessions[sid]
+        for sid, start in dead.items():
+            if sid not in sessions:
+                started = process_start_time(sid)
+                if (start is not None and started is not None and
+                        started != start):
+                    # The id is now used by another process.
+                    self._dead.pop(sid, None)
+                    continue
+                # Collect the exit status of the main process, if it is our
+                # child, so that it does not stay as a zombie.
+                try:
+                    os.waitpid(sid, os.WNOHANG)
+                except OSError:
+                    pass
+            pids = [pid for pid in processes.get(sid, ()) if pid != sid]
+            if sid in processes.get(sid, ()) and sid not in sessions:
+                pids.append(sid)
+            if not pids:
+                if sid not in sessions:
+                    self._dead.pop(sid, None)
+                continue
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                    self.reaped += 1
+                except OSError:
+                    pass
+
+    def stats(self):
+        """
+        Return a dictionary with the number of worksheet processes
+        ``killed`` by reason, of processes ``reaped`` and of ``orphaned``
+        sessions, and the number of sessions ``pending`` to be emptied.
+        """
+        return {'killed': dict(self.killed), 'reaped': self.reaped,
+                'orphaned': self.orphaned, 'pending': len(self._dead)}
@@ -21,18 +21,29 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
-import random
 
+import pexpect
+
+from .agent import SageServerAgent
 from .interfaces import SageServerExpect
 from .interfaces import SageServerExpectRemote
 from .interfaces import ProcessLimits
+from .scheduler import ServerPoolScheduler
 
 
 def sage(server_pool=None, max_vmem=None, max_walltime=None, max_cputime=None,
          max_processes=None, python='sage --python',
-         init_code=None):
+         init_code=None, scheduler=None, capacity=0,
+         remote_command='ssh -t {user_at_host} "{command}"'):
     """
     sage process factory
+
+    If ``server_pool`` is not empty, the process is started in the node
+    chosen by ``scheduler`` (a
+    :class:`sagewui.sage_server.scheduler.ServerPoolScheduler`) among
+    those running less than ``capacity`` processes, using
+    ``remote_command``, or through the compute agent (see
+    :mod:`sagewui.sage_server.agent`) for ``agent://`` entries.
     """
     sage_code = os.path.join(os.path.split(__file__)[0], 'sage_code')
 
@@ -45,8 +56,27 @@ def sage(server_pool=None, max_vmem=None, max_walltime=None, max_cputime=None,
         return SageServerExpect(
             process_limits=process_limits, init_code=init_code, python=python)
     else:
-        user_at_host = random.choice(server_pool)
-        return SageServerExpectRemote(
-            user_at_host=user_at_host,
-            process_limits=process_limits,
-            python=python, init_code=init_code, sage_code=sage_code)
+        if scheduler is None:
+            scheduler = ServerPoolScheduler()
+        # A node that fails to start the process gives its place back and
+        # is marked as down, so the next attempt goes to another node.
+        for attempt in range(len(server_pool), 0, -1):
+            # A RuntimeError is raised here if every node is full. There is
+            # no point in trying again then.
+            user_at_host = scheduler.choose(server_pool, capacity)
+            try:
+                if user_at_host.startswith('agent:'):
+                    return SageServerAgent(
+                        address=user_at_host,
+                        scheduler=scheduler, scheduled=True,
+                        process_limits=process_limits,
+                        python=python, init_code=init_code)
+                return SageServerExpectRemote(
+                    user_at_host=user_at_host,
+                    remote_command=remote_command,
+                    scheduler=scheduler, scheduled=True,
+                    process_limits=process_limits,
+                    python=python, init_code=init_code, sage_code=sage_code)
+            except (RuntimeError, pexpect.ExceptionPexpect, OSError):
+                if attempt == 1:
+                    raise
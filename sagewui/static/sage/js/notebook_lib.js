@@ -119,6 +119,12 @@ var update_error_threshold = 30;
 var update_error_delta = 1024;
 var update_normal_delta = update_falloff_deltas[0];
 var cell_output_delta = update_normal_delta;
+// Server-sent cell updates (see start_update_stream).  After a stream
+// fails, updates are polled until the next delay has passed.
+var update_stream = null;
+var update_stream_failures = 0;
+var update_stream_retry_time = 0;
+var update_stream_retry_deltas = [5000, 30000, 120000, 600000];
 
 // Introspection data.
 var introspect = {};
@@ -3490,10 +3496,57 @@ function check_for_cell_update_callback(status, response) {
 
     X = decode_response(response);
 
+    if (!update_cell(X)) {
+        return;
+    }
+
+    if (X.status === 'd') {
+        update_count = 0;
+        update_falloff_level = 0;
+        cell_output_delta = update_falloff_deltas[0];
+    } else {
+        if (update_count > update_falloff_threshold &&
+            update_falloff_level + 1 < update_falloff_deltas.length) {
+            update_falloff_level += 1;
+            update_count = 0;
+            cell_output_delta = update_falloff_deltas[update_falloff_level];
+        } else {
+            update_count += 1;
+        }
+    }
+
+    continue_update_check();
+}
+
+
+function update_cell(X) {
+    /*
+    Apply a cell update sent by the server, either as the response to
+    a cell_update request or as a cell_update_stream event.
+
+    INPUT:
+        X -- object; decoded cell update (see
+             check_for_cell_update_callback)
+    OUTPUT:
+        boolean; false if no more updates are expected
+    */
+    var eval_hook;
+
     if (X.status === 'e') {
         cancel_update_check();
         halt_queued_cells();
-        return;
+        return false;
+    }
+
+    if (X.interrupt_status) {
+        interrupt_status_update(X.interrupt_status);
+    }
+
+    // Tell the user that the cell is waiting for the server.
+    if (X.status !== 'd' && X.queue_position && !$.trim(X.output)) {
+        X.output = X.output_wrapped = translations[
+            'Waiting for the server. Position in the queue:'] + ' ' +
+            X.queue_position;
     }
 
     // Evaluate and update the cell's output.
@@ -3520,19 +3573,6 @@ function check_for_cell_update_callback(status, response) {
         if (X.new_input !== '') {
             set_input_text(X.id, X.new_input);
         }
-
-        update_count = 0;
-        update_falloff_level = 0;
-        cell_output_delta = update_falloff_deltas[0];
-    } else {
-        if (update_count > update_falloff_threshold &&
-            update_falloff_level + 1 < update_falloff_deltas.length) {
-            update_falloff_level += 1;
-            update_count = 0;
-            cell_output_delta = update_falloff_deltas[update_falloff_level];
-        } else {
-            update_count += 1;
-        }
     }
 
     if (eval_hook === 'trigger_interact') {
@@ -3541,7 +3581,7 @@ function check_for_cell_update_callback(status, response) {
         evaluate_cell(X.id, 0);
     }
 
-    continue_update_check();
+    return true;
 }
 
 
@@ -3555,6 +3595,12 @@ function continue_update_check() {
         check occurred.
     */
     var time_elapsed = time_now() - update_time;
+    if (window.EventSource && update_stream === null &&
+            time_now() >= update_stream_retry_time) {
+        // Polling after a failed stream: try the stream again.
+        start_update_stream();
+        return;
+    }
     if (time_elapsed < cell_output_delta) {
         update_timeout = setTimeout(function () {
             check_for_cell_update();
@@ -3584,12 +3630,72 @@ function start_update_check() {
     // updates.
     cell_output_delta = update_falloff_deltas[0];
 
+    if (window.EventSource && time_now() >= update_stream_retry_time) {
+        start_update_stream();
+        return;
+    }
+
     // Do one initial check without waiting, since some calculations
     // are very fast and doing this feels snappy.
     check_for_cell_update();
 }
 
 
+function start_update_stream() {
+    /*
+    Open a stream of server-sent cell updates for this worksheet.  The
+    server pushes the same objects returned by cell_update, so there
+    is no polling while the stream is open.  If the stream can not be
+    opened (e.g. the server has too many of them), we fall back to
+    polling for this update, and the stream is tried again after a delay
+    that grows with each failure.
+    */
+    var received = false;
+
+    update_stream = new EventSource(worksheet_command('cell_update_stream') +
+                                    '?ids=' + queue_id_list.join(','));
+
+    update_stream.onmessage = function (event) {
+        received = true;
+        update_error_count = 0;
+        update_stream_failures = 0;
+        try {
+            title_spinner_i = (title_spinner_i + 1) % title_spinner.length;
+            document.title = title_spinner[title_spinner_i] + original_title;
+        } catch (e) {}
+        update_cell(decode_response(event.data));
+    };
+
+    update_stream.onerror = function () {
+        // The browser reconnects by itself when an open stream ends.
+        // A stream that never worked or that the server refused is not
+        // available for now: poll instead.
+        if (received && update_stream.readyState !== EventSource.CLOSED) {
+            return;
+        }
+        close_update_stream();
+        update_stream_retry_time = time_now() + update_stream_retry_deltas[
+            Math.min(update_stream_failures,
+                     update_stream_retry_deltas.length - 1)];
+        update_stream_failures += 1;
+        if (updating) {
+            check_for_cell_update();
+        }
+    };
+}
+
+
+function close_update_stream() {
+    /*
+    Close the stream of server-sent cell updates, if any.
+    */
+    if (update_stream !== null) {
+        update_stream.close();
+        update_stream = null;
+    }
+}
+
+
 function cancel_update_check() {
     /*
     Turn off the loop that checks for now output updates in the
@@ -3600,6 +3706,7 @@ function cancel_update_check() {
     */
     updating = false;
     clearTimeout(update_timeout);
+    close_update_stream();
     document.title = original_title;
     reset_interrupts();
 }
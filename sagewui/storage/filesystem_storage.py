@@ -632,7 +632,8 @@ class FilesystemDatastore(Datastore):
             # todo -- add check if changed
             filename = self._worksheet_html_filename(username, id_number)
             with atomic_write(self._abspath(filename)) as f:
-                f.write(worksheet.body.encode('utf-8', 'ignore'))
+                for t in worksheet.iter_body():
+                    f.write(t.encode('utf-8', 'ignore'))
 
     def create_worksheet(self, username, id_number, **kwargs):
         """
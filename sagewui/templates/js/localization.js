@@ -31,6 +31,7 @@ translations = {
                       N_('Unable to interrupt calculation.'),
                       N_('Close this box to stop trying.'),
                       N_('Interrupt attempt'),
+                      N_('Waiting for the server. Position in the queue:'),
                       N_("<a href='javascript:restart_sage();'>Restart</a>, instead?"),
                       N_("Emptying the trash will permanently delete all items in the trash. Continue?"),
                       N_("Get Image"),
@@ -21,48 +21,42 @@
 function interrupt_callback(status, response) {
     /*
     Callback called after we send the interrupt signal to the server.
-    If the interrupt succeeds, we change the CSS/DOM to indicate that
-    no cells are currently computing.  If it fails, we display/update
-    a alert and repeat after a timeout.  If the signal doesn't make
-    it, we just reset any alerts.
+    If nothing is computing anymore, we change the CSS/DOM to indicate
+    that no cells are currently computing.  If the interrupt is pending,
+    the cell updates tell us how it goes (see interrupt_status_update).
+    If the signal doesn't make it, we just reset any alerts.
     */
-    var is = interrupt_state, message;
-    {% set timeout = 5 %}
-    var timeout = {{ timeout }};
-
-    if (response === 'failed') {
-        if (!is.count) {
-            is.count = 1;
-            message = translations['Unable to interrupt calculation.'] + " " + translations['Trying again in %(num)d second...'](timeout) + ' ' + translations['Close this box to stop trying.'];
-
-            is.alert = $.achtung({
-                className: 'interrupt-fail-notification',
-                message: message,
-                timeout: timeout,
-                hideEffects: false,
-                showEffects: false,
-                onCloseButton: function () {
-                    reset_interrupts();
-                },
-                onTimeout: function () {
-                    interrupt();
-                }
-            });
-            return;
-        }
-
-        is.count += 1;
-        message = translations['Interrupt attempt'] + " " + is.count;
-        if (is.count > 5) {
-            message += ". " + translations["<a href='javascript:restart_sage();'>Restart</a>, instead?"];
-        }
-        is.alert.achtung('update', {
-            message: message,
-            timeout: timeout
-        });
+    if (response === 'pending') {
+        return;
     } else if (status === 'success') {
         halt_queued_cells();
     } else {
         reset_interrupts();
     }
 }
+
+
+function interrupt_status_update(interrupt_status) {
+    /*
+    Called with the interrupt status of every cell update.  If the
+    server had to send the interrupt again, we display an alert until
+    the computation stops or the user closes it.
+    */
+    var is = interrupt_state;
+
+    if (interrupt_status !== 'escalated' || is.count) {
+        return;
+    }
+    is.count = 1;
+    is.alert = $.achtung({
+        className: 'interrupt-fail-notification',
+        message: translations['Unable to interrupt calculation.'] + ' ' +
+            translations["<a href='javascript:restart_sage();'>Restart</a>, instead?"],
+        timeout: 0,
+        hideEffects: false,
+        showEffects: false,
+        onCloseButton: function () {
+            is.alert = null;
+        }
+    });
+}
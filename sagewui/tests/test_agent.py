@@ -0,0 +1,283 @@
+"""
+Tests of the protocol of the compute agents
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import open
+
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from sagewui.sage_server import agent
+from sagewui.sage_server.agent import AgentConnection
+from sagewui.sage_server.agent import AgentError
+from sagewui.sage_server.agent import AgentTimeout
+from sagewui.sage_server.agent import ComputeAgent
+from sagewui.sage_server.agent import is_loopback
+from sagewui.sage_server.agent import parse_address
+from sagewui.sage_server.agent import recv_message
+from sagewui.sage_server.agent import SageServerAgent
+from sagewui.sage_server.agent import send_message
+
+# Initialization scripts of a worksheet process without Sage: it runs the
+# code with python and reports the files created.
+INIT = '''
+import sys
+import support as _support_
+
+
+def quit_sage():
+    sys.exit(0)
+'''
+SUPPORT = '''
+import base64
+import json
+import os
+import sys  # its prompt is set through this module
+
+STATUS_TRAILER = '___SAGE_STATUS___'
+
+
+def execute_code(code, globals, mode='raw', start_label='', print_time=False,
+                 tempdir=None, code_file=None):
+    code = base64.b64decode(code.encode('utf-8')).decode('utf-8')
+    if mode != 'raw':
+        print(start_label)
+    if tempdir is None:
+        exec(code, globals)
+        return
+    os.chdir(tempdir)
+    exec(code, globals)
+    print('\\n{}{}'.format(STATUS_TRAILER,
+                           json.dumps({'files': sorted(os.listdir(tempdir))})))
+'''
+
+
+class FramingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+
+    def test_messages(self):
+        messages = [{'id': 1, 'method': 'hello', 'params': {}},
+                    {'id': 2, 'result': 'á' * 100000}, []]
+
+        def send():
+            for message in messages:
+                send_message(self.a, message)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        for message in messages:
+            self.assertEqual(recv_message(self.b), message)
+        sender.join()
+
+    def test_message_in_pieces(self):
+        data = b'{"id": 3}'
+        frame = struct.pack('!I', len(data)) + data
+
+        def send():
+            for i in range(len(frame)):
+                self.a.sendall(frame[i:i + 1])
+                time.sleep(0.001)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        self.assertEqual(recv_message(self.b), {'id': 3})
+        sender.join()
+
+    def test_closed_connection(self):
+        self.a.sendall(struct.pack('!I', 10) + b'{"id"')
+        self.a.close()
+        self.assertRaises(EOFError, recv_message, self.b)
+
+    def test_message_too_large(self):
+        self.a.sendall(struct.pack('!I', agent.MAX_MESSAGE_SIZE + 1))
+        self.assertRaises(ValueError, recv_message, self.b)
+
+
+class ParseAddressTestCase(unittest.TestCase):
+    def test_pool_entries(self):
+        self.assertEqual(parse_address('agent://secret@node1:8765'),
+                         (socket.AF_INET, ('node1', 8765), 'secret'))
+        self.assertEqual(parse_address('agent://node1:8765'),
+                         (socket.AF_INET, ('node1', 8765), None))
+        self.assertEqual(parse_address('agent:///run/agent.sock'),
+                         (socket.AF_UNIX, '/run/agent.sock', None))
+
+    def test_listen_arguments(self):
+        self.assertEqual(parse_address('0.0.0.0:8765'),
+                         (socket.AF_INET, ('0.0.0.0', 8765), None))
+        self.assertEqual(parse_address('/run/agent.sock'),
+                         (socket.AF_UNIX, '/run/agent.sock', None))
+
+    def test_loopback(self):
+        self.assertTrue(is_loopback('/run/agent.sock'))
+        self.assertTrue(is_loopback('localhost:8765'))
+        self.assertTrue(is_loopback('127.0.0.1:8765'))
+        self.assertFalse(is_loopback('0.0.0.0:8765'))
+
+
+class AgentConnectionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, 'agent.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def serve(self, target):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.address)
+        listener.listen(1)
+        self.addCleanup(listener.close)
+        server = threading.Thread(target=target, args=(listener,))
+        server.daemon = True
+        server.start()
+
+    def agent(self, token=None):
+        compute_agent = ComputeAgent(self.address, token=token, workers=2)
+        server = threading.Thread(target=compute_agent.serve_forever)
+        server.daemon = True
+        server.start()
+        for _ in range(100):
+            if os.path.exists(self.address):
+                break
+            time.sleep(0.01)
+
+    def test_token(self):
+        self.agent(token='secret')
+        connection = AgentConnection('agent://wrong@' + self.address,
+                                     timeout=5)
+        self.assertRaises(AgentError, connection.call, 'update', kernel=1)
+        connection = AgentConnection('agent://secret@' + self.address,
+                                     timeout=5)
+        # Connected, but there is no such worksheet process.
+        with self.assertRaises(AgentError) as error:
+            connection.call('update', kernel=1)
+        self.assertNotIsInstance(error.exception, AgentTimeout)
+        self.assertIn('unknown worksheet process', str(error.exception))
+        self.assertEqual(connection.generation, 1)
+
+    def test_unreachable_agent(self):
+        connection = AgentConnection('agent://' + self.address, timeout=5)
+        self.assertRaises(AgentError, connection.call, 'update', kernel=1)
+
+    def test_timeout(self):
+        def silent(listener):
+            # Answers the hello, but no other request.
+            sock = listener.accept()[0]
+            message = recv_message(sock)
+            send_message(sock, {'id': message['id'], 'result': {}})
+            while True:
+                recv_message(sock)
+
+        self.serve(silent)
+        connection = AgentConnection('agent://' + self.address, timeout=60)
+        start = time.time()
+        self.assertRaises(AgentTimeout, connection.call, 'update',
+                          timeout=0.2, kernel=1)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(connection._pending, {})
+
+    def test_connection_lost(self):
+        closing = threading.Event()
+
+        def closes(listener):
+            # Answers the hello and one request, then closes the
+            # connection on the next one.
+            for _ in range(2):
+                sock = listener.accept()[0]
+                message = recv_message(sock)
+                send_message(sock, {'id': message['id'], 'result': {}})
+                message = recv_message(sock)
+                if closing.is_set():
+                    sock.close()
+                    continue
+                send_message(sock, {'id': message['id'], 'result': 'ok'})
+                closing.set()
+                recv_message(sock)
+                sock.close()
+
+        self.serve(closes)
+        connection = AgentConnection('agent://' + self.address, timeout=5)
+        self.assertEqual(connection.call('update', kernel=1), 'ok')
+        # The pending call fails at once, and the next one reconnects.
+        with self.assertRaises(AgentError) as error:
+            connection.call('update', kernel=1)
+        self.assertNotIsInstance(error.exception, AgentTimeout)
+        self.assertRaises(AgentError, connection.call, 'update', kernel=1)
+        self.assertEqual(connection.generation, 2)
+
+
+class SageServerAgentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sage_code = os.path.join(self.directory, 'sage_code')
+        os.mkdir(sage_code)
+        for name, text in (('init.py', INIT), ('support.py', SUPPORT)):
+            with open(os.path.join(sage_code, name), 'w') as f:
+                f.write(text)
+        address = os.path.join(self.directory, 'agent.sock')
+        compute_agent = ComputeAgent(address, token='secret', workers=2,
+                                     sage_code=sage_code)
+        server = threading.Thread(target=compute_agent.serve_forever)
+        server.daemon = True
+        server.start()
+        for _ in range(100):
+            if os.path.exists(address):
+                break
+            time.sleep(0.01)
+        self.address = 'agent://secret@' + address
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def wait(self, S, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = S.output_status()
+            if status.done:
+                return status
+            time.sleep(0.05)
+        self.fail('the worksheet process did not finish')
+
+    def test_worksheet_process(self):
+        S = SageServerAgent(self.address, python=sys.executable,
+                            init_code='x = 6')
+        self.addCleanup(S.quit)
+        self.assertTrue(S.is_started())
+        S.execute("print(x * 7)\nopen('a.txt', 'w').write('hello')",
+                  mode='python')
+        status = self.wait(S)
+        self.assertEqual(status.output.strip(), '42')
+        self.assertEqual([os.path.basename(f) for f in status.filenames],
+                         ['a.txt'])
+        with open(status.filenames[0]) as f:
+            self.assertEqual(f.read(), 'hello')
+
+        S.quit()
+        self.assertFalse(S.is_started())
+        # The agent has forgotten the process.
+        with self.assertRaises(AgentError) as error:
+            S._call('update')
+        self.assertIn('unknown worksheet process', str(error.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Tests of the memo of preparsed and compiled code of the worksheet process
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import unittest
+
+import sagewui.sage_server
+
+# The modules of the worksheet process are imported from their directory,
+# as the process does.
+sys.path.insert(0, os.path.join(
+    os.path.dirname(sagewui.sage_server.__file__), 'sage_code'))
+from code_cache import CodeCache
+
+
+class Counter(object):
+    # A function of code that counts its calls.
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, code):
+        self.calls += 1
+        return code.upper()
+
+
+class CodeCacheTestCase(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = CodeCache()
+        f = Counter()
+        self.assertEqual(cache.get('preparse', 'a = 1', f), 'A = 1')
+        self.assertEqual(cache.get('preparse', 'a = 1', f), 'A = 1')
+        self.assertEqual(f.calls, 1)
+        # The key is part of the entry.
+        self.assertEqual(cache.get('compile', 'a = 1', f), 'A = 1')
+        self.assertEqual(f.calls, 2)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2,
+                                         'entries': 2, 'size': 20})
+
+    def test_least_recently_used_is_evicted(self):
+        cache = CodeCache(max_entries=2)
+        f = Counter()
+        cache.get('k', 'a', f)
+        cache.get('k', 'b', f)
+        cache.get('k', 'a', f)
+        cache.get('k', 'c', f)  # evicts b
+        self.assertEqual(f.calls, 3)
+        cache.get('k', 'a', f)
+        cache.get('k', 'c', f)
+        self.assertEqual(f.calls, 3)
+        cache.get('k', 'b', f)
+        self.assertEqual(f.calls, 4)
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_size_bound(self):
+        cache = CodeCache(max_size=1000)
+        f = Counter()
+        for i in range(20):
+            cache.get('k', '{:049d}'.format(i), f)
+        stats = cache.stats()
+        self.assertLessEqual(stats['size'], 1000)
+        self.assertEqual(stats['entries'], 10)
+        # The last ones are kept.
+        cache.get('k', '{:049d}'.format(19), f)
+        self.assertEqual(f.calls, 20)
+
+    def test_long_code_is_not_kept(self):
+        cache = CodeCache(max_size=1000)
+        f = Counter()
+        code = 'x' * 60
+        cache.get('k', code, f)
+        cache.get('k', code, f)
+        self.assertEqual(f.calls, 2)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_values_that_are_not_text(self):
+        cache = CodeCache()
+        value = object()
+        self.assertIs(cache.get('k', 'code', lambda code: value), value)
+        self.assertIs(cache.get('k', 'code', lambda code: None), value)
+        self.assertEqual(cache.stats()['size'], 4)
+
+    def test_clear(self):
+        cache = CodeCache()
+        f = Counter()
+        cache.get('k', 'a', f)
+        cache.clear()
+        cache.get('k', 'a', f)
+        self.assertEqual(f.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
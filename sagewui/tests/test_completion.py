@@ -0,0 +1,106 @@
+"""
+Tests of the tab completion of the worksheet process
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+from builtins import range
+
+import gc
+import os
+import sys
+import types
+import unittest
+
+import sagewui.sage_server
+
+# The modules of the worksheet process are imported from their directory,
+# as the process does.
+sys.path.insert(0, os.path.join(
+    os.path.dirname(sagewui.sage_server.__file__), 'sage_code'))
+from completion import CompletionEngine
+from completion import prefixed
+from completion import top
+
+
+class HelpersTestCase(unittest.TestCase):
+    def test_prefixed(self):
+        names = ['a', 'ab', 'abc', 'abd', 'b', 'ba']
+        self.assertEqual(prefixed(names, 'ab'), ['ab', 'abc', 'abd'])
+        self.assertEqual(prefixed(names, 'c'), [])
+        self.assertEqual(prefixed(names, ''), names)
+
+    def test_top(self):
+        names = ['_a', '_b', 'c', 'd']
+        self.assertEqual(top(names, 3), ['c', 'd', '_a'])
+        self.assertEqual(top(names, 3, private=False), ['c', 'd'])
+        self.assertEqual(top(names, 1), ['c'])
+
+
+class CompletionEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = CompletionEngine()
+
+    def test_global_names(self):
+        globs = {'alpha': 1, 'beta': 2}
+        builtins = {'abs': abs}
+        self.assertEqual(
+            self.engine.complete_global('a', globs, builtins),
+            ['abs', 'alpha'])
+        globs['alpine'] = 3
+        self.assertEqual(
+            self.engine.complete_global('alp', globs, builtins),
+            ['alpha', 'alpine'])
+
+    def test_attributes_are_cached(self):
+        class Foo(object):
+            bar = 1
+            baz = 2
+
+        self.assertEqual(self.engine.complete_attribute(Foo(), 'ba'),
+                         ['bar', 'baz'])
+        x = Foo()
+        x.bat = 3
+        self.assertEqual(self.engine.complete_attribute(x, 'ba'),
+                         ['bar', 'bat', 'baz'])
+        self.assertEqual(self.engine.hits, 1)
+        # The class changes.
+        Foo.bax = 4
+        self.assertEqual(self.engine.complete_attribute(Foo(), 'ba'),
+                         ['bar', 'bax', 'baz'])
+        self.assertEqual(self.engine.misses, 2)
+
+    def test_modules(self):
+        module = types.ModuleType(str('module'))
+        module.foo = 1
+        self.assertEqual(self.engine.complete_attribute(module, 'fo'),
+                         ['foo'])
+        module.fob = 2
+        self.assertEqual(self.engine.complete_attribute(module, 'fo'),
+                         ['fob', 'foo'])
+
+    def test_redefined_class(self):
+        # The new class may have the id of the old one, and the same
+        # number of attributes.
+        for i in range(20):
+            cls = type(str('Foo'), (object,), {str('bar{}'.format(i)): i})
+            self.assertEqual(self.engine.complete_attribute(cls, 'bar'),
+                             ['bar{}'.format(i)])
+            del cls
+            gc.collect()
+
+    def test_bounded(self):
+        engine = CompletionEngine(max_objects=2)
+        classes = [type(str('Foo'), (object,), {}) for i in range(3)]
+        for cls in classes:
+            engine.complete_attribute(cls, '')
+        self.assertEqual(len(engine._attributes), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Tests of the cache of processed live documentation pages
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import open
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sagewui.util import doc_cache
+from sagewui.util.doc_cache import DocPageCache
+
+
+class DocPageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.processed = []
+        self._process_doc_page = doc_cache.process_doc_page
+        doc_cache.process_doc_page = self.process_doc_page
+
+    def tearDown(self):
+        doc_cache.process_doc_page = self._process_doc_page
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def process_doc_page(self, path):
+        # Stand-in for the Sphinx HTML processing.
+        self.processed.append(path)
+        with open(path, encoding='utf-8') as f:
+            return os.path.basename(path), f.read().upper()
+
+    def page(self, name, text, mtime=1000000000):
+        path = os.path.join(self.directory, 'html', name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_pages_are_processed_once(self):
+        cache = DocPageCache()
+        path = self.page('a.html', 'page a')
+        self.assertEqual(cache.get(path), ('a.html', 'PAGE A'))
+        self.assertEqual(cache.get(path), ('a.html', 'PAGE A'))
+        self.assertEqual(len(self.processed), 1)
+        self.assertEqual(cache.stats(), {'hits': 1, 'disk_hits': 0,
+                                         'misses': 1, 'pages': 1})
+
+    def test_modified_page_is_processed_again(self):
+        cache = DocPageCache()
+        path = self.page('a.html', 'page a')
+        cache.get(path)
+        # Same size, new modification time.
+        self.page('a.html', 'page b', mtime=1000000001)
+        self.assertEqual(cache.get(path), ('a.html', 'PAGE B'))
+        # Same modification time, new size.
+        self.page('a.html', 'page bb', mtime=1000000001)
+        self.assertEqual(cache.get(path), ('a.html', 'PAGE BB'))
+        self.assertEqual(len(self.processed), 3)
+
+    def test_least_recently_used_pages_leave_memory(self):
+        cache = DocPageCache(max_pages=2)
+        paths = [self.page('{}.html'.format(i), str(i)) for i in range(3)]
+        cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+        self.assertEqual(cache.stats()['pages'], 2)
+        cache.get(paths[0])
+        cache.get(paths[2])
+        self.assertEqual(len(self.processed), 3)
+        cache.get(paths[1])
+        self.assertEqual(len(self.processed), 4)
+
+    def test_pages_on_disk(self):
+        store = os.path.join(self.directory, 'cache')
+        path = self.page('a.html', 'page a')
+        DocPageCache(store).get(path)
+        # Another server process finds the page on disk.
+        cache = DocPageCache(store)
+        self.assertEqual(cache.get(path), ('a.html', 'PAGE A'))
+        self.assertEqual(len(self.processed), 1)
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+        # A page on disk is not used after the file changes.
+        self.page('a.html', 'page b', mtime=1000000001)
+        self.assertEqual(DocPageCache(store).get(path), ('a.html', 'PAGE B'))
+        self.assertEqual(len(self.processed), 2)
+
+    def test_stamp_includes_the_cache_version(self):
+        store = os.path.join(self.directory, 'cache')
+        path = self.page('a.html', 'page a')
+        DocPageCache(store).get(path)
+        version = doc_cache.CACHE_VERSION
+        doc_cache.CACHE_VERSION = version + 1
+        try:
+            DocPageCache(store).get(path)
+        finally:
+            doc_cache.CACHE_VERSION = version
+        self.assertEqual(len(self.processed), 2)
+
+    def test_preprocess(self):
+        store = os.path.join(self.directory, 'cache')
+        paths = [self.page('{}.html'.format(i), str(i)) for i in range(3)]
+        self.page('style.css', '')
+        cache = DocPageCache(store)
+        self.assertEqual(
+            cache.preprocess(os.path.join(self.directory, 'html')), 3)
+        self.assertEqual(
+            cache.preprocess(os.path.join(self.directory, 'html')), 0)
+        for path in paths:
+            cache.get(path)
+        self.assertEqual(len(self.processed), 3)
+        self.assertEqual(cache.stats()['disk_hits'], 3)
+
+    def test_missing_page(self):
+        cache = DocPageCache()
+        self.assertRaises(OSError, cache.get,
+                          os.path.join(self.directory, 'missing.html'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+"""
+Tests of the pool of live documentation worksheets
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+
+import unittest
+
+from sagewui.config import UN_SAGE
+from sagewui.gui import doc_pool
+from sagewui.gui.doc_pool import DocWorksheetPool
+
+
+class Clock(object):
+    # Stand-in for time.time, moved by hand.
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Worksheet(object):
+    # Stand-in for a worksheet of the _sage_ user.
+    def __init__(self, id_number, name=''):
+        self.id_number = id_number
+        self.name = name
+        self.running = False
+        self.evaluated = 0
+        self.resettable = True
+        self.quits = 0
+        self.clears = 0
+
+    def compute_process_has_been_started(self):
+        return self.running
+
+    def last_compute_walltime(self):
+        return self.evaluated
+
+    def reset_compute_process(self):
+        return self.running and self.resettable
+
+    def quit(self):
+        self.running = False
+        self.quits += 1
+
+    def clear(self):
+        self.clears += 1
+
+
+class Notebook(object):
+    # Stand-in for the notebook holding the worksheets.
+    def __init__(self, worksheets=()):
+        self.worksheets = {W.id_number: W for W in worksheets}
+
+    def user_wsts(self, username):
+        assert username == UN_SAGE
+        return list(self.worksheets.values())
+
+    def filename_wst(self, filename):
+        username, id_number = filename.split('/')
+        assert username == UN_SAGE
+        return self.worksheets[int(id_number)]
+
+    def create_wst(self, name, username):
+        assert username == UN_SAGE
+        W = Worksheet(max(self.worksheets) + 1 if self.worksheets else 0,
+                      name)
+        self.worksheets[W.id_number] = W
+        return W
+
+
+class DocWorksheetPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self._walltime = doc_pool.walltime
+        doc_pool.walltime = self.clock
+
+    def tearDown(self):
+        doc_pool.walltime = self._walltime
+
+    def pool(self, notebook, size=2, idle_kernels=1, timeout=60):
+        return DocWorksheetPool(notebook, lambda: size, lambda: idle_kernels,
+                                lambda: timeout)
+
+    def test_new_worksheets_up_to_the_size(self):
+        notebook = Notebook()
+        pool = self.pool(notebook)
+        W0 = pool.checkout()
+        W1 = pool.checkout()
+        self.assertEqual((W0.id_number, W1.id_number), (0, 1))
+        self.assertEqual((W0.clears, W1.clears), (1, 1))
+        self.assertEqual(pool.stats()['size'], 2)
+        self.assertEqual(pool.stats()['busy'], 2)
+
+    def test_previous_worksheets_are_reused(self):
+        scratch = Worksheet(0, 'scratch')
+        running = Worksheet(1)
+        running.running = True
+        notebook = Notebook([scratch, running, Worksheet(2), Worksheet(3),
+                             Worksheet(4)])
+        pool = self.pool(notebook)
+        self.assertEqual(pool.checkout().id_number, 2)
+        self.assertEqual(pool.checkout().id_number, 3)
+        self.assertEqual(pool.stats()['size'], 2)
+
+    def test_released_process_is_kept(self):
+        notebook = Notebook()
+        pool = self.pool(notebook)
+        W = pool.checkout()
+        W.running = True
+        self.assertTrue(pool.release(W))
+        # Released twice by the idle check.
+        self.assertTrue(pool.release(W))
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertIs(pool.checkout(), W)
+        self.assertTrue(W.running)
+        self.assertEqual(W.quits, 0)
+        self.assertEqual(pool.stats()['reused'], 1)
+
+    def test_idle_processes_are_bounded(self):
+        notebook = Notebook()
+        pool = self.pool(notebook)
+        W0 = pool.checkout()
+        W1 = pool.checkout()
+        W0.running = W1.running = True
+        self.assertTrue(pool.release(W0))
+        self.assertFalse(pool.release(W1))
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertEqual(pool.stats()['free'], 1)
+
+    def test_process_that_cannot_be_reset_is_not_kept(self):
+        notebook = Notebook()
+        pool = self.pool(notebook)
+        W = pool.checkout()
+        W.running = True
+        W.resettable = False
+        self.assertFalse(pool.release(W))
+        self.assertEqual(pool.stats()['free'], 1)
+
+    def test_worksheets_outside_the_pool_are_not_released(self):
+        notebook = Notebook([Worksheet(0)])
+        pool = self.pool(notebook)
+        self.assertFalse(pool.release(notebook.worksheets[0]))
+        pool.checkout()
+        self.assertFalse(pool.release(Worksheet(5)))
+
+    def test_exhausted_pool_quits_an_unused_worksheet(self):
+        notebook = Notebook()
+        pool = self.pool(notebook)
+        W0 = pool.checkout()
+        self.clock.now += 10
+        W1 = pool.checkout()
+        W0.running = W1.running = True
+        self.clock.now += 61
+        self.assertIs(pool.checkout(), W0)
+        self.assertEqual(W0.quits, 1)
+        self.assertEqual(W1.quits, 0)
+        self.assertEqual(pool.stats()['exhausted'], 1)
+
+    def test_worksheet_without_a_process_is_taken_first(self):
+        notebook = Notebook()
+        pool = self.pool(notebook)
+        W0 = pool.checkout()
+        W1 = pool.checkout()
+        W0.running = True
+        self.assertIs(pool.checkout(), W1)
+        self.assertEqual(pool.stats()['exhausted'], 0)
+
+    def test_busy_pool_refuses(self):
+        notebook = Notebook()
+        pool = self.pool(notebook)
+        W0 = pool.checkout()
+        W1 = pool.checkout()
+        W0.running = W1.running = True
+        # Both just opened.
+        self.assertIsNone(pool.checkout())
+        # Opened long ago, but evaluated recently.
+        self.clock.now += 120
+        W0.evaluated = W1.evaluated = self.clock.now - 30
+        self.assertIsNone(pool.checkout())
+        self.assertEqual(pool.stats()['refused'], 2)
+        self.assertEqual((W0.quits, W1.quits), (0, 0))
+        # The evaluations of one of them are old enough.
+        W1.evaluated = self.clock.now - 90
+        self.assertIs(pool.checkout(), W1)
+        self.assertEqual(W1.quits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Tests of the admission of worksheet evaluations
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from sagewui.sage_server import scheduler
+from sagewui.sage_server.scheduler import EvaluationScheduler
+
+
+class Clock(object):
+    # Stand-in for time.time, moved by hand.
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class EvaluationSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self._walltime = scheduler.walltime
+        scheduler.walltime = self.clock
+        self.scheduler = EvaluationScheduler(timeout=60)
+
+    def tearDown(self):
+        scheduler.walltime = self._walltime
+
+    def request(self, key, user, limit=2, user_limit=0):
+        return self.scheduler.request(key, user, limit=limit,
+                                      user_limit=user_limit)
+
+    def waiting(self, done):
+        return [(key, {'a': 'alice', 'b': 'bob'}[key[0]])
+                for key in ('a1', 'a2', 'a3', 'a4', 'b0')
+                if key not in done]
+
+    def test_no_limits(self):
+        for i in range(10):
+            self.assertTrue(self.request(i, 'alice', limit=0))
+
+    def test_limit(self):
+        self.assertTrue(self.request('a1', 'alice'))
+        self.assertTrue(self.request('b1', 'bob'))
+        self.assertFalse(self.request('c1', 'carol'))
+        self.assertEqual(self.scheduler.position('c1'), 1)
+        self.scheduler.release('a1')
+        self.assertTrue(self.request('c1', 'carol'))
+        self.assertIsNone(self.scheduler.position('c1'))
+
+    def test_user_limit(self):
+        self.assertTrue(self.request('a1', 'alice', limit=0, user_limit=1))
+        self.assertFalse(self.request('a2', 'alice', limit=0, user_limit=1))
+        self.assertTrue(self.request('b1', 'bob', limit=0, user_limit=1))
+        stats = self.scheduler.stats()
+        self.assertEqual(dict(stats['running']), {'alice': 1, 'bob': 1})
+        self.assertEqual(dict(stats['waiting']), {'alice': 1})
+
+    def test_fair_share(self):
+        # alice queues many evaluations before bob queues one.
+        self.assertTrue(self.request('a0', 'alice', limit=1))
+        for i in range(1, 5):
+            self.assertFalse(self.request('a%d' % i, 'alice', limit=1))
+        self.assertFalse(self.request('b0', 'bob', limit=1))
+        # alice is computing already, so bob goes first.
+        self.assertEqual(self.scheduler.position('b0'), 1)
+        self.assertEqual(self.scheduler.position('a1'), 2)
+        order = []
+        running = 'a0'
+        while len(order) < 5:
+            self.scheduler.release(running)
+            for key, user in self.waiting(order):
+                if self.request(key, user, limit=1):
+                    running = key
+                    order.append(key)
+        self.assertEqual(order, ['b0', 'a1', 'a2', 'a3', 'a4'])
+
+    def test_abandoned_requests_expire(self):
+        self.assertTrue(self.request('a1', 'alice', limit=1))
+        self.assertFalse(self.request('b1', 'bob', limit=1))
+        self.assertFalse(self.request('c1', 'carol', limit=1))
+        # a1 keeps computing, b1 is polled, c1 is abandoned.
+        self.clock.now += 50
+        self.assertTrue(self.request('a1', 'alice', limit=1))
+        self.assertFalse(self.request('b1', 'bob', limit=1))
+        self.clock.now += 20
+        self.assertFalse(self.request('b1', 'bob', limit=1))
+        self.assertIsNone(self.scheduler.position('c1'))
+        self.assertEqual(self.scheduler.position('b1'), 1)
+
+    def test_confirmed_evaluations_do_not_expire(self):
+        self.assertTrue(self.request('a1', 'alice', limit=1))
+        self.clock.now += 3600
+        self.assertFalse(self.request('b1', 'bob', limit=1))
+        self.assertEqual(dict(self.scheduler.stats()['running']),
+                         {'alice': 1})
+
+    def test_admitted_but_unconfirmed_evaluations_expire(self):
+        self.assertTrue(self.request('a1', 'alice', limit=1))
+        self.assertFalse(self.request('b1', 'bob', limit=1))
+        self.scheduler.release('a1')
+        # b1 is admitted by the next request of someone else, but it is
+        # not polled anymore.
+        self.assertFalse(self.request('c1', 'carol', limit=1))
+        self.clock.now += 61
+        self.assertTrue(self.request('c1', 'carol', limit=1))
+
+    def test_release_unknown_key(self):
+        self.scheduler.release('nothing')
+        self.assertTrue(self.request('a1', 'alice', limit=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Tests of the parsing of the output of the worksheet processes
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import open
+from builtins import range
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sagewui.sage_server.interfaces import SageServerExpect
+from sagewui.sage_server.interfaces import STATUS_TRAILER
+from sagewui.sage_server.output import OutputSink
+
+
+class Process(SageServerExpect):
+    # A worksheet process that is never started.
+    def execute(self, code, *args, **kwds):
+        pass
+
+
+class ReceivedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spill = os.path.join(self.directory, 'full_output.txt')
+        # The state left by execute.
+        self.S = S = Process()
+        S._is_ready = True
+        S._is_computing = True
+        S._start_label = 'START1'
+        S._sink = OutputSink(self.spill, max_output=1000, max_lines=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def status(self, files=()):
+        return '\n{}{}\n{}'.format(
+            STATUS_TRAILER, json.dumps({'files': list(files)}),
+            self.S._prompt)
+
+    def test_output(self):
+        S = self.S
+        for text in ('START', '1\nhello\n', self.status(['a.png'])):
+            S._received(text)
+        self.assertFalse(S._is_computing)
+        self.assertEqual(S._sink.getvalue(), '\nhello\n')
+        self.assertEqual(S._status, {'files': ['a.png']})
+
+    def test_status_in_pieces(self):
+        S = self.S
+        S._received('START1\nhello')
+        for c in self.status(['a.png']):
+            S._received(c)
+        self.assertEqual(S._sink.getvalue(), '\nhello')
+        self.assertEqual(S._status, {'files': ['a.png']})
+
+    def test_trailer_printed_by_the_execution(self):
+        S = self.S
+        S._received('START1\n')
+        S._received('{}{{"files": ["x"]}}\n'.format(STATUS_TRAILER))
+        line = 'y' * 99 + '\n'
+        for i in range(10000):
+            S._received(line)
+            self.assertLess(len(S._held), 100)
+        S._received(self.status())
+        self.assertTrue(S._sink.truncated)
+        self.assertEqual(S._status, {'files': []})
+        with open(self.spill, encoding='utf-8') as f:
+            full = f.read()
+        self.assertEqual(
+            full, '\n{}{{"files": ["x"]}}\n'.format(STATUS_TRAILER) +
+            line * 10000)
+
+    def test_trailer_in_a_long_line(self):
+        S = self.S
+        S._received('START1\n' + STATUS_TRAILER)
+        for i in range(1000):
+            S._received('y' * 1000)
+        self.assertLess(len(S._held), 1 << 17)
+        S._received(self.status())
+        self.assertEqual(S._status, {'files': []})
+        self.assertEqual(os.path.getsize(self.spill),
+                         1 + len(STATUS_TRAILER) + 1000 * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Tests of the bounded capture of the output of an execution
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import open
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sagewui.sage_server.output import output_head
+from sagewui.sage_server.output import output_tail
+from sagewui.sage_server.output import OutputSink
+from sagewui.sage_server.output import TRUNCATED
+
+
+class OutputHelpersTestCase(unittest.TestCase):
+    def test_head_and_tail_by_lines(self):
+        text = ''.join('{}\n'.format(i) for i in range(10))
+        self.assertEqual(output_head(text, 1000, 4), '0\n1')
+        self.assertEqual(output_tail(text, 1000, 4), '8\n9')
+
+    def test_head_and_tail_by_characters(self):
+        text = 'x' * 50 + 'y' * 50
+        self.assertEqual(output_head(text, 20, 100), 'x' * 10)
+        self.assertEqual(output_tail(text, 20, 100), 'y' * 10)
+
+    def test_short_text(self):
+        self.assertEqual(output_head('a\n', 100, 10), 'a')
+        self.assertEqual(output_tail('a\n', 100, 10), 'a')
+
+
+class OutputSinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spill = os.path.join(self.directory, 'full_output.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def read_spill(self):
+        with open(self.spill, encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def test_short_output_is_kept_whole(self):
+        sink = OutputSink(self.spill, max_output=100, max_lines=10)
+        sink.write('hello ')
+        sink.write('world\n')
+        sink.close()
+        self.assertFalse(sink.truncated)
+        self.assertEqual(sink.getvalue(), 'hello world\n')
+        self.assertFalse(os.path.exists(self.spill))
+
+    def test_too_many_characters(self):
+        sink = OutputSink(self.spill, max_output=100, max_lines=1000)
+        text = ''.join(chr(ord('a') + i % 26) for i in range(1000))
+        for i in range(0, len(text), 7):
+            sink.write(text[i:i + 7])
+        sink.close()
+        self.assertTrue(sink.truncated)
+        self.assertEqual(sink.size, 1000)
+        value = sink.getvalue(url='cell://full_output.txt')
+        self.assertTrue(value.startswith(TRUNCATED))
+        self.assertIn('cell://full_output.txt', value)
+        self.assertIn(text[:50], value)
+        self.assertTrue(value.endswith(text[-50:]))
+        self.assertEqual(self.read_spill(), text)
+
+    def test_too_many_lines(self):
+        sink = OutputSink(self.spill, max_output=10000, max_lines=10)
+        lines = ['line {}\n'.format(i) for i in range(100)]
+        for line in lines:
+            sink.write(line)
+        sink.close()
+        self.assertTrue(sink.truncated)
+        self.assertEqual(sink.lines, 100)
+        value = sink.getvalue()
+        self.assertIn('line 4\n', value)
+        self.assertNotIn('line 5\n', value)
+        self.assertNotIn('line 94\n', value)
+        self.assertTrue(value.endswith('line 99'))
+        self.assertEqual(self.read_spill(), ''.join(lines))
+
+    def test_memory_is_bounded(self):
+        sink = OutputSink(self.spill, max_output=100, max_lines=10)
+        for i in range(10000):
+            sink.write('{}\n'.format(i))
+            self.assertLessEqual(sink._length, 100 + len('{}\n'.format(i)))
+        sink.close()
+        self.assertEqual(self.read_spill(),
+                         ''.join('{}\n'.format(i) for i in range(10000)))
+
+    def test_large_write(self):
+        sink = OutputSink(self.spill, max_output=100, max_lines=10)
+        text = 'z' * 10000
+        sink.write(text)
+        self.assertEqual(sink._length, 50)
+        sink.close()
+        self.assertEqual(self.read_spill(), text)
+
+    def test_no_spill(self):
+        sink = OutputSink(max_output=100, max_lines=10)
+        sink.write('x' * 1000)
+        sink.close()
+        self.assertTrue(sink.truncated)
+        self.assertNotIn('<html>', sink.getvalue())
+
+    def test_no_limit(self):
+        sink = OutputSink(self.spill, max_output=None)
+        text = 'x\n' * 10000
+        sink.write(text)
+        sink.close()
+        self.assertFalse(sink.truncated)
+        self.assertEqual(sink.getvalue(), text)
+        self.assertFalse(os.path.exists(self.spill))
+
+
+if __name__ == '__main__':
+    unittest.main()
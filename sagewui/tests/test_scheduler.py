@@ -0,0 +1,150 @@
+"""
+Tests of the placement of worksheet processes on a server pool
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from sagewui.sage_server import scheduler
+from sagewui.sage_server.scheduler import node_label
+from sagewui.sage_server.scheduler import ServerPoolScheduler
+
+
+class Clock(object):
+    # Stand-in for time.time, moved by hand.
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ServerPoolSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self._walltime = scheduler.walltime
+        scheduler.walltime = self.clock
+        self.scheduler = ServerPoolScheduler(
+            retry_interval=30, max_retry_interval=100)
+        self.pool = ['a@x', 'b@y']
+
+    def tearDown(self):
+        scheduler.walltime = self._walltime
+
+    def stats(self):
+        return dict((node['user_at_host'], node)
+                    for node in self.scheduler.stats(self.pool))
+
+    def test_choose_reserves_a_place(self):
+        first = self.scheduler.choose(self.pool)
+        second = self.scheduler.choose(self.pool)
+        self.assertEqual(set([first, second]), set(self.pool))
+        stats = self.stats()
+        for node in self.pool:
+            self.assertEqual(stats[node]['kernels'], 1)
+            self.assertEqual(stats[node]['starting'], 1)
+
+    def test_capacity(self):
+        for i in range(4):
+            self.scheduler.choose(self.pool, capacity=2)
+        self.assertRaises(RuntimeError, self.scheduler.choose, self.pool, 2)
+        self.scheduler.kernel_stopped('a@x', starting=True)
+        self.assertEqual(self.scheduler.choose(self.pool, capacity=2),
+                         'a@x')
+
+    def test_least_loaded_then_fastest(self):
+        for node, latency in (('a@x', 2.0), ('b@y', 1.0)):
+            self.scheduler.kernel_starting(node)
+            self.scheduler.kernel_ready(node, latency)
+        self.assertEqual(self.scheduler.choose(self.pool), 'b@y')
+        # b@y runs two processes now.
+        self.assertEqual(self.scheduler.choose(self.pool), 'a@x')
+
+    def test_failed_node_is_down_for_a_while(self):
+        self.scheduler.kernel_starting('a@x')
+        self.scheduler.kernel_failed('a@x')
+        self.scheduler.kernel_stopped('a@x')
+        stats = self.stats()
+        self.assertFalse(stats['a@x']['healthy'])
+        self.assertEqual(stats['a@x']['failures'], 1)
+        self.assertEqual(stats['a@x']['starting'], 0)
+        self.assertEqual(stats['a@x']['kernels'], 0)
+        for i in range(3):
+            node = self.scheduler.choose(self.pool)
+            self.assertEqual(node, 'b@y')
+            self.scheduler.kernel_stopped(node, starting=True)
+
+        self.clock.now += 31
+        self.assertTrue(self.stats()['a@x']['healthy'])
+
+    def test_retry_interval_doubles_up_to_the_maximum(self):
+        down_for = []
+        for i in range(4):
+            self.scheduler.kernel_failed('a@x')
+            down_for.append(self.stats()['a@x']['down_for'])
+        self.assertEqual(down_for, [30, 60, 100, 100])
+
+    def test_ready_clears_the_failures(self):
+        self.scheduler.kernel_starting('a@x')
+        self.scheduler.kernel_failed('a@x')
+        self.scheduler.kernel_ready('a@x', 1.0)
+        self.assertTrue(self.stats()['a@x']['healthy'])
+
+    def test_every_node_down(self):
+        self.scheduler.kernel_failed('a@x')
+        self.clock.now += 10
+        self.scheduler.kernel_failed('b@y')
+        # The node that comes back first is tried.
+        self.assertEqual(self.scheduler.choose(self.pool), 'a@x')
+
+    def test_quit_before_answering_is_not_a_failure(self):
+        node = self.scheduler.choose(self.pool)
+        self.scheduler.kernel_stopped(node, starting=True)
+        stats = self.stats()[node]
+        self.assertTrue(stats['healthy'])
+        self.assertEqual(stats['failures'], 0)
+        self.assertEqual(stats['starting'], 0)
+        self.assertEqual(stats['kernels'], 0)
+
+    def test_stats_keep_nodes_with_processes(self):
+        self.scheduler.kernel_starting('c@z')
+        nodes = [node['user_at_host'] for node in
+                 self.scheduler.stats(self.pool)]
+        self.assertEqual(nodes, ['c@z', 'a@x', 'b@y'])
+        self.scheduler.kernel_stopped('c@z', starting=True)
+        nodes = [node['user_at_host'] for node in
+                 self.scheduler.stats(self.pool)]
+        self.assertEqual(nodes, ['a@x', 'b@y'])
+
+
+class NodeLabelTestCase(unittest.TestCase):
+    def test_credentials_are_removed(self):
+        self.assertEqual(node_label('agent://secret@host:8765'),
+                         'agent://host:8765')
+        self.assertEqual(node_label('agent://secret@/run/agent.sock'),
+                         'agent:///run/agent.sock')
+
+    def test_other_entries_are_kept(self):
+        for entry in ('user@host', 'agent://host:8765',
+                      'agent:///run/agent.sock'):
+            self.assertEqual(node_label(entry), entry)
+
+    def test_nodes_are_shown_without_credentials(self):
+        pool = ['agent://secret@host:8765']
+        S = ServerPoolScheduler()
+        self.assertEqual(S.choose(pool), pool[0])
+        S.kernel_ready('agent://host:8765', 1.0)
+        stats = S.stats(pool)
+        self.assertEqual([node['user_at_host'] for node in stats],
+                         ['agent://host:8765'])
+        self.assertEqual(stats[0]['started'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
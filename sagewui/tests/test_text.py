@@ -0,0 +1,103 @@
+"""
+Tests of the parser of worksheet bodies against the regular expressions
+it replaced
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import range
+
+import random
+import re
+import unittest
+
+from sagewui.util.text import iter_cells
+from sagewui.util.text import meta_re
+
+extract_cells_re = re.compile(
+    r'\s*(.*?)\s*'
+    r'(?:(?<=\n)|^)\{\{\{'
+    r'(?:([^\n]*)\|)?\n+'
+    r'(.*?)\n*'
+    r'(?:(?<=\n)///\n+(.*?))?\n*'
+    r'(?<=\n)\}\}\}(?:\n+|$)',
+    flags=re.DOTALL)
+split_last_text_re = re.compile(r'(.*\n+}}})(?:\n+|$)\s*(.*)\s*',
+                                flags=re.DOTALL)
+
+
+def regex_cells(text):
+    # The parser before the tokenizer.  The trailing whitespace of the
+    # last text cell, which it kept, is removed.
+    split_last = split_last_text_re.findall(text)
+    text, last_text_cell = split_last[0] if split_last else ('', text.strip())
+    cells = []
+    for txt, meta, inp, outp in extract_cells_re.findall(text):
+        if txt:
+            cells.append(('plain', txt))
+        meta = dict(meta_re.findall(meta))
+        idx = None if 'id' not in meta else int(meta['id'])
+        cells.append(('compute', (idx, inp, outp)))
+    last_text_cell = last_text_cell.strip()
+    if last_text_cell:
+        cells.append(('plain', last_text_cell))
+    return cells
+
+
+# Pieces of the text of the cells, with the cell delimiters in the middle
+# of lines.
+FRAGMENTS = ['x', ' ', '2+2', '<p>a</p>', '\n', '\n\n', 'a{{{', '}}}b',
+             'a}}}', ' ///', '/// ', '|', 'id=3']
+
+
+class IterCellsTestCase(unittest.TestCase):
+    def test_cells(self):
+        text = ('<p>a</p>\n\n{{{id=3|\n2+3\n///\n5\n}}}\n\n'
+                '{{{\nprint(1)\n\n}}}\n<p>b</p>\n')
+        self.assertEqual(list(iter_cells(text)), [
+            ('plain', '<p>a</p>'),
+            ('compute', (3, '2+3', '5')),
+            ('compute', (None, 'print(1)', '')),
+            ('plain', '<p>b</p>')])
+
+    def test_unfinished_cell_is_text(self):
+        text = '<p>a</p>\n{{{id=3|\n2+3\n///\n5\n'
+        self.assertEqual(list(iter_cells(text)), [('plain', text.strip())])
+
+    def test_cells_are_found_as_the_text_is_read(self):
+        cells = iter_cells('{{{id=0|\n1\n}}}\n' + '{{{\n' * 10000)
+        self.assertEqual(next(cells), ('compute', (0, '1', '')))
+
+    def test_same_cells_as_the_regular_expressions(self):
+        rnd = random.Random(0)
+
+        def noise(k):
+            return ''.join(rnd.choice(FRAGMENTS)
+                           for _ in range(rnd.randint(0, k)))
+
+        def newlines():
+            return '\n' * rnd.randint(1, 2)
+
+        for _ in range(2000):
+            parts = []
+            for _ in range(rnd.randint(0, 6)):
+                if rnd.random() < 0.5:
+                    parts.append(noise(8))
+                    continue
+                cell = '{{{' + rnd.choice(
+                    ['', 'id=0|', 'id=17|', 'id=4, foo=bar|'])
+                cell += newlines() + noise(8)
+                if rnd.random() < 0.6:
+                    cell += newlines() + '///' + newlines() + noise(8)
+                parts.append(cell + newlines() + '}}}')
+            text = newlines().join(parts)
+            self.assertEqual(list(iter_cells(text)), regex_cells(text),
+                             repr(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
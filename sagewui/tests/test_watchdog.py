@@ -0,0 +1,51 @@
+"""
+Tests of the checks of the worksheet processes
+
+Run them with ``python -m unittest discover sagewui/tests``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+
+import threading
+import unittest
+
+from sagewui.sage_server.watchdog import ProcessWatchdog
+
+
+class Process(object):
+    # Stand-in for a worksheet process over its limits, without a
+    # process of this host.
+    def __init__(self):
+        self.updates = 0
+
+    def update(self, children=None):
+        self.updates += 1
+        return 'walltime'
+
+    def pid(self):
+        return None
+
+
+class ProcessWatchdogTestCase(unittest.TestCase):
+    def test_busy_processes_are_skipped(self):
+        free = Process()
+        busy = Process()
+        lock = threading.Lock()
+        watchdog = ProcessWatchdog(
+            lambda: [(free, threading.Lock()), (busy, lock), (free, None)],
+            interval=lambda: 0)
+        with lock:
+            watchdog.check()
+        self.assertEqual((free.updates, busy.updates), (2, 0))
+        self.assertEqual(watchdog.stats()['killed'], {'walltime': 2})
+        watchdog.check()
+        self.assertEqual(busy.updates, 1)
+        self.assertFalse(lock.locked())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,7 @@ from builtins import range
 import errno
 import os
 import resource
+import shutil
 import signal
 import socket
 import stat
@@ -247,6 +248,38 @@ def ignore_nonexistent_files(curdir, dirlist):
     return ignore
 
 
+def move_path(src, dst):
+    """
+    Move the file or directory ``src`` to ``dst``.
+
+    The move is a rename if both are on the same filesystem and ``src``
+    is ours.  Otherwise (e.g., ``src`` is in the temporary directory of
+    a worksheet process run by another user), ``src`` is copied and then
+    removed as far as possible.
+
+    OUTPUT:
+
+    - a boolean; whether ``src`` was renamed.
+    """
+    try:
+        # Files of other users must be copied, so that they are ours.
+        if os.lstat(src).st_uid == os.getuid():
+            os.rename(src, dst)
+            return True
+    except OSError:
+        pass
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, ignore=ignore_nonexistent_files)
+        shutil.rmtree(src, ignore_errors=True)
+    else:
+        shutil.copy(src, dst)
+        try:
+            os.unlink(src)
+        except OSError:
+            pass
+    return False
+
+
 def word_wrap(s, ncols=85):
     t = []
     if ncols == 0:
@@ -255,22 +288,22 @@ def word_wrap(s, ncols=85):
         if len(x) == 0 or x.lstrip()[:5] == 'sage:':
             t.append(x)
             continue
-        while len(x) > ncols:
-            k = ncols
-            while k > 0 and x[k] != ' ':
-                k -= 1
-            if k == 0:
+        # Lines are not sliced while they are wrapped, so that long lines
+        # take linear time.
+        p = 0
+        n = len(x)
+        while n - p > ncols:
+            k = x.rfind(' ', p + 1, p + ncols + 1) - p
+            if k < 0:
                 k = ncols
                 end = '\\'
             else:
                 end = ''
-            t.append(x[:k] + end)
-            x = x[k:]
-            k = 0
-            while k < len(x) and x[k] == ' ':
-                k += 1
-            x = x[k:]
-        t.append(x)
+            t.append(x[p:p + k] + end)
+            p += k
+            while p < n and x[p] == ' ':
+                p += 1
+        t.append(x[p:])
     return '\n'.join(t)
 
 
@@ -3,6 +3,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import hmac
+from collections import defaultdict
 from functools import wraps
 from threading import Lock
 
@@ -19,6 +21,8 @@ from .templates import message as message_template
 _ = gettext
 
 global_lock = Lock()
+# Locks of the worksheets in use, by filename
+worksheet_locks = defaultdict(Lock)
 
 
 def login_required(f):
@@ -52,6 +56,30 @@ def admin_required(f):
     return wrapper
 
 
+def admin_or_token_required(option):
+    """
+    Like :func:`admin_required`, but requests with the header
+    ``Authorization: Bearer <token>`` (e.g. from a metrics collector) are
+    also allowed, if ``<token>`` is the value of the notebook option
+    ``option``, which must not be empty.
+    """
+    def decorator(f):
+        admin_f = admin_required(f)
+
+        @wraps(f)
+        def wrapper(*args, **kwds):
+            token = g.notebook.conf[option]
+            scheme, _, given = request.headers.get(
+                'Authorization', '').partition(' ')
+            if (token and scheme.lower() == 'bearer' and
+                    hmac.compare_digest(given.strip().encode('utf-8'),
+                                        token.encode('utf-8'))):
+                return f(*args, **kwds)
+            return admin_f(*args, **kwds)
+        return wrapper
+    return decorator
+
+
 def guest_or_login_required(f):
     @wraps(f)
     def wrapper(*args, **kwds):
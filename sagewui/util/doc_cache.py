@@ -0,0 +1,178 @@
+"""
+Cache of the live documentation pages
+
+Opening a page of the documentation as a live worksheet needs its Sphinx
+HTML processed into worksheet text (see
+:class:`sagewui.util.docHTMLProcessor.SphinxHTMLProcessor`).  The result
+only depends on the file, so it is kept by path, and used while the file
+keeps its modification time and size: the most recently used pages in
+memory and all of them on disk, where the whole documentation can be
+processed in advance (see ``util/preprocess_docs.py``).
+
+AUTHORS:
+
+  - J Miguel Farto
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import object
+from builtins import open
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from tempfile import NamedTemporaryFile
+
+from .docHTMLProcessor import SphinxHTMLProcessor
+from .text import extract_title_re
+
+# Changed whenever the processing of the pages changes, so that the pages
+# processed before are not used.
+CACHE_VERSION = 1
+
+
+def process_doc_page(path):
+    """
+    Return the title (None if the page has none) and the worksheet text
+    of the Sphinx HTML page ``path``.
+    """
+    with open(path, encoding='utf-8') as f:
+        doc_page_html = f.read()
+    title = extract_title_re.search(doc_page_html)
+    if title is not None:
+        title = title.groups()[0]
+    return title, SphinxHTMLProcessor().process_doc_html(doc_page_html)
+
+
+class DocPageCache(object):
+    """
+    Processed live documentation pages.
+
+    INPUT:
+
+        - ``directory`` -- (default: None) a directory where the pages are
+          kept across restarts.  If None, they are only kept in memory.
+
+        - ``max_pages`` -- (default: 64) number of pages kept in memory.
+    """
+
+    def __init__(self, directory=None, max_pages=64):
+        self.directory = directory
+        self.max_pages = max_pages
+        self.hits = 0  # pages found in memory
+        self.disk_hits = 0  # pages found on disk
+        self.misses = 0  # pages processed
+        self._pages = OrderedDict()  # path -> (stamp, title, text)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path):
+        st = os.stat(path)
+        return [CACHE_VERSION, st.st_mtime, st.st_size]
+
+    def _filename(self, path):
+        return os.path.join(self.directory, '{}.json'.format(
+            hashlib.sha1(path.encode('utf-8')).hexdigest()))
+
+    def _read(self, path, stamp):
+        try:
+            with open(self._filename(path), encoding='utf-8') as f:
+                page = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if page.get('path') != path or page.get('stamp') != stamp:
+            return None
+        return page['title'], page['text']
+
+    def _write(self, path, stamp, title, text):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        data = json.dumps({'path': path, 'stamp': stamp,
+                           'title': title, 'text': text})
+        # Written to a temporary file first, so that a reader never finds
+        # a partial page.
+        with NamedTemporaryFile('wb', dir=self.directory, suffix='.tmp',
+                                delete=False) as f:
+            f.write(data.encode('utf-8'))
+        os.rename(f.name, self._filename(path))
+
+    def get(self, path):
+        """
+        Return the title (None if the page has none) and the worksheet text
+        of the documentation page ``path``.
+
+        Raises OSError (IOError) if the page can not be read.
+        """
+        path = os.path.abspath(path)
+        stamp = self._stamp(path)
+        with self._lock:
+            page = self._pages.pop(path, None)
+            if page is not None and page[0] == stamp:
+                self._pages[path] = page
+                self.hits += 1
+                return page[1:]
+
+        page = None
+        if self.directory is not None:
+            page = self._read(path, stamp)
+        if page is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            page = process_doc_page(path)
+            if self.directory is not None:
+                try:
+                    self._write(path, stamp, *page)
+                except (IOError, OSError):
+                    pass
+
+        with self._lock:
+            self._pages[path] = (stamp,) + tuple(page)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return tuple(page)
+
+    def preprocess(self, root, callback=None):
+        """
+        Process every HTML page under the directory ``root`` that is not on
+        disk yet, and return the number of pages processed.
+
+        ``callback``, if given, is called with the path of each page and
+        the exception raised processing it, or None.
+        """
+        if self.directory is None:
+            raise ValueError('the pages can only be processed in advance '
+                             'for a cache on disk')
+        processed = 0
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.html'):
+                    continue
+                path = os.path.abspath(os.path.join(dirpath, filename))
+                try:
+                    stamp = self._stamp(path)
+                    if self._read(path, stamp) is not None:
+                        continue
+                    self._write(path, stamp, *process_doc_page(path))
+                except Exception as e:
+                    if callback is not None:
+                        callback(path, e)
+                    continue
+                processed += 1
+                if callback is not None:
+                    callback(path, None)
+        return processed
+
+    def stats(self):
+        """
+        Return a dictionary with the number of pages found in memory
+        (``hits``), on disk (``disk_hits``) and processed (``misses``), and
+        the number of pages in memory (``pages``).
+        """
+        return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'pages': len(self._pages)}
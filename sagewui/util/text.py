@@ -31,16 +31,6 @@ extract_cells_re0 = re.compile(  # No \n needed after open delimiter. Only comp
     r'(?:\n+///\n+(.*?))?\n*'
     r'(?<=\n)\}\}\}(?=\n|$)',
     flags=re.DOTALL)
-extract_cells_re = re.compile(  # \n needed after open delimiter
-    r'\s*(.*?)\s*'
-    r'(?:(?<=\n)|^)\{\{\{'
-    r'(?:([^\n]*)\|)?\n+'
-    r'(.*?)\n*'
-    r'(?:(?<=\n)///\n+(.*?))?\n*'
-    r'(?<=\n)\}\}\}(?:\n+|$)',
-    flags=re.DOTALL)
-split_last_text_re = re.compile(r'(.*\n+}}})(?:\n+|$)\s*(.*)\s*',
-                                flags=re.DOTALL)
 meta_re = re.compile(r'\s*(.*?)\s*=\s*(.*?)\s*(?:,|$)')
 search_keywords_re = re.compile(
     r'(?: +|^)'
@@ -323,19 +313,84 @@ def after_first_word(s):
     return s[i.start() + 1:]
 
 
-def extract_cells(text):
-    split_last = split_last_text_re.findall(text)
-    text, last_text_cell = split_last[0] if split_last else ('', text.strip())
-    cells = []
-    for txt, meta, inp, outp in extract_cells_re.findall(text):
-        if txt:
-            cells.append(('plain', txt))
+def _find_cell_end(text, start):
+    # Index of the newline before the first "}}}" line from start, or -1.
+    i = text.find('\n}}}', start)
+    while i != -1 and i + 4 < len(text) and text[i + 4] != '\n':
+        i = text.find('\n}}}', i + 1)
+    return i
+
+
+def iter_cells(text):
+    r"""
+    Return an iterator over the cells of the worksheet body ``text``, a
+    sequence of text and ``{{{id=...|\ninput\n///\noutput\n}}}`` compute
+    cells, found as ``text`` is read.
+
+    OUTPUT: ``('plain', text)`` for text cells and ``('compute', (id,
+    input, output))`` for compute cells (``id`` is None if there is
+    none).
+
+    EXAMPLES::
+
+        sage: list(iter_cells('<p>a</p>\n{{{id=3|\n2+3\n///\n5\n}}}'))
+        [('plain', '<p>a</p>'), ('compute', (3, '2+3', '5'))]
+    """
+    n = len(text)
+    end = 0  # of the last cell
+    i = 0
+    while True:
+        i = text.find('{{{', i)
+        if i == -1:
+            break
+        if i > 0 and text[i - 1] != '\n':
+            i += 3
+            continue
+        # The opening line is '{{{' or '{{{metadata|'.
+        j = text.find('\n', i + 3)
+        if j == -1:
+            break
+        meta = text[i + 3:j]
+        if meta.endswith('|'):
+            meta = meta[:-1]
+        elif meta:
+            i = j
+            continue
+        start = j
+        while start < n and text[start] == '\n':
+            start += 1
+        close = _find_cell_end(text, start - 1)
+        if close == -1:
+            break
+
+        plain = text[end:i].strip()
+        if plain:
+            yield 'plain', plain
+        sep = text.find('\n///\n', start - 1, close + 1)
+        if sep == -1:
+            inp, outp = text[start:close], ''
+        else:
+            inp = text[start:sep]
+            out_start = sep + 4
+            while out_start < close and text[out_start] == '\n':
+                out_start += 1
+            outp = text[out_start:close]
         meta = dict(meta_re.findall(meta))
         idx = None if 'id' not in meta else int(meta['id'])
-        cells.append(('compute', (idx, inp, outp)))
-    if last_text_cell:
-        cells.append(('plain', last_text_cell))
-    return cells
+        yield 'compute', (idx, inp.rstrip('\n'), outp.rstrip('\n'))
+        end = i = close + 4
+
+    plain = text[end:].strip()
+    if plain:
+        yield 'plain', plain
+
+
+def extract_cells(text):
+    """
+    Return the list of the cells of the worksheet body ``text`` (see
+    :func:`iter_cells`).
+    """
+    return list(iter_cells(text))
 
 
 def extract_text(text, start='', default=gettext('Untitled')):
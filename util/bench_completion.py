@@ -0,0 +1,108 @@
+"""
+Benchmark of the latency of tab completion: the scan of the namespace and
+of ``dir`` that support.completions used to do against the cached indexes
+of sagewui/sage_server/sage_code/completion.py, on a namespace and a class
+as large as those of Sage.
+
+Usage:
+
+    python util/bench_completion.py [--names 5000] [--attributes 3000]
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import sys
+import time
+
+SAGE_CODE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, 'sagewui', 'sage_server', 'sage_code')
+sys.path.insert(0, SAGE_CODE)
+
+from completion import CompletionEngine  # noqa
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+PREFIXES = ('', 'n', 'name_1', 'name_12', 'nomatch')
+
+
+def scan_global(s, globs, builtins):
+    # The completion of global names before the index.
+    n = len(s)
+    v = [x for x in globs.keys() if x[:n] == s] + \
+        [x for x in builtins.keys() if x[:n] == s]
+    return sorted(set(v))
+
+
+def scan_attribute(O, method):
+    # The completion of attributes before the index.
+    n = len(method)
+    D = dir(O)
+    try:
+        D += O.trait_names()
+    except (AttributeError, TypeError):
+        pass
+    if method == '':
+        v = [x for x in D if x and x[0] != '_']
+    else:
+        v = [x for x in D if x[:n] == method]
+    return sorted(set(v))
+
+
+def timeit(f, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        f()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench(names, attributes, repeat):
+    globs = dict(('name_{}'.format(i), i) for i in range(names))
+    builtin_names = vars(builtins)
+    Big = type(str('Big'), (object,), dict(
+        ('name_{}'.format(i), i) for i in range(attributes)))
+    obj = Big()
+
+    engine = CompletionEngine()
+    results = []
+    for prefix in PREFIXES:
+        results.append((
+            'global {!r}'.format(prefix),
+            timeit(lambda: scan_global(prefix, globs, builtin_names), repeat),
+            timeit(lambda: engine.complete_global(
+                prefix, globs, builtin_names), repeat)))
+    for prefix in PREFIXES:
+        results.append((
+            'attribute {!r}'.format(prefix),
+            timeit(lambda: scan_attribute(obj, prefix), repeat),
+            timeit(lambda: engine.complete_attribute(obj, prefix), repeat)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--names', type=int, default=5000,
+                        help='global names of the namespace')
+    parser.add_argument('--attributes', type=int, default=3000,
+                        help='attributes of the class')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='completions of each prefix (the best is shown)')
+    args = parser.parse_args()
+
+    results = bench(args.names, args.attributes, args.repeat)
+    print('{:>22} {:>12} {:>12}'.format('completion', 'scan', 'index'))
+    for label, scan, index in results:
+        print('{:>22} {:>9.3f} ms {:>9.3f} ms'.format(
+            label, scan * 1000, index * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark of the latency of large cells: the time from
+SageServerExpect.execute until the output is complete, with the code sent
+inline through the terminal and passed in a file.
+
+Usage:
+
+    python util/bench_execute.py [--python 'sage --python'] [--sage_code DIR]
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sagewui.sage_server.interfaces import SageServerExpect  # noqa
+
+SIZES = (('10 KB', 10 * 1024), ('1 MB', 1024 ** 2), ('10 MB', 10 * 1024 ** 2))
+METHODS = (('inline', None), ('file', SageServerExpect.max_inline_code))
+
+
+def wait(S, timeout):
+    start = time.time()
+    while time.time() - start < timeout:
+        status = S.output_status()
+        if status.done:
+            return time.time() - start, status.output
+    return None, ''
+
+
+def bench(python, sage_code, timeout, repeat):
+    results = {}
+    for method, max_inline_code in METHODS:
+        S = SageServerExpect(python=python, init_code='', sage_code=sage_code)
+        S.max_inline_code = max_inline_code
+        if wait(S, timeout)[0] is None:
+            sys.exit('The worksheet process did not start')
+        for label, size in SIZES:
+            code = 'x = "{}"\nprint(len(x))\n'.format('a' * size)
+            times = []
+            for i in range(repeat):
+                start = time.time()
+                S.execute(code, mode='python')
+                elapsed, output = wait(S, timeout)
+                if elapsed is None or str(size) not in output:
+                    times = None
+                    S.quit()
+                    S = SageServerExpect(python=python, init_code='',
+                                         sage_code=sage_code)
+                    S.max_inline_code = max_inline_code
+                    wait(S, timeout)
+                    break
+                times.append(time.time() - start)
+            results[method, label] = times and min(times)
+        S.quit()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--python', default='sage --python',
+                        help='command that runs the worksheet process python')
+    parser.add_argument('--sage_code', default=None,
+                        help='directory with the worksheet process code')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='seconds to wait for each execution')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='executions of each cell (the best is shown)')
+    args = parser.parse_args()
+
+    results = bench(args.python, args.sage_code, args.timeout, args.repeat)
+    print('{:>8} {:>12} {:>12}'.format('size', *[m for m, _ in METHODS]))
+    for label, size in SIZES:
+        print('{:>8} {:>12} {:>12}'.format(label, *[
+            'failed' if results[m, label] is None
+            else '{:.3f} s'.format(results[m, label]) for m, _ in METHODS]))
+
+
+if __name__ == '__main__':
+    main()
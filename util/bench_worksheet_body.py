@@ -0,0 +1,94 @@
+"""
+Benchmark of the serialization of the body of a worksheet: the edit text
+of every cell made again on each save against the edit texts kept by the
+cells (see Worksheet.iter_body), on a worksheet of 2000 cells with output.
+
+Usage:
+
+    python util/bench_worksheet_body.py [--cells 2000] [--repeat 10]
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def worksheet_text(cells):
+    return '\n\n'.join(
+        '<p>Section {0}</p>\n\n{{{{{{id={0}|\nx = {0}\nfor i in range(10):'
+        '\n    print(x * i)\n///\n{1}\n}}}}}}'.format(
+            i, '\n'.join(str(i * j) for j in range(10)))
+        for i in range(cells))
+
+
+def timeit(f, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        f()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cells', type=int, default=2000,
+                        help='compute cells of the worksheet')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='serializations of each kind (the best is '
+                             'shown)')
+    args = parser.parse_args()
+
+    # sagewui.config asks sage for its paths.
+    from sagewui.gui.cell import ComputeCell
+    from sagewui.gui.worksheet import Worksheet
+
+    directory = tempfile.mkdtemp()
+    try:
+        W = Worksheet('admin', 0, name='bench',
+                      notebook_worksheet_directory=directory)
+        W.edit_save(worksheet_text(args.cells))
+        filename = os.path.join(directory, 'worksheet.html')
+
+        def uncached():
+            # The body as it was made before the edit texts were kept.
+            return '\n\n'.join(t for t in (
+                (C.format_text(plain=False) if isinstance(C, ComputeCell)
+                 else C.edit_text).strip() for C in W.cells) if t)
+
+        def one_changed():
+            C = W.cells[1]
+            C.input = C.input + ' '
+            return W.body
+
+        def streamed():
+            with open(filename, 'wb') as f:
+                for t in W.iter_body():
+                    f.write(t.encode('utf-8'))
+
+        assert uncached() == W.body
+        results = (
+            ('every cell', timeit(uncached, args.repeat)),
+            ('kept', timeit(lambda: W.body, args.repeat)),
+            ('one cell changed', timeit(one_changed, args.repeat)),
+            ('written', timeit(streamed, args.repeat)),
+        )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print('{} cells, {} characters'.format(len(W.cells), len(W.body)))
+    for label, elapsed in results:
+        print('{:>18} {:>9.3f} ms'.format(label, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
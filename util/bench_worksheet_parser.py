@@ -0,0 +1,127 @@
+"""
+Benchmark of the parser of worksheet bodies: the regular expressions that
+util.text.extract_cells used to run over the whole body against the
+tokenizer of util.text.iter_cells, on bodies of several megabytes.  The
+time to read all the cells and the first one, and the peak memory, are
+shown.
+
+Usage:
+
+    python util/bench_worksheet_parser.py [--megabytes 2 8 32] [--repeat 3]
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import re
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+extract_cells_re = re.compile(
+    r'\s*(.*?)\s*'
+    r'(?:(?<=\n)|^)\{\{\{'
+    r'(?:([^\n]*)\|)?\n+'
+    r'(.*?)\n*'
+    r'(?:(?<=\n)///\n+(.*?))?\n*'
+    r'(?<=\n)\}\}\}(?:\n+|$)',
+    flags=re.DOTALL)
+split_last_text_re = re.compile(r'(.*\n+}}})(?:\n+|$)\s*(.*)\s*',
+                                flags=re.DOTALL)
+
+
+def regex_cells(text, meta_re):
+    # The parser before the tokenizer.
+    split_last = split_last_text_re.findall(text)
+    text, last_text_cell = split_last[0] if split_last else ('', text.strip())
+    cells = []
+    for txt, meta, inp, outp in extract_cells_re.findall(text):
+        if txt:
+            cells.append(('plain', txt))
+        meta = dict(meta_re.findall(meta))
+        idx = None if 'id' not in meta else int(meta['id'])
+        cells.append(('compute', (idx, inp, outp)))
+    if last_text_cell:
+        cells.append(('plain', last_text_cell))
+    return cells
+
+
+def worksheet_text(megabytes):
+    size = megabytes * 1024 ** 2
+    pieces = []
+    length = 0
+    i = 0
+    while length < size:
+        piece = ('<p>Section {0}</p>\n\n{{{{{{id={0}|\nx = {0}\n'
+                 'for i in range(100):\n    print(x * i)\n///\n{1}\n}}}}}}'
+                 ).format(i, '\n'.join(str(i * j) for j in range(100)))
+        pieces.append(piece)
+        length += len(piece) + 2
+        i += 1
+    return '\n\n'.join(pieces)
+
+
+def measure(f, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        f()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    if tracemalloc is None:
+        return best, float('nan')
+    tracemalloc.start()
+    f()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--megabytes', type=int, nargs='+',
+                        default=[2, 8, 32], help='sizes of the bodies')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='parses of each kind (the best is shown)')
+    args = parser.parse_args()
+
+    # sagewui.config asks sage for its paths.
+    from sagewui.util.text import iter_cells
+    from sagewui.util.text import meta_re
+
+    def consume(cells):
+        # The cells are read one at a time, as Worksheet.body_to_cells
+        # does, and not kept.
+        n = 0
+        for cell in cells:
+            n += 1
+        return n
+
+    print('{:>6} {:>7} {:>22} {:>22} {:>10}'.format(
+        'MB', 'cells', 'regex', 'tokenizer', 'first'))
+    for megabytes in args.megabytes:
+        text = worksheet_text(megabytes)
+        cells = regex_cells(text, meta_re)
+        assert cells == list(iter_cells(text))
+        regex = measure(lambda: consume(regex_cells(text, meta_re)),
+                        args.repeat)
+        tokenizer = measure(lambda: consume(iter_cells(text)), args.repeat)
+        first = measure(lambda: next(iter_cells(text)), args.repeat)[0]
+        print('{:>6} {:>7} {:>9.1f} ms {:>6.1f} MB {:>9.1f} ms {:>6.1f} MB '
+              '{:>7.3f} ms'.format(
+                  megabytes, len(cells),
+                  regex[0] * 1000, regex[1] / 1024.0 ** 2,
+                  tokenizer[0] * 1000, tokenizer[1] / 1024.0 ** 2,
+                  first * 1000))
+
+
+if __name__ == '__main__':
+    main()
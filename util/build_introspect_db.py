@@ -0,0 +1,102 @@
+"""
+Build the introspection database of the Sage library: the docstrings and
+source code of the objects of the worksheet process namespace (and of
+their attributes with ``--depth 2``), so that worksheet processes don't
+compute them live (see sagewui/sage_server/sage_code/introspect_db.py).
+
+It must be run with the python of Sage:
+
+    sage --python util/build_introspect_db.py [--output FILE] [--depth 2]
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import sys
+
+SAGE_CODE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, 'sagewui', 'sage_server', 'sage_code')
+sys.path.insert(0, SAGE_CODE)
+
+
+def names(globs, depth):
+    """
+    Yield the names of the public objects of ``globs`` and, if ``depth``
+    is 2, of their public attributes.
+    """
+    for name in sorted(globs):
+        if name.startswith('_'):
+            continue
+        yield name
+        if depth < 2:
+            continue
+        try:
+            attributes = dir(globs[name])
+        except Exception:
+            continue
+        for attribute in attributes:
+            if not attribute.startswith('_'):
+                yield '{}.{}'.format(name, attribute)
+
+
+def entries(globs, depth, verbose=False):
+    from introspect_db import fingerprint
+    import support
+
+    for name in names(globs, depth):
+        try:
+            obj = eval(name, globs)
+            value = {
+                'fingerprint': fingerprint(obj),
+                'doc': support.docstring(name, globs),
+                'src': support.source_code(name, globs),
+                }
+        except Exception as e:
+            if verbose:
+                print('{}: {}'.format(name, e), file=sys.stderr)
+            continue
+        if verbose:
+            print(name, file=sys.stderr)
+        yield name, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', default=None,
+                        help='database file (default: the one worksheet '
+                             'processes use)')
+    parser.add_argument('--depth', type=int, default=1, choices=(1, 2),
+                        help='1 for the global objects, 2 for their '
+                             'attributes too')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print the objects as they are processed')
+    args = parser.parse_args()
+
+    from sage.version import version
+    from introspect_db import default_filename
+    from introspect_db import write_db
+    import support
+
+    output = args.output or default_filename(version)
+    if output is None:
+        sys.exit('Give --output, or set DOT_SAGE or SAGENB_INTROSPECT_DB')
+    directory = os.path.dirname(os.path.abspath(output))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # The same namespace as worksheet processes
+    globs = {}
+    exec('from sage.all import *', globs)
+    support.init(None, globs)
+    # Don't look up the database being built.
+    os.environ['SAGENB_INTROSPECT_DB'] = ''
+
+    found = list(entries(globs, args.depth, args.verbose))
+    write_db(output, found, version)
+    print('{} objects written to {}'.format(len(found), output))
+
+
+if __name__ == '__main__':
+    main()
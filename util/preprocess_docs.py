@@ -0,0 +1,59 @@
+"""
+Process the Sage documentation in advance for the live documentation:
+every HTML page is converted to worksheet text and stored in the disk
+cache of the notebook server (see sagewui/util/doc_cache.py), so that
+opening a page is a cache lookup.  Pages already processed and not
+modified since are skipped, so it can be run again after updating Sage.
+
+Usage:
+
+    python util/preprocess_docs.py [--doc DIR] [--cache DIR] [--verbose]
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--doc', default=None,
+                        help='documentation directory (default: the one '
+                             'served by the notebook)')
+    parser.add_argument('--cache', default=None,
+                        help='cache directory (default: the one used by '
+                             'the notebook)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print the pages as they are processed')
+    args = parser.parse_args()
+
+    # sagewui.config asks sage for its paths.
+    from sagewui import config
+    from sagewui.util.doc_cache import DocPageCache
+
+    doc = args.doc or config.DOC_PATH
+    if not os.path.isdir(doc):
+        sys.exit('{} is not a directory'.format(doc))
+    cache = DocPageCache(args.cache or config.DOC_CACHE_PATH)
+
+    failed = []
+
+    def report(path, error):
+        if error is not None:
+            failed.append(path)
+            print('{}: {}'.format(path, error), file=sys.stderr)
+        elif args.verbose:
+            print(path)
+
+    processed = cache.preprocess(doc, callback=report)
+    print('{} pages processed into {} ({} failed)'.format(
+        processed, cache.directory, len(failed)))
+
+
+if __name__ == '__main__':
+    main()